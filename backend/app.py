@@ -1,21 +1,44 @@
 # import libraries
-import json
 import logging
-import time
 from datetime import datetime as dt
 from pathlib import Path
 
-import numpy as np
-import pandas as pd
 import polars as pl
 import yaml
 from box import Box
-from database import get_afr, get_aus, get_hotcopper, get_marketindex
-from flask import Flask, jsonify, request
+from cache import cache_stats, get_or_load, init_cache
+from database import (
+    fetch_concurrently,
+    get_hotcopper,
+    get_marketindex,
+    get_news_tables,
+)
+from db_pool import pool_stats
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
-from forecast import do_forecast
+from forecast_batch import forecast_batch, parse_tickers
+from forecast_jobs import (
+    QueueFull,
+    cancel_job,
+    get_job,
+    init_jobs,
+    job_url,
+    parse_forecast_args,
+    submit_job,
+    wait_for_job,
+)
+from instrumentation import (
+    CONTENT_TYPE,
+    clear_metrics,
+    init_metrics,
+    metrics_text,
+    stage,
+)
+from paging import parse_announcement_args, query_announcements
+from scheduler import register_job, scheduler_status, start_scheduler
+from search import parse_search_args, search, search_stats
+from serialise import encode_json, frame_response
 from utils.logging import set_up_logging
-from utils.util import get_mem
 
 cfg = Box(yaml.safe_load(open("config_db.yml")))
 
@@ -40,23 +63,15 @@ logger.info("starting the app")
 app = Flask(__name__)
 
 CORS(app, resources={r"/*": {"origins": "*"}})
+init_cache(app)
+init_jobs(app)
+init_metrics(app)
 
-ticker = None
 
-
-# load announcements data
-def load_announcements_data() -> dict:
-    logger.info(f"Loading announcement data...")
-    start_time = time.time()
-
-    # call get_hotcopper
-    df_hotcopper = get_hotcopper()
-
-    # call get_marketindex
-    df_market_idx = get_marketindex()
-
-    # combine into a big df
-    df_table = (
+# function to join the announcements onto the market index
+@stage("join", "announcements")
+def join_announcements(df_hotcopper: pl.DataFrame, df_market_idx: pl.DataFrame):
+    return (
         df_market_idx.join(df_hotcopper, on="ticker", how="left")
         .select(
             "ticker",
@@ -76,95 +91,235 @@ def load_announcements_data() -> dict:
         )
     )
 
-    df_table_dict = df_table.to_pandas().to_dict(
-        "records"
-    )  # convert the pandas df into a list of dict
-
-    end_time = time.time()
 
-    if len(df_table_dict) != 0:
-        logger.info(
-            f"Loaded announcement data... time taken: {end_time - start_time} seconds, memory being used: {get_mem()}"
+# build the joined announcements table, this is what gets cached
+def build_announcements_frame() -> pl.DataFrame:
+    logger.info(f"Loading announcement data...")
+    with stage("build", "announcements") as timer:
+        # call get_hotcopper and get_marketindex concurrently
+        results, missing = fetch_concurrently(
+            {"announcements": get_hotcopper, "market_index": get_marketindex}
         )
+        if missing:
+            raise RuntimeError(f"could not load {missing} for the announcements table")
+
+        # combine into a big df
+        df_table = join_announcements(results["announcements"], results["market_index"])
+
+    if df_table.height != 0:
+        logger.info(f"Loaded announcement data... time taken: {timer.seconds} seconds")
     else:
-        logger.warning(f"No announcement data, size = {len(df_table_dict)}")
+        logger.warning(f"No announcement data, size = {df_table.height}")
 
-    return df_table_dict
+    return df_table
 
 
-# load news data
-def load_news_data() -> dict:
-    logger.debug(f"Loading news data...")
-    start_time = time.time()
+# load announcements data, filtered, sorted and paged per the request's query string
+def load_announcements_data(opts: dict) -> dict:
+    df_table = get_or_load(
+        "announcements_frame",
+        build_announcements_frame,
+        cfg.cache.ttl.announcements,
+    )
+    return query_announcements(df_table, opts)
 
-    # call get_afr
-    df_afr_homepage, df_afr_street_talk = get_afr()
 
-    # call get_aus
-    df_aus_homepage, df_aus_dataroom, df_aus_tradingday = get_aus()
+# function to put the news tables into the payload the frontend reads, a table that could
+# not be loaded is empty and listed under "missing"
+@stage("join", "news")
+def news_payload(dfs: dict, missing: list) -> dict:
+    empty = pl.DataFrame()
+    df_afr_homepage = dfs.get("afr_homepage", empty)
+    df_afr_street_talk = dfs.get("afr_street_talk", empty)
+    df_aus_homepage = dfs.get("aus_homepage", empty)
 
     # combine the Aus section dfs
-    df_aus_sections = pl.concat([df_aus_dataroom, df_aus_tradingday])
+    df_aus_sections = pl.concat(
+        [dfs[t] for t in ["aus_dataroom", "aus_tradingday"] if t in dfs] or [empty]
+    )
 
-    # create a dictionary to store all dfs in JSON
+    # create a dictionary of all dfs, serialised straight from polars by frame_response
     dfs_dict = {}
-    jsdf_afr_homepage = df_afr_homepage.to_pandas().to_json(orient="records")
-    jsdf_afr_street_talk = df_afr_street_talk.to_pandas().to_json(orient="records")
-    jsdf_aus_homepage = df_aus_homepage.to_pandas().to_json(orient="records")
-    jsdf_aus_sections = df_aus_sections.to_pandas().to_json(orient="records")
+    dfs_dict["afr_homepage"] = df_afr_homepage
+    dfs_dict["afr_street_talk"] = df_afr_street_talk
+    dfs_dict["aus_homepage"] = df_aus_homepage
+    dfs_dict["aus_sections"] = df_aus_sections
+    dfs_dict["missing"] = missing
+    return dfs_dict
 
-    dfs_dict["afr_homepage"] = json.loads(jsdf_afr_homepage)
-    dfs_dict["afr_street_talk"] = json.loads(jsdf_afr_street_talk)
-    dfs_dict["aus_homepage"] = json.loads(jsdf_aus_homepage)
-    dfs_dict["aus_sections"] = json.loads(jsdf_aus_sections)
 
-    end_time = time.time()
+# load news data
+def load_news_data() -> dict:
+    logger.debug(f"Loading news data...")
+    with stage("build", "news") as timer:
+        # get the afr and The Australian tables concurrently
+        dfs, missing = get_news_tables()
+        dfs_dict = news_payload(dfs, missing)
 
     if len(dfs_dict) != 0:
-        logger.info(
-            f"Loaded news data... time taken: {end_time - start_time} seconds, memory being used: {get_mem()}"
-        )
+        logger.info(f"Loaded news data... time taken: {timer.seconds} seconds")
     else:
         logger.warning(f"No news data, size = {len(dfs_dict)}")
 
     return dfs_dict
 
 
+# pre-build the payloads in the background so requests only read the cache
+register_job(
+    "announcements_frame", build_announcements_frame, cfg.cache.ttl.announcements
+)
+register_job("news_frames", load_news_data, cfg.cache.ttl.news)
+start_scheduler(app)
+
+
 ### Route stuff ----
 # display announcements table
 @app.route("/api/contents", methods=["GET"])
 async def announcements_data():
-    return jsonify(items=load_announcements_data(), status=200)
+    try:
+        opts = parse_announcement_args(request.args)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    return frame_response({**load_announcements_data(opts), "status": 200})
 
 
 # display news tables
 @app.route("/api/contents/news", methods=["GET"])
 async def news_data():
-    return jsonify(items=load_news_data(), status=200)
+    items = get_or_load("news_frames", load_news_data, cfg.cache.ttl.news)
+    return frame_response({"items": items, "status": 200})
+
 
+# the change feed is only served by the asgi app (asgi.py), here the stream is empty: a 204
+# tells EventSource not to reconnect
+@app.route("/api/contents/stream", methods=["GET"])
+async def content_stream():
+    return "", 204
 
-# get stock ticker
-@app.route("/api/contents/forecast", methods=["POST"])
-async def process_ticker():
-    global ticker
 
+# full-text search of the announcements and news, e.g.
+# GET /api/search?q=capital rais&ticker=BHP&from=2023-01-01&to=2023-06-30&source=announcements
+@app.route("/api/search", methods=["GET"])
+async def search_contents():
     try:
-        ticker = request.json["ticker"]
-        logger.info(f"ticker processed successfully, ticker is {ticker}.")
-        return "Ticker code processed successfully"
-    except KeyError:
-        return {"error": "Ticker code not provided"}, 400
+        opts = parse_search_args(request.args)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    return frame_response({**search(opts), "status": 200})
+
+
+# database connection pool metrics
+@app.route("/api/status/pool", methods=["GET"])
+async def pool_status():
+    return jsonify(items=pool_stats(), status=200)
+
+
+# response cache counters
+@app.route("/api/status/cache", methods=["GET"])
+async def cache_status():
+    return jsonify(items=cache_stats(), status=200)
+
+
+# histograms of the stages and requests of every process, memory of each, for prometheus
+@app.route("/metrics", methods=["GET"])
+async def metrics():
+    return Response(metrics_text(), content_type=CONTENT_TYPE)
+
+
+# size of this worker's search index and when it was last refreshed
+@app.route("/api/status/search", methods=["GET"])
+async def search_status():
+    return jsonify(items=search_stats(), status=200)
+
 
+# when the background scheduler last rebuilt each payload
+@app.route("/api/status/scheduler", methods=["GET"])
+async def scheduler_state():
+    return jsonify(items=scheduler_status(), status=200)
 
-@app.route("/api/contents/forecast", methods=["GET"])
+
+# forecast for a ticker, e.g. GET /api/contents/forecast?ticker=BHP.AX&horizon=4 (or POST the
+# same as json). simultaneous requests for the same ticker and horizon, from any worker, share
+# one forecast job; one that takes longer than sync_wait_timeout is handed back with a 202 and
+# can be polled at its status_url. the wait holds a gunicorn thread, so it is kept short
+@app.route("/api/contents/forecast", methods=["GET", "POST"])
 async def run_forecast():
-    global ticker
+    args = request.get_json(silent=True) if request.method == "POST" else request.args
+    try:
+        ticker, horizon = parse_forecast_args(args or {})
+        job, _ = submit_job(ticker, horizon)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    except QueueFull as e:
+        return {"error": str(e)}, 503
+
+    job = wait_for_job(job["id"], cfg.forecast.jobs.sync_wait_timeout)
+    if job is None:
+        return {"error": "forecast job expired"}, 500
+    # cancelled by a client, not a server error
+    if job["status"] == "cancelled":
+        return {"error": "forecast job was cancelled"}, 409
+    if job["status"] == "failed":
+        return {"error": job["error"] or job["status"]}, 500
+    if job["status"] != "done":
+        url = job_url(job["id"])
+        body = encode_json({"items": job, "status": 202, "status_url": url})
+        return Response(
+            body, status=202, mimetype="application/json", headers={"Location": url}
+        )
+    body = encode_json({"items": job["result"], "status": 200})
+    return Response(body, mimetype="application/json")
 
-    if ticker:
-        return jsonify(items=do_forecast(ticker), status=200)
-    else:
-        return "No ticker code provided!"
+
+# forecast a list of tickers in the forecast process pool, one json line per ticker is
+# streamed back as soon as that ticker is done
+@app.route("/api/forecast/batch", methods=["POST"])
+async def run_forecast_batch():
+    try:
+        tickers = parse_tickers(request.get_json(silent=True))
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    logger.info(f"forecasting a batch of {len(tickers)} tickers")
+    lines = (encode_json(result) + b"\n" for result in forecast_batch(tickers))
+    return Response(lines, mimetype="application/x-ndjson")
+
+
+# queue a forecast and return its job straight away, poll the job for the result
+@app.route("/api/forecast/jobs", methods=["POST"])
+async def submit_forecast_job():
+    try:
+        ticker, horizon = parse_forecast_args(request.get_json(silent=True) or {})
+        job, created = submit_job(ticker, horizon)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    except QueueFull as e:
+        return {"error": str(e)}, 503
+    status = 202 if created else 200
+    body = encode_json({"items": job, "status": status})
+    return Response(body, status=status, mimetype="application/json")
+
+
+# status of a forecast job, with the forecast once it is done
+@app.route("/api/forecast/jobs/<job_id>", methods=["GET"])
+async def forecast_job_status(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return {"error": f"no forecast job {job_id}"}, 404
+    body = encode_json({"items": job, "status": 200})
+    return Response(body, mimetype="application/json")
+
+
+# cancel a forecast job
+@app.route("/api/forecast/jobs/<job_id>", methods=["DELETE"])
+async def cancel_forecast_job(job_id):
+    job = cancel_job(job_id)
+    if job is None:
+        return {"error": f"no forecast job {job_id}"}, 404
+    body = encode_json({"items": job, "status": 200})
+    return Response(body, mimetype="application/json")
 
 
 if __name__ == "__main__":
+    clear_metrics()
     app.run(port=1234)
@@ -0,0 +1,332 @@
+# import libraries
+import logging
+from contextlib import asynccontextmanager
+
+import db_async
+import polars as pl
+import yaml
+from app import join_announcements, news_payload
+from box import Box
+from cache import cache_stats, get_or_load_async
+from change_feed import feed, parse_since, parse_topics
+from database import (
+    fetch_concurrently_async,
+    get_hotcopper_async,
+    get_marketindex_async,
+    get_news_tables_async,
+)
+from db_pool import pool_stats
+from forecast_batch import forecast_batch, parse_tickers
+from forecast_jobs import (
+    QueueFull,
+    cancel_job,
+    get_job,
+    job_url,
+    parse_forecast_args,
+    submit_job,
+    wait_for_job_async,
+)
+from instrumentation import (
+    CONTENT_TYPE,
+    MetricsMiddleware,
+    clear_metrics,
+    metrics_text,
+    stage,
+)
+from offload import run_blocking, shutdown_blocking_executor
+from paging import parse_announcement_args, query_announcements
+from scheduler import scheduler_status
+from search import parse_search_args, search, search_stats
+from serialise import encode_json, encode_payload
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+cfg = Box(yaml.safe_load(open("config_db.yml")))
+
+### set up logging and other params ----
+logger = logging.getLogger()
+
+"""
+    asgi serving mode: the same api as app.py, served by uvicorn
+
+        uvicorn asgi:app --host 0.0.0.0 --port 1234 --workers 4
+
+    routes are coroutines on one event loop per worker. the loaders read postgres through the
+    asyncpg pool (db_async), and the blocking work (cache reads and writes, polars, serialising
+    payloads) runs on the offload executor, so a worker keeps serving announcements and news
+    while forecasts wait on the forecast process pool. importing app sets up logging, the
+    payload and job caches and the scheduler thread, which keeps prebuilding the payloads with
+    the sync loaders
+"""
+
+
+async def build_announcements_frame_async() -> pl.DataFrame:
+    with stage("build", "announcements") as timer:
+        results, missing = await fetch_concurrently_async(
+            {
+                "announcements": get_hotcopper_async,
+                "market_index": get_marketindex_async,
+            }
+        )
+        if missing:
+            raise RuntimeError(f"could not load {missing} for the announcements table")
+
+        df_table = await run_blocking(
+            join_announcements, results["announcements"], results["market_index"]
+        )
+    logger.info(f"Loaded announcement data... time taken: {timer.seconds} seconds")
+    return df_table
+
+
+async def load_news_data_async() -> dict:
+    with stage("build", "news") as timer:
+        dfs, missing = await get_news_tables_async()
+        dfs_dict = await run_blocking(news_payload, dfs, missing)
+    logger.info(f"Loaded news data... time taken: {timer.seconds} seconds")
+    return dfs_dict
+
+
+def _error(message: str, status: int) -> JSONResponse:
+    return JSONResponse({"error": message}, status_code=status)
+
+
+def _json(value, status: int = 200, headers: dict = None) -> Response:
+    return Response(
+        encode_json(value),
+        status_code=status,
+        headers=headers,
+        media_type="application/json",
+    )
+
+
+# the request's json body, None if there is none or it isn't json
+async def _json_body(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+# function to respond with a payload whose frames are polars dfs, encoded on the executor
+async def frame_response(request, payload: dict) -> Response:
+    accept = parse_accept_header(request.headers.get("accept"), MIMEAccept)
+    body, mimetype, headers = await run_blocking(encode_payload, payload, accept)
+    return Response(body, media_type=mimetype, headers=headers)
+
+
+### Route stuff ----
+# display announcements table
+async def announcements_data(request):
+    try:
+        opts = parse_announcement_args(request.query_params)
+    except ValueError as e:
+        return _error(str(e), 400)
+    df_table = await get_or_load_async(
+        "announcements_frame",
+        build_announcements_frame_async,
+        cfg.cache.ttl.announcements,
+    )
+    payload = await run_blocking(query_announcements, df_table, opts)
+    return await frame_response(request, {**payload, "status": 200})
+
+
+# display news tables
+async def news_data(request):
+    items = await get_or_load_async(
+        "news_frames", load_news_data_async, cfg.cache.ttl.news
+    )
+    return await frame_response(request, {"items": items, "status": 200})
+
+
+# full-text search of the announcements and news, see app.search_contents. searches run on the
+# executor, the first one of a worker builds its index
+async def search_contents(request):
+    try:
+        opts = parse_search_args(request.query_params)
+    except ValueError as e:
+        return _error(str(e), 400)
+    payload = await run_blocking(search, opts)
+    return await frame_response(request, {**payload, "status": 200})
+
+
+# new and edited announcements and news rows as server-sent events, e.g.
+# GET /api/contents/stream?topics=announcements&since=2023-01-31T09:00. reconnecting clients send
+# Last-Event-ID and get what they missed
+async def content_stream(request):
+    params = request.query_params
+    try:
+        topics = parse_topics(params.get("topics"))
+        since = parse_since(
+            request.headers.get("last-event-id") or params.get("last_event_id"),
+            params.get("since"),
+            topics,
+        )
+    except ValueError as e:
+        return _error(str(e), 400)
+    return StreamingResponse(
+        feed.stream(topics, since),
+        media_type="text/event-stream",
+        # nginx would otherwise buffer the events
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# histograms of the stages and requests of every process, memory of each, for prometheus
+async def metrics(request):
+    body = await run_blocking(metrics_text)
+    return Response(body, headers={"Content-Type": CONTENT_TYPE})
+
+
+async def stream_status(request):
+    return JSONResponse({"items": feed.status(), "status": 200})
+
+
+# database connection pool metrics, the async pool under "async"
+async def pool_status(request):
+    items = {**pool_stats(), "async": db_async.async_pool_stats()}
+    return JSONResponse({"items": items, "status": 200})
+
+
+async def cache_status(request):
+    return JSONResponse({"items": cache_stats(), "status": 200})
+
+
+async def search_status(request):
+    return JSONResponse({"items": search_stats(), "status": 200})
+
+
+async def scheduler_state(request):
+    items = await run_blocking(scheduler_status)
+    return JSONResponse({"items": items, "status": 200})
+
+
+# forecast for a ticker, see app.run_forecast. the wait is on the job's future, the worker keeps
+# serving other requests meanwhile
+async def run_forecast(request):
+    if request.method == "POST":
+        args = await _json_body(request)
+    else:
+        args = request.query_params
+    try:
+        ticker, horizon = parse_forecast_args(args or {})
+        job, _ = await run_blocking(submit_job, ticker, horizon)
+    except ValueError as e:
+        return _error(str(e), 400)
+    except QueueFull as e:
+        return _error(str(e), 503)
+
+    job = await wait_for_job_async(job["id"], cfg.forecast.jobs.wait_timeout)
+    if job is None:
+        return _error("forecast job expired", 500)
+    if job["status"] == "cancelled":
+        return _error("forecast job was cancelled", 409)
+    if job["status"] == "failed":
+        return _error(job["error"] or job["status"], 500)
+    if job["status"] != "done":
+        url = job_url(job["id"])
+        return _json(
+            {"items": job, "status": 202, "status_url": url}, 202, {"Location": url}
+        )
+    return _json({"items": job["result"], "status": 200})
+
+
+# forecast a list of tickers, one json line per ticker. starlette iterates the blocking
+# generator on its threadpool
+async def run_forecast_batch(request):
+    try:
+        tickers = parse_tickers(await _json_body(request))
+    except ValueError as e:
+        return _error(str(e), 400)
+
+    logger.info(f"forecasting a batch of {len(tickers)} tickers")
+    lines = (encode_json(result) + b"\n" for result in forecast_batch(tickers))
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
+
+async def submit_forecast_job(request):
+    try:
+        ticker, horizon = parse_forecast_args(await _json_body(request) or {})
+        job, created = await run_blocking(submit_job, ticker, horizon)
+    except ValueError as e:
+        return _error(str(e), 400)
+    except QueueFull as e:
+        return _error(str(e), 503)
+    status = 202 if created else 200
+    return _json({"items": job, "status": status}, status)
+
+
+async def forecast_job_status(request):
+    job_id = request.path_params["job_id"]
+    job = await run_blocking(get_job, job_id)
+    if job is None:
+        return _error(f"no forecast job {job_id}", 404)
+    return _json({"items": job, "status": 200})
+
+
+async def cancel_forecast_job(request):
+    job_id = request.path_params["job_id"]
+    job = await run_blocking(cancel_job, job_id)
+    if job is None:
+        return _error(f"no forecast job {job_id}", 404)
+    return _json({"items": job, "status": 200})
+
+
+@asynccontextmanager
+async def lifespan(app):
+    try:
+        await db_async.open_pool()
+    except Exception:
+        logger.exception(
+            "could not open the async db pool, reading through the sync pool"
+        )
+    yield
+    await feed.stop()
+    await db_async.close_pool()
+    shutdown_blocking_executor()
+
+
+routes = [
+    Route("/api/contents", announcements_data, methods=["GET"]),
+    Route("/api/contents/news", news_data, methods=["GET"]),
+    Route("/api/contents/stream", content_stream, methods=["GET"]),
+    Route("/api/search", search_contents, methods=["GET"]),
+    Route("/metrics", metrics, methods=["GET"]),
+    Route("/api/status/stream", stream_status, methods=["GET"]),
+    Route("/api/status/pool", pool_status, methods=["GET"]),
+    Route("/api/status/cache", cache_status, methods=["GET"]),
+    Route("/api/status/search", search_status, methods=["GET"]),
+    Route("/api/status/scheduler", scheduler_state, methods=["GET"]),
+    Route("/api/contents/forecast", run_forecast, methods=["GET", "POST"]),
+    Route("/api/forecast/batch", run_forecast_batch, methods=["POST"]),
+    Route("/api/forecast/jobs", submit_forecast_job, methods=["POST"]),
+    Route("/api/forecast/jobs/{job_id}", forecast_job_status, methods=["GET"]),
+    Route("/api/forecast/jobs/{job_id}", cancel_forecast_job, methods=["DELETE"]),
+]
+
+app = Starlette(
+    routes=routes,
+    middleware=[
+        Middleware(MetricsMiddleware),
+        Middleware(
+            CORSMiddleware,
+            allow_origins=["*"],
+            allow_methods=["*"],
+            allow_headers=["*"],
+        ),
+    ],
+    lifespan=lifespan,
+)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    clear_metrics()
+    uvicorn.run(
+        "asgi:app", host=cfg.asgi.host, port=cfg.asgi.port, workers=cfg.asgi.workers
+    )
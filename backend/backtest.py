@@ -0,0 +1,441 @@
+# import libraries
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from datetime import datetime as dt
+from datetime import timedelta
+from functools import lru_cache
+from multiprocessing import get_context
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import yaml
+from box import Box
+from dateutil.relativedelta import relativedelta
+from sklearn.metrics import mean_absolute_error, mean_squared_error
+
+from forecast import XGB_PARAMS, create_dfs
+from forecast_engine import recursive_forecast
+from instrumentation import PeakMemSampler
+from price_store import PRICE_COLUMNS, YFinanceSource
+from trainer import default_nthread, to_dmatrix, train_booster
+from utils.util import get_mem
+
+cfg = Box(yaml.safe_load(open("config_db.yml")))
+
+### set up logging and other params ----
+logger = logging.getLogger()
+
+"""
+    walk-forward backtesting of the forecast model
+
+    for every ticker the fixture history is cut at a series of dates (the cutoffs, step trading
+    days apart, the latest horizon bars before the end of the fixture). at each cutoff the model
+    is fitted the way do_forecast fits it, on the 3 years of bars before the cutoff (create_dfs
+    features and split, trainer.train_booster), and forecasts the next horizon bars with
+    recursive_forecast, which are then compared with the bars the fixture actually has.
+
+    a configuration is a set of overrides of forecast.XGB_PARAMS. the features and DMatrices of a
+    window don't depend on the configuration, so each ticker runs in one process which builds
+    them once (or loads them from cache_dir) and fits every configuration on them
+
+        python backtest.py run --tickers BHP.AX CBA.AX --windows 12 --configs configs.yml
+        python backtest.py fixtures BHP.AX CBA.AX --years 10
+
+    fixtures/prices ships the daily bars of GOOG from 2004-08-19 to 2008-10-14 (yahoo finance,
+    as distributed with matplotlib's sample data), so a fresh checkout backtests offline and
+    reports stay comparable across runs. more tickers are added with the fixtures command
+"""
+
+N = 10  # lags, as in do_forecast
+LOOKBACK = relativedelta(years=3)
+
+
+### fixture prices ----
+# function to load the close series of a ticker from its fixture csv, as the date and close
+# columns do_forecast passes to create_dfs
+@lru_cache(maxsize=None)
+def load_closes(fixture_dir: str, ticker: str) -> pd.DataFrame:
+    path = Path(fixture_dir) / f"{ticker.upper()}.csv"
+    if not path.exists():
+        raise FileNotFoundError(f"no fixture prices for {ticker} in {fixture_dir}")
+    df = pd.read_csv(path, usecols=["Date", "Close"], parse_dates=["Date"])
+    df = df.rename(columns={"Date": "date", "Close": "close"})
+    return df.sort_values("date").reset_index(drop=True)
+
+
+def fixture_tickers(fixture_dir: str) -> list:
+    return sorted(p.stem for p in Path(fixture_dir).glob("*.csv"))
+
+
+# function to store the daily bars of tickers as fixture csvs, once, so backtests run offline
+def write_fixtures(fixture_dir: str, tickers: list, years: int):
+    fixture_dir = Path(fixture_dir)
+    fixture_dir.mkdir(parents=True, exist_ok=True)
+    end = date.today()
+    source = YFinanceSource()
+    for ticker in tickers:
+        df = source.fetch(ticker, end - relativedelta(years=years), end)
+        if df.empty:
+            logger.warning(f"no prices for {ticker}, skipped")
+            continue
+        df[PRICE_COLUMNS].to_csv(fixture_dir / f"{ticker.upper()}.csv", index=False)
+        logger.info(f"wrote {len(df)} bars of {ticker} to {fixture_dir}")
+
+
+# function to write random walk fixtures, for trying the backtester without downloading prices
+def write_synthetic_fixtures(fixture_dir: str, tickers: list, years: int):
+    fixture_dir = Path(fixture_dir)
+    fixture_dir.mkdir(parents=True, exist_ok=True)
+    dates = pd.bdate_range(date.today() - relativedelta(years=years), date.today())
+    for ticker in tickers:
+        seed = int(hashlib.md5(ticker.encode()).hexdigest()[:8], 16)
+        rng = np.random.default_rng(seed)
+        close = 50 * np.exp(np.cumsum(rng.normal(0, 0.01, len(dates))))
+        df = pd.DataFrame({"Date": dates, "Close": close})
+        for col in ["Open", "High", "Low"]:
+            df[col] = close
+        df["Volume"] = 1000
+        df["Dividends"] = 0.0
+        df["Stock Splits"] = 0.0
+        df[PRICE_COLUMNS].to_csv(fixture_dir / f"{ticker.upper()}.csv", index=False)
+
+
+### windows ----
+# function to pick the cutoffs of a close series: the latest leaves horizon bars to compare
+# with, the earlier ones are step bars apart. cutoffs without 3 years of history are skipped
+def walk_forward_cutoffs(dates: pd.Series, horizon: int, windows: int, step: int):
+    first = dates.iloc[0]
+    cutoffs = []
+    for k in range(windows):
+        pos = len(dates) - horizon - k * step
+        if pos <= 0:
+            break
+        cutoff = dates.iloc[pos]
+        if cutoff - timedelta(days=1) - LOOKBACK < first:
+            break
+        cutoffs.append(cutoff)
+    return cutoffs[::-1]
+
+
+def _cache_path(cache_dir: str, fixture_dir: str, ticker: str, cutoff) -> Path:
+    # the fixture's size and mtime are part of the key, so refreshed fixtures aren't served
+    # stale features
+    stat = (Path(fixture_dir) / f"{ticker.upper()}.csv").stat()
+    key = hashlib.md5(
+        f"{ticker}:{cutoff:%Y%m%d}:{N}:{stat.st_size}:{stat.st_mtime_ns}".encode()
+    ).hexdigest()
+    return Path(cache_dir) / f"{ticker.upper()}_{cutoff:%Y%m%d}_{key[:12]}.npz"
+
+
+# function to get the train and val features of a window, from cache_dir if they were built
+# before. the same as create_dfs on the 3 years of bars before the cutoff, as float32 arrays
+def window_features(fixture_dir: str, ticker: str, cutoff, cache_dir: str = None):
+    path = _cache_path(cache_dir, fixture_dir, ticker, cutoff) if cache_dir else None
+    if path is not None and path.exists():
+        with np.load(path) as npz:
+            return {k: npz[k] for k in npz.files}, True
+
+    df = load_closes(fixture_dir, ticker)
+    start = cutoff - timedelta(days=1) - LOOKBACK
+    window = df[(df["date"] >= start) & (df["date"] < cutoff)].reset_index(drop=True)
+    X_train, y_train, X_val, y_val, _, _ = create_dfs(window, N)
+    features = {
+        "X_train": X_train.to_numpy(dtype=np.float32),
+        "y_train": y_train.to_numpy(dtype=np.float32),
+        "X_val": X_val.to_numpy(dtype=np.float32),
+        "y_val": y_val.to_numpy(dtype=np.float32),
+        "columns": np.array(X_train.columns, dtype=str),
+        "history": window["close"].to_numpy(dtype=np.float32),
+    }
+    if path is not None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp.npz")
+        np.savez(tmp, **features)
+        os.replace(tmp, path)
+    return features, False
+
+
+# function to build the DMatrices of every window of a ticker, shared by all the configurations
+def _prepare_windows(fixture_dir, ticker, cutoffs, horizon, nthread, cache_dir):
+    df = load_closes(fixture_dir, ticker)
+    windows = []
+    for cutoff in cutoffs:
+        features, cached = window_features(fixture_dir, ticker, cutoff, cache_dir)
+        columns = [str(c) for c in features["columns"]]
+        X_train = pd.DataFrame(features["X_train"], columns=columns)
+        X_val = pd.DataFrame(features["X_val"], columns=columns)
+        actual = df.loc[df["date"] >= cutoff, "close"].to_numpy()[:horizon]
+        windows.append(
+            {
+                "cutoff": cutoff,
+                "cached": cached,
+                "train_rows": len(X_train),
+                "dtrain": to_dmatrix(X_train, pd.Series(features["y_train"]), nthread),
+                "dval": to_dmatrix(X_val, pd.Series(features["y_val"]), nthread),
+                "history": features["history"],
+                "actual": actual,
+            }
+        )
+    return windows
+
+
+# function to backtest every configuration on one ticker, runs in a pool process. returns the
+# rows of the windows and the memory use of every configuration
+def backtest_ticker(
+    fixture_dir: str,
+    ticker: str,
+    configs: dict,
+    horizon: int,
+    windows: int,
+    step: int,
+    nthread: int = None,
+    cache_dir: str = None,
+):
+    nthread = nthread or default_nthread()
+    df = load_closes(fixture_dir, ticker)
+    cutoffs = walk_forward_cutoffs(df["date"], horizon, windows, step)
+    if not cutoffs:
+        raise ValueError(f"{ticker} has too little history for a 3 year window")
+
+    start = time.perf_counter()
+    prepared = _prepare_windows(
+        fixture_dir, ticker, cutoffs, horizon, nthread, cache_dir
+    )
+    feature_secs = time.perf_counter() - start
+
+    rows, memory = [], []
+    for name, overrides in configs.items():
+        params = {**XGB_PARAMS, **(overrides or {})}
+        baseline = get_mem()
+        with PeakMemSampler() as sampler:
+            for window in prepared:
+                booster, fit = train_booster(
+                    params,
+                    window["dtrain"],
+                    window["dval"],
+                    params["n_estimators"],
+                    nthread,
+                )
+                start = time.perf_counter()
+                pred = recursive_forecast([booster], [window["history"]], N, horizon)[0]
+                predict_secs = time.perf_counter() - start
+
+                actual = window["actual"]
+                naive = np.full(horizon, window["history"][-1])
+                row = {
+                    "config": name,
+                    "ticker": ticker,
+                    "cutoff": window["cutoff"].date(),
+                    "train_rows": window["train_rows"],
+                    "features_cached": window["cached"],
+                    "rounds": fit["rounds"],
+                    "val_rmse": fit["val_rmse"],
+                    "fit_secs": fit["fit_secs"],
+                    "cpu_secs": fit["cpu_secs"],
+                    "predict_ms": predict_secs * 1e3,
+                    "mae": mean_absolute_error(actual, pred),
+                    "rmse": np.sqrt(mean_squared_error(actual, pred)),
+                    "mape": np.mean(np.abs((actual - pred) / actual)) * 100,
+                    "naive_mae": mean_absolute_error(actual, naive),
+                }
+                for h in range(horizon):
+                    row[f"actual_{h + 1}"] = actual[h]
+                    row[f"pred_{h + 1}"] = pred[h]
+                rows.append(row)
+        memory.append(
+            {
+                "config": name,
+                "ticker": ticker,
+                "feature_secs": feature_secs,
+                "peak_rss_mb": sampler.peak,
+                "rss_increase_mb": sampler.peak - baseline,
+            }
+        )
+    return rows, memory
+
+
+### report ----
+# function to summarise the windows per configuration. errors per step are over every window of
+# every ticker, times are per window
+def summarise(
+    windows: pd.DataFrame, memory: pd.DataFrame, horizon: int
+) -> pd.DataFrame:
+    actual_cols = [f"actual_{h + 1}" for h in range(horizon)]
+    pred_cols = [f"pred_{h + 1}" for h in range(horizon)]
+
+    summary = []
+    for name, df in windows.groupby("config", sort=False):
+        actual = df[actual_cols].to_numpy()
+        pred = df[pred_cols].to_numpy()
+        mae_h = mean_absolute_error(actual, pred, multioutput="raw_values")
+        mem = memory[memory["config"] == name]
+        row = {
+            "config": name,
+            "tickers": df["ticker"].nunique(),
+            "windows": len(df),
+            "mae": mae_h.mean(),
+            "rmse": np.sqrt(mean_squared_error(actual.ravel(), pred.ravel())),
+            "mape": df["mape"].mean(),
+            "naive_mae": df["naive_mae"].mean(),
+        }
+        for h in range(horizon):
+            row[f"mae_h{h + 1}"] = mae_h[h]
+        row.update(
+            {
+                "rounds": df["rounds"].mean(),
+                "fit_ms": df["fit_secs"].mean() * 1e3,
+                "fit_ms_p95": df["fit_secs"].quantile(0.95) * 1e3,
+                "cpu_ms": df["cpu_secs"].mean() * 1e3,
+                "predict_ms": df["predict_ms"].mean(),
+                "peak_rss_mb": mem["peak_rss_mb"].max(),
+                "rss_increase_mb": mem["rss_increase_mb"].max(),
+            }
+        )
+        summary.append(row)
+    return pd.DataFrame(summary)
+
+
+def write_report(out_dir: Path, windows, memory, summary, settings: dict):
+    out_dir.mkdir(parents=True, exist_ok=True)
+    windows.to_csv(out_dir / "windows.csv", index=False)
+    memory.to_csv(out_dir / "memory.csv", index=False)
+    summary.to_csv(out_dir / "summary.csv", index=False)
+    with open(out_dir / "report.json", "w") as f:
+        json.dump(
+            {"settings": settings, "summary": summary.to_dict("records")},
+            f,
+            indent=2,
+            default=str,
+        )
+
+
+### run ----
+# function to backtest configurations over tickers, a process per ticker at a time. returns
+# (windows, memory, summary) dfs; tickers that fail are logged and left out
+def run_backtest(
+    tickers: list,
+    configs: dict = None,
+    fixture_dir: str = None,
+    horizon: int = None,
+    windows: int = None,
+    step: int = None,
+    workers: int = None,
+    nthread: int = None,
+    cache_dir: str = None,
+):
+    configs = configs or cfg.backtest.configs.to_dict()
+    fixture_dir = str(fixture_dir or cfg.forecast.prices.fixture_dir)
+    horizon = horizon or cfg.backtest.horizon
+    windows = windows or cfg.backtest.windows
+    step = step or cfg.backtest.step
+    workers = max(1, min(workers or cfg.backtest.workers, len(tickers)))
+    nthread = nthread or cfg.backtest.nthread or max(1, default_nthread() // workers)
+    args = (configs, horizon, windows, step, nthread, cache_dir)
+
+    results = {}
+    if workers == 1:
+        for ticker in tickers:
+            try:
+                results[ticker] = backtest_ticker(fixture_dir, ticker, *args)
+            except Exception:
+                logger.exception(f"backtest of {ticker} failed")
+    else:
+        context = get_context(cfg.forecast.batch.start_method)
+        with ProcessPoolExecutor(workers, mp_context=context) as executor:
+            futures = {
+                ticker: executor.submit(backtest_ticker, fixture_dir, ticker, *args)
+                for ticker in tickers
+            }
+            for ticker, future in futures.items():
+                try:
+                    results[ticker] = future.result()
+                except Exception:
+                    logger.exception(f"backtest of {ticker} failed")
+
+    if not results:
+        raise RuntimeError("every ticker failed, see the log")
+    window_rows = [row for rows, _ in results.values() for row in rows]
+    memory_rows = [row for _, rows in results.values() for row in rows]
+    windows_df = pd.DataFrame(window_rows)
+    memory_df = pd.DataFrame(memory_rows)
+    return windows_df, memory_df, summarise(windows_df, memory_df, horizon)
+
+
+def _load_configs(path):
+    if path is None:
+        return cfg.backtest.configs.to_dict()
+    with open(path) as f:
+        return yaml.safe_load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="walk-forward forecast backtests")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="backtest on the fixture prices")
+    run.add_argument("--tickers", nargs="+", help="default every fixture")
+    run.add_argument("--fixture-dir", default=cfg.forecast.prices.fixture_dir)
+    run.add_argument("--configs", help="yaml of name: XGB_PARAMS overrides")
+    run.add_argument("--horizon", type=int, default=cfg.backtest.horizon)
+    run.add_argument("--windows", type=int, default=cfg.backtest.windows)
+    run.add_argument("--step", type=int, default=cfg.backtest.step)
+    run.add_argument("--workers", type=int, default=cfg.backtest.workers)
+    run.add_argument("--nthread", type=int, default=cfg.backtest.nthread)
+    run.add_argument("--cache-dir", default=cfg.backtest.cache_dir)
+    run.add_argument("--no-cache", action="store_true")
+    run.add_argument("--out", help=f"default {cfg.backtest.out_dir}/<timestamp>")
+
+    fixtures = commands.add_parser("fixtures", help="store fixture prices")
+    fixtures.add_argument("tickers", nargs="+")
+    fixtures.add_argument("--fixture-dir", default=cfg.forecast.prices.fixture_dir)
+    fixtures.add_argument("--years", type=int, default=10)
+    fixtures.add_argument(
+        "--synthetic", action="store_true", help="random walks instead of downloading"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "fixtures":
+        write = write_synthetic_fixtures if args.synthetic else write_fixtures
+        write(args.fixture_dir, args.tickers, args.years)
+        return
+
+    tickers = args.tickers or fixture_tickers(args.fixture_dir)
+    if not tickers:
+        parser.error(f"no fixture prices in {args.fixture_dir}")
+    configs = _load_configs(args.configs)
+    cache_dir = None if args.no_cache else args.cache_dir
+
+    start = time.perf_counter()
+    windows, memory, summary = run_backtest(
+        tickers,
+        configs,
+        args.fixture_dir,
+        args.horizon,
+        args.windows,
+        args.step,
+        args.workers,
+        args.nthread,
+        cache_dir,
+    )
+    elapsed = time.perf_counter() - start
+
+    out_dir = Path(
+        args.out or Path(cfg.backtest.out_dir) / dt.now().strftime("%Y%m%d_%H%M%S")
+    )
+    settings = {**vars(args), "configs": configs, "elapsed_secs": elapsed}
+    write_report(out_dir, windows, memory, summary, settings)
+
+    print(summary.round(4).to_string(index=False))
+    print(f"{len(windows)} windows in {elapsed:.1f} secs, report in {out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Throughput of forecast_batch against the number of forecast processes.
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_forecast_batch --tickers 16 --workers 1 2 4 8
+
+The benchmark runs offline in a scratch directory: prices come from synthetic fixture csvs
+and every run starts from an empty model registry, so each ticker is a full fit. Each
+process gets cores // workers xgboost threads unless --nthread is given. Process start up
+(spawning, importing the forecast module) is excluded from the timings.
+"""
+
+# import libraries
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import yaml
+from dateutil.relativedelta import relativedelta
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+
+# function to write 4 years of synthetic daily bars per ticker
+def write_fixtures(fixture_dir: Path, tickers: list):
+    fixture_dir.mkdir(parents=True)
+    dates = pd.bdate_range(date.today() - relativedelta(years=4), date.today())
+    for i, ticker in enumerate(tickers):
+        rng = np.random.default_rng(i)
+        close = 50 * np.exp(np.cumsum(rng.normal(0, 0.01, len(dates))))
+        pd.DataFrame(
+            {
+                "Date": dates,
+                "Open": close,
+                "High": close,
+                "Low": close,
+                "Close": close,
+                "Volume": 1000,
+                "Dividends": 0.0,
+                "Stock Splits": 0.0,
+            }
+        ).to_csv(fixture_dir / f"{ticker}.csv", index=False)
+
+
+# function to set up the scratch directory the app modules read their config from
+def set_up_workdir(workdir: Path, tickers: list):
+    config = yaml.safe_load(open(BACKEND_DIR / "config_db.yml"))
+    config["out"]["LOGS"] = str(workdir / "logs")
+    config["forecast"]["registry"]["dir"] = str(workdir / "models")
+    config["forecast"]["prices"]["dir"] = str(workdir / "prices")
+    config["forecast"]["prices"]["source"] = "fixture"
+    config["forecast"]["prices"]["fixture_dir"] = str(workdir / "fixtures")
+    yaml.safe_dump(config, open(workdir / "config_db.yml", "w"))
+    write_fixtures(workdir / "fixtures", tickers)
+
+
+def run(tickers: list, workers: int, nthread: int, workdir: Path) -> dict:
+    from forecast_batch import forecast_batch, make_executor
+
+    with make_executor(workers, nthread) as executor:
+        # wait for every process to start and run its initializer
+        for future in [executor.submit(time.sleep, 0.2) for _ in range(workers)]:
+            future.result()
+
+        shutil.rmtree(workdir / "models", ignore_errors=True)
+        start = time.perf_counter()
+        results = list(forecast_batch(tickers, executor))
+        elapsed = time.perf_counter() - start
+
+    errors = [r for r in results if r["status"] != "ok"]
+    return {
+        "workers": workers,
+        "nthread": nthread,
+        "tickers": len(tickers),
+        "errors": len(errors),
+        "wall_secs": elapsed,
+        "tickers_per_sec": len(tickers) / elapsed,
+        "mean_ticker_secs": np.mean([r["elapsed"] for r in results if "elapsed" in r]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="batch forecast scaling benchmark")
+    parser.add_argument("--tickers", type=int, default=16)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--nthread", type=int, help="xgboost threads per process")
+    args = parser.parse_args()
+
+    tickers = [f"BENCH{i:03d}" for i in range(args.tickers)]
+    workdir = Path(tempfile.mkdtemp(prefix="bench_forecast_batch_"))
+    try:
+        set_up_workdir(workdir, tickers)
+        os.chdir(workdir)
+        sys.path.insert(0, str(BACKEND_DIR))
+
+        # fill the price store once so every run reads the same local bars
+        from price_store import get_prices
+
+        end = date.today()
+        for ticker in tickers:
+            get_prices(ticker, end - relativedelta(years=3, days=1), end)
+
+        cores = os.cpu_count() or 1
+        results = [
+            run(tickers, w, args.nthread or max(1, cores // w), workdir)
+            for w in args.workers
+        ]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{os.cpu_count()} cores")
+    print(pd.DataFrame(results).round(2).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
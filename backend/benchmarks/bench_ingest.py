@@ -0,0 +1,122 @@
+"""
+Compare the connectorx (arrow) and pandas ingestion paths of database.read_frame.
+
+Run from the backend folder against a local Postgres, e.g.
+
+    python -m benchmarks.bench_ingest --host localhost --port 5432 --user postgres \
+        --password postgres --name postgres --sslmode disable --seed-rows 500000
+
+Each backend runs in its own process so peak RSS (sampled through utils.util.get_mem)
+is not polluted by the other one.
+"""
+# import libraries
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import database
+import db_pool
+from instrumentation import PeakMemSampler
+
+BENCH_TABLE = "bench_announcements"
+DB_KEYS = ["host", "port", "user", "password", "name", "sslmode"]
+
+
+def configure_db(args):
+    for key in DB_KEYS:
+        value = getattr(args, key)
+        if value is not None:
+            db_pool.cfg.db[key] = value
+
+
+# function to create a synthetic announcements table of n rows
+def seed_table(n_rows: int):
+    rng = np.random.default_rng(0)
+    tickers = np.array([f"T{i:03d}" for i in range(2000)])
+    df = pd.DataFrame(
+        {
+            "ticker": rng.choice(tickers, n_rows),
+            "announcement": [f"Announcement {i}" for i in rng.integers(0, n_rows, n_rows)],
+            "price_sensitive": rng.choice(
+                ["PRICE SENSITIVE", "NOT PRICE SENSITIVE"], n_rows
+            ),
+            "date_time": pd.Timestamp("2020-01-01")
+            + pd.to_timedelta(rng.integers(0, 3 * 365 * 24 * 60, n_rows), unit="m"),
+        }
+    )
+    df.to_sql(
+        BENCH_TABLE, db_pool.get_engine(), if_exists="replace", chunksize=50000
+    )
+    print(f"seeded {BENCH_TABLE} with {n_rows} rows")
+
+
+# runs inside the child process for one backend
+def run_worker(args):
+    reader = {
+        "connectorx": database.read_frame_arrow,
+        "pandas": database.read_frame_pandas,
+    }[args.backend]
+    query = f"Select * from {args.table}"
+
+    reader(query)  # warm up connections and imports
+
+    timings = []
+    with PeakMemSampler() as sampler:
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            df = reader(query)
+            timings.append(time.perf_counter() - start)
+
+    print(
+        json.dumps(
+            {
+                "backend": args.backend,
+                "rows": df.height,
+                "wall_min": min(timings),
+                "wall_median": float(np.median(timings)),
+                "peak_rss_mb": sampler.peak,
+            }
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--table", default=BENCH_TABLE)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed-rows", type=int, default=0)
+    parser.add_argument("--backend", choices=["connectorx", "pandas"])
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    for key in DB_KEYS:
+        parser.add_argument(f"--{key}")
+    args = parser.parse_args()
+
+    configure_db(args)
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    if args.seed_rows:
+        seed_table(args.seed_rows)
+
+    results = []
+    for backend in ["pandas", "connectorx"]:
+        cmd = [sys.executable, "-m", "benchmarks.bench_ingest", "--worker"]
+        cmd += ["--backend", backend, "--table", args.table, "--repeat", str(args.repeat)]
+        for key in DB_KEYS:
+            if getattr(args, key) is not None:
+                cmd += [f"--{key}", getattr(args, key)]
+        out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+
+    print(pd.DataFrame(results).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Compare the merge based add_lags with add_lags_vectorised.
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_lags --lags 10 60 250 --years 2 10 20
+
+Time is the best wall time over the repeats, memory is the peak traced allocation
+(tracemalloc) of one call. Every case also checks that both versions give the same lags.
+"""
+
+# import libraries
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from utils.global_functions import add_lags, add_lags_vectorised
+
+TRADING_DAYS_PER_YEAR = 252
+
+
+# function to build a daily price history of n business days
+def make_history(n: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    return pd.DataFrame(
+        {
+            "date": pd.bdate_range("2000-01-03", periods=n),
+            "close": 50 * np.exp(np.cumsum(rng.normal(0, 0.01, n))),
+        }
+    )
+
+
+def measure(func, df: pd.DataFrame, N: int, repeat: int):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(df, N, ["close"])
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    func(df, N, ["close"])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, min(times), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="lag feature benchmark")
+    parser.add_argument("--lags", type=int, nargs="+", default=[10, 60, 250])
+    parser.add_argument("--years", type=int, nargs="+", default=[2, 10, 20])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    results = []
+    for years in args.years:
+        df = make_history(years * TRADING_DAYS_PER_YEAR)
+        for N in args.lags:
+            old, old_secs, old_peak = measure(add_lags, df, N, args.repeat)
+            new, new_secs, new_peak = measure(add_lags_vectorised, df, N, args.repeat)
+            lag_cols = [f"close_lag_{i}" for i in range(1, N + 1)]
+            same = list(old.columns) == list(new.columns) and np.allclose(
+                old[lag_cols].to_numpy(float),
+                new[lag_cols].to_numpy(float),
+                rtol=1e-6,
+                equal_nan=True,
+            )
+            results.append(
+                {
+                    "rows": len(df),
+                    "N": N,
+                    "merge_ms": old_secs * 1e3,
+                    "vectorised_ms": new_secs * 1e3,
+                    "speedup": old_secs / new_secs,
+                    "merge_peak_mb": old_peak / 1024**2,
+                    "vectorised_peak_mb": new_peak / 1024**2,
+                    "same_lags": same,
+                }
+            )
+
+    print(pd.DataFrame(results).round(2).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Micro-benchmark of market_cap parsing: the old nested when/then chain, the unit lookup in
+database.normalise_market_index, and reading the precomputed column from market_index_norm.
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_market_cap --sizes 10000 50000 100000
+"""
+# import libraries
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+import polars as pl
+
+from database import normalise_market_index
+
+
+# the parsing get_marketindex used to run on every request
+def legacy_normalise(df: pl.DataFrame) -> pl.DataFrame:
+    return (
+        df.lazy()
+        .with_column(pl.col("market_cap").str.replace(r"\$", "").alias("market_cap"))
+        .with_columns(
+            pl.col("market_cap").str.extract(r"(\d+(\.\d+)?)").alias("market_cap_num"),
+            pl.col("market_cap")
+            .str.replace(r"(\d+(\.\d+)?)", "")
+            .alias("market_cap_unit"),
+        )
+        .with_column(
+            pl.when(pl.col("market_cap_unit") == "B")
+            .then(pl.col("market_cap_num").cast(pl.Float64) * 1000000000)
+            .otherwise(
+                pl.when(pl.col("market_cap_unit") == "M")
+                .then(pl.col("market_cap_num").cast(pl.Float64) * 1000000)
+                .otherwise(
+                    pl.when(pl.col("market_cap_unit") == "TH")
+                    .then(pl.col("market_cap_num").cast(pl.Float64) * 1000)
+                    .otherwise(pl.col("market_cap_num"))
+                )
+            )
+            .alias("market_cap_mod")
+        )
+        .drop(["index", "market_cap_num", "market_cap_unit"])
+        .collect()
+    )
+
+
+# function to build a synthetic market_index table of n tickers
+def make_market_index(n: int) -> pl.DataFrame:
+    rng = np.random.default_rng(0)
+    numbers = np.round(rng.uniform(1, 999, n), 2)
+    units = rng.choice(["TH", "M", "B"], n, p=[0.2, 0.6, 0.2])
+    return pl.DataFrame(
+        {
+            "index": np.arange(n),
+            "ticker": [f"T{i:06d}" for i in range(n)],
+            "name": [f"Company {i}" for i in range(n)],
+            "price": np.round(rng.uniform(0.01, 100, n), 3),
+            "market_cap": [f"${x}{u}" for x, u in zip(numbers, units)],
+        }
+    )
+
+
+def best_of(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="market_cap parsing micro-benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000, 100000])
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+
+    results = []
+    for n in args.sizes:
+        df = make_market_index(n)
+        df_norm = normalise_market_index(df)
+        results.append(
+            {
+                "tickers": n,
+                "when_chain_ms": best_of(lambda: legacy_normalise(df), args.repeat) * 1e3,
+                "unit_lookup_ms": best_of(
+                    lambda: normalise_market_index(df), args.repeat
+                )
+                * 1e3,
+                "precomputed_ms": best_of(
+                    lambda: df_norm.select(["ticker", "market_cap_mod"]), args.repeat
+                )
+                * 1e3,
+            }
+        )
+
+    print(pd.DataFrame(results).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
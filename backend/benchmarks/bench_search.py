@@ -0,0 +1,160 @@
+"""
+Build time, memory and query latency of the search index over synthetic history.
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_search --announcements 500000 --headlines 200000
+
+Announcements and headlines are made up from a fixed vocabulary (a few hundred common words
+and a long tail of rarer ones) across --tickers tickers and --years years, in the shapes the
+incremental loader holds. The index is built once from all of them, --appends batches of new
+rows are then indexed, and each query runs --repeat times; latencies are per query, in ms.
+"""
+
+# import libraries
+import argparse
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import polars as pl
+import psutil
+from database import NEWS_TABLES
+from search import SearchIndex, parse_search_args
+
+COMMON_WORDS = (
+    "the of and to in for on a with quarterly report update capital raising results half year "
+    "annual general meeting drilling exploration acquisition placement dividend guidance "
+    "production lithium gold copper iron ore mineral resource approval trading halt notice "
+    "director appointment change interest substantial holder investor presentation agreement "
+    "shares market rate bank profit loss record rba inflation deal takeover bid"
+).split()
+
+QUERIES = [
+    "capital raising",
+    "lithium drill",
+    "the",
+    "quarterly report",
+    "gold",
+    "takeover bid",
+    "rar",
+    "xq",
+]
+FILTERED_QUERIES = [
+    {"q": "quarterly report", "ticker": "T0007"},
+    {"q": "gold", "from": "2022-01-01", "to": "2022-12-31"},
+    {"q": "dividend", "source": "news"},
+]
+
+
+def _text(rng, vocab: np.ndarray, weights: np.ndarray, rows: int, words: int) -> list:
+    counts = rng.integers(words // 2, words * 2, rows)
+    picks = rng.choice(len(vocab), counts.sum(), p=weights)
+    ends = np.cumsum(counts)
+    return [" ".join(vocab[picks[s:e]]) for s, e in zip(ends - counts, ends)]
+
+
+def make_frames(args) -> dict:
+    rng = np.random.default_rng(0)
+    rare = [f"w{i:05d}" for i in range(args.vocab)]
+    vocab = np.array(COMMON_WORDS + rare)
+    # zipf-like: common words make up most of the text
+    weights = 1 / np.arange(1, len(vocab) + 1) ** 1.07
+    weights /= weights.sum()
+
+    start = datetime(2023, 6, 30) - timedelta(days=365 * args.years)
+    seconds = 365 * args.years * 86400
+
+    def times(rows):
+        offsets = np.sort(rng.integers(0, seconds, rows))
+        return pl.Series([start + timedelta(seconds=int(s)) for s in offsets])
+
+    tickers = np.array([f"T{i:04d}" for i in range(args.tickers)])
+    frames = {
+        "announcements": pl.DataFrame(
+            {
+                "ticker": tickers[rng.integers(0, args.tickers, args.announcements)],
+                "announcement": _text(rng, vocab, weights, args.announcements, 8),
+                "price_sensitive": np.where(
+                    rng.random(args.announcements) < 0.3,
+                    "PRICE SENSITIVE",
+                    "NOT PRICE SENSITIVE",
+                ),
+                "date_time": times(args.announcements),
+            }
+        )
+    }
+    per_table = args.headlines // len(NEWS_TABLES)
+    for table in NEWS_TABLES:
+        frames[table] = pl.DataFrame(
+            {
+                "headline": _text(rng, vocab, weights, per_table, 10),
+                "summary": _text(rng, vocab, weights, per_table, 20),
+                "date_time": times(per_table),
+            }
+        )
+    return frames
+
+
+def _latency(index: SearchIndex, args: dict, repeat: int) -> tuple:
+    opts = parse_search_args(args)
+    result = index.query(opts)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        index.query(opts)
+        timings.append((time.perf_counter() - start) * 1000)
+    return np.percentile(timings, 50), np.percentile(timings, 99), result["total"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--announcements", type=int, default=500000)
+    parser.add_argument("--headlines", type=int, default=200000)
+    parser.add_argument("--tickers", type=int, default=2000)
+    parser.add_argument("--vocab", type=int, default=50000)
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--appends", type=int, default=5)
+    parser.add_argument("--append-rows", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    frames = make_frames(args)
+    held = {
+        t: df.head(df.height - args.appends * args.append_rows)
+        for t, df in frames.items()
+    }
+
+    rss = psutil.Process().memory_info().rss
+    start = time.perf_counter()
+    index = SearchIndex({t: 1 for t in frames})
+    index.add(held)
+    build = time.perf_counter() - start
+    rss = psutil.Process().memory_info().rss - rss
+    print(
+        f"built the index of {len(index)} rows, {len(index.vocab)} terms in {build:.2f}s, "
+        f"{rss / 1024**2:.0f}MB"
+    )
+
+    appends = []
+    for i in range(args.appends, 0, -1):
+        held = {
+            t: df.head(df.height - (i - 1) * args.append_rows)
+            for t, df in frames.items()
+        }
+        start = time.perf_counter()
+        index.add(held)
+        appends.append((time.perf_counter() - start) * 1000)
+    print(
+        f"indexed {args.append_rows} new rows per table in {np.median(appends):.1f}ms (median)"
+    )
+
+    print(f"\n{'query':<60}{'p50_ms':>9}{'p99_ms':>9}{'total':>9}")
+    for query in [{"q": q} for q in QUERIES] + FILTERED_QUERIES:
+        p50, p99, total = _latency(index, query, args.repeat)
+        label = " ".join(f"{k}={v}" for k, v in query.items())
+        print(f"{label:<60}{p50:>9.2f}{p99:>9.2f}{total:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Compare the old polars -> pandas -> dict -> json responses with serialise.py.
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_serialise --sizes 2000 20000 200000
+
+Every (path, size) pair runs in its own process; CPU is process time and memory is the
+peak RSS increase over the process' baseline, sampled through utils.util.get_mem.
+"""
+
+# import libraries
+import argparse
+import io
+import json
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import polars as pl
+
+from instrumentation import PeakMemSampler
+from serialise import columns_json, encode_json
+from utils.util import get_mem
+
+PATHS = ["legacy_records", "legacy_news", "rows_json", "columns_json", "arrow_ipc"]
+
+
+# function to build an announcements-like table of n rows
+def make_table(n: int) -> pl.DataFrame:
+    rng = np.random.default_rng(0)
+    return pl.DataFrame(
+        {
+            "ticker": [f"T{i % 2000:04d}" for i in range(n)],
+            "name": [f"Company {i % 2000}" for i in range(n)],
+            "price": [f"${x}" for x in np.round(rng.uniform(0.01, 100, n), 3)],
+            "market_cap": rng.uniform(1e5, 1e11, n),
+            "announcement": [f"Quarterly activities report {i}" for i in range(n)],
+            "price_sensitive": rng.choice(["PRICE SENSITIVE", ""], n),
+            "date_time": pd.date_range("2020-01-01", periods=n, freq="min"),
+        }
+    )
+
+
+# the encoders being compared, each returns the response body
+def encode(path: str, df: pl.DataFrame) -> bytes:
+    # announcements used to do to_pandas().to_dict("records") + jsonify
+    if path == "legacy_records":
+        records = df.to_pandas().to_dict("records")
+        return json.dumps({"items": records, "status": 200}, default=str).encode()
+    # news used to do to_pandas().to_json() + json.loads + jsonify
+    if path == "legacy_news":
+        items = json.loads(df.to_pandas().to_json(orient="records"))
+        return json.dumps({"items": items, "status": 200}).encode()
+    if path == "rows_json":
+        return encode_json({"items": df, "status": 200})
+    if path == "columns_json":
+        return columns_json(df)
+    if path == "arrow_ipc":
+        buffer = io.BytesIO()
+        df.write_ipc(buffer)
+        return buffer.getvalue()
+    raise ValueError(path)
+
+
+def run_worker(path: str, n: int, repeat: int):
+    df = make_table(n)
+    baseline = get_mem()
+    cpu = []
+    with PeakMemSampler() as sampler:
+        for _ in range(repeat):
+            start = time.process_time()
+            body = encode(path, df)
+            cpu.append(time.process_time() - start)
+    print(
+        json.dumps(
+            {
+                "path": path,
+                "rows": n,
+                "cpu_ms": min(cpu) * 1e3,
+                "peak_rss_increase_mb": sampler.peak - baseline,
+                "body_mb": len(body) / 1024**2,
+            }
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="response serialisation benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2000, 20000, 200000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--worker", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker[0], int(args.worker[1]), args.repeat)
+        return
+
+    results = []
+    for n in args.sizes:
+        for path in PATHS:
+            cmd = [sys.executable, "-m", "benchmarks.bench_serialise"]
+            cmd += ["--worker", path, str(n), "--repeat", str(args.repeat)]
+            out = subprocess.run(cmd, check=True, capture_output=True, text=True)
+            results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    print(pd.DataFrame(results).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+Cold start time and per-worker memory of the backend, with and without preloading.
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_startup --modules app asgi forecast --workers 4
+
+Each module is imported by a fresh interpreter under python -X importtime, giving its import
+time, the packages that time goes to, and the heavy packages it pulls in (the forecast stack
+should only show up under forecast, which the forecast processes import). Then --workers
+processes each import the app (gunicorn without preload), against one master importing it
+once and forking --workers children (preload, as gunicorn.conf.py does), with and without
+gc.freeze. USS is the memory only a worker holds, PSS its share of the pages it shares with
+the master and the other workers. Every process imports the app the way a preloading master
+does, i.e. without the scheduler thread, so nothing touches the database.
+"""
+
+# import libraries
+import argparse
+import gc
+import importlib
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+import psutil
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+# scheduler.PRELOAD_MASTER_ENV, not imported here so the benchmark's own imports stay out of
+# the measurements
+PRELOAD_MASTER_ENV = "STOCK_APP_PRELOAD_MASTER"
+
+# packages only the forecast processes need, flagged when a module imports them
+HEAVY_PACKAGES = [
+    "xgboost",
+    "sklearn",
+    "matplotlib",
+    "seaborn",
+    "yfinance",
+    "holidays",
+    "regex",
+    "pandas",
+    "IPython",
+]
+
+# imports module in a fresh interpreter, reports and waits for stdin to close
+IMPORT_CHILD = """
+import gc, json, os, sys, time
+os.environ["{env}"] = str(os.getpid())
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+gc.collect()
+import psutil
+rss = psutil.Process().memory_info().rss
+print(json.dumps({{"seconds": seconds, "rss": rss, "modules": sorted(sys.modules)}}), flush=True)
+sys.stdin.read()
+"""
+
+
+def memory(pid: int) -> dict:
+    info = psutil.Process(pid).memory_full_info()
+    return {
+        "rss_mb": info.rss / 1024**2,
+        "uss_mb": info.uss / 1024**2,
+        "pss_mb": getattr(info, "pss", float("nan")) / 1024**2,
+    }
+
+
+def _read_result(stream) -> dict:
+    # the app logs to stdout too, the result is the json line
+    for line in stream:
+        if line.startswith("{"):
+            return json.loads(line)
+    raise RuntimeError("the child process exited without a result")
+
+
+# stderr, where -X importtime writes, goes to a file rather than a pipe that could fill up
+# before the child prints its result
+def _start_import_child(module: str, stderr=None) -> subprocess.Popen:
+    cmd = [sys.executable]
+    if stderr is not None:
+        cmd += ["-X", "importtime"]
+    cmd += ["-c", IMPORT_CHILD.format(env=PRELOAD_MASTER_ENV, module=module)]
+    return subprocess.Popen(
+        cmd,
+        cwd=BACKEND_DIR,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=stderr or subprocess.DEVNULL,
+        text=True,
+    )
+
+
+# function to parse python -X importtime output into (module, depth, self us, cumulative us)
+def parse_importtime(stderr: str) -> list:
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return rows
+
+
+### import time ----
+def bench_import(module: str, top: int) -> dict:
+    with tempfile.TemporaryFile("w+") as stderr_file:
+        start = time.perf_counter()
+        proc = _start_import_child(module, stderr=stderr_file)
+        result = _read_result(proc.stdout)
+        wall = time.perf_counter() - start
+        proc.stdin.close()
+        proc.wait()
+        stderr_file.seek(0)
+        stderr = stderr_file.read()
+
+    rows = parse_importtime(stderr)
+    import_us = next(cum for name, depth, _, cum in rows if name == module)
+    by_package = Counter()
+    for name, _, self_us, _ in rows:
+        by_package[name.split(".")[0]] += self_us
+    imported = {name.split(".")[0] for name in result["modules"]}
+    return {
+        "module": module,
+        "import_s": import_us / 1e6,
+        "wall_s": wall,
+        "rss_mb": result["rss"] / 1024**2,
+        "heavy": [p for p in HEAVY_PACKAGES if p in imported],
+        "slowest": [(p, us / 1e6) for p, us in by_package.most_common(top)],
+    }
+
+
+### workers ----
+# every worker imports the app itself, as gunicorn does without preload
+def bench_fresh_workers(module: str, workers: int) -> dict:
+    start = time.perf_counter()
+    procs = [_start_import_child(module) for _ in range(workers)]
+    for proc in procs:
+        _read_result(proc.stdout)
+    ready = time.perf_counter() - start
+    mems = [memory(proc.pid) for proc in procs]
+    for proc in procs:
+        proc.stdin.close()
+        proc.wait()
+    return {"mode": "fresh imports", "ready_s": ready, "master": None, "workers": mems}
+
+
+# runs in its own process: import the app once and fork the workers from it, as a preloading
+# gunicorn master does
+def run_master(module: str, workers: int, freeze: bool):
+    os.environ[PRELOAD_MASTER_ENV] = str(os.getpid())
+    start = time.perf_counter()
+    if freeze:
+        gc.disable()
+    importlib.import_module(module)
+    if freeze:
+        gc.freeze()
+
+    read_fd, write_fd = os.pipe()
+    pids = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            # a worker's first full collection, which writes to every tracked object's page
+            # unless they were frozen in the master
+            gc.enable()
+            gc.collect()
+            os.write(write_fd, b"1")
+            time.sleep(3600)
+            os._exit(0)
+        pids.append(pid)
+    for _ in pids:
+        os.read(read_fd, 1)
+    ready = time.perf_counter() - start
+
+    result = {
+        "mode": "preload" + ("" if freeze else ", no gc.freeze"),
+        "ready_s": ready,
+        "master": memory(os.getpid()),
+        "workers": [memory(pid) for pid in pids],
+    }
+    for pid in pids:
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+    print(json.dumps(result), flush=True)
+
+
+def bench_preload_workers(module: str, workers: int, freeze: bool) -> dict:
+    cmd = [sys.executable, "-m", "benchmarks.bench_startup", "--master"]
+    cmd += ["--modules", module, "--workers", str(workers)]
+    if not freeze:
+        cmd.append("--no-freeze")
+    out = subprocess.run(
+        cmd, cwd=BACKEND_DIR, check=True, capture_output=True, text=True
+    ).stdout
+    return _read_result(out.splitlines())
+
+
+def _mean(mems: list, key: str) -> float:
+    return sum(m[key] for m in mems) / len(mems)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--modules", nargs="+", default=["app", "asgi", "forecast"])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--worker-module", default="asgi")
+    parser.add_argument("--top", type=int, default=8)
+    parser.add_argument("--master", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--no-freeze", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.master:
+        run_master(args.modules[0], args.workers, not args.no_freeze)
+        return
+
+    print("import time (python -X importtime), a fresh interpreter per module")
+    print(f"{'module':<10}{'import_s':>10}{'wall_s':>9}{'rss_mb':>9}  heavy packages")
+    imports = [bench_import(module, args.top) for module in args.modules]
+    for r in imports:
+        heavy = ", ".join(r["heavy"]) or "-"
+        print(
+            f"{r['module']:<10}{r['import_s']:>10.3f}{r['wall_s']:>9.3f}"
+            f"{r['rss_mb']:>9.1f}  {heavy}"
+        )
+    for r in imports:
+        slowest = ", ".join(f"{p} {s:.3f}" for p, s in r["slowest"])
+        print(f"  {r['module']} spends the most in (secs): {slowest}")
+
+    module = args.worker_module
+    print(f"\n{args.workers} workers serving {module}, means per worker")
+    print(
+        f"{'mode':<24}{'ready_s':>9}{'rss_mb':>9}{'uss_mb':>9}{'pss_mb':>9}"
+        f"{'master_rss_mb':>15}"
+    )
+    results = [
+        bench_fresh_workers(module, args.workers),
+        bench_preload_workers(module, args.workers, freeze=True),
+        bench_preload_workers(module, args.workers, freeze=False),
+    ]
+    for r in results:
+        master = f"{r['master']['rss_mb']:.1f}" if r["master"] else "-"
+        print(
+            f"{r['mode']:<24}{r['ready_s']:>9.3f}{_mean(r['workers'], 'rss_mb'):>9.1f}"
+            f"{_mean(r['workers'], 'uss_mb'):>9.1f}{_mean(r['workers'], 'pss_mb'):>9.1f}"
+            f"{master:>15}"
+        )
+
+
+if __name__ == "__main__":
+    main()
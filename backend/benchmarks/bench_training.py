@@ -0,0 +1,93 @@
+"""
+Compare the old XGBRegressor.fit on pandas frames with trainer.train_booster (float32 DMatrix
+built once, hist, early stopping on the validation set).
+
+Run from the backend folder:
+
+    python -m benchmarks.bench_training --years 3 10 --nthread 1 4
+
+The features are built the way create_dfs builds them, from a synthetic daily close series.
+Times are the best of the repeats; cpu is process time, which is what concurrent forecasts
+compete for.
+"""
+
+# import libraries
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from benchmarks.bench_lags import TRADING_DAYS_PER_YEAR, make_history
+from forecast import XGB_PARAMS, create_dfs
+from trainer import to_dmatrix, train_booster
+
+# the hyperparameters forecast.py used before the native training path
+LEGACY_PARAMS = {
+    k: v
+    for k, v in XGB_PARAMS.items()
+    if k not in ["tree_method", "early_stopping_rounds"]
+}
+
+
+def fit_legacy(X_train, y_train, X_val, y_val, nthread):
+    model = xgb.XGBRegressor(**LEGACY_PARAMS, n_jobs=nthread)
+    model.fit(
+        X_train, y_train, eval_set=[(X_train, y_train), (X_val, y_val)], verbose=False
+    )
+    rmse = model.evals_result()["validation_1"]["rmse"][-1]
+    return model.get_booster().num_boosted_rounds(), rmse
+
+
+def fit_native(X_train, y_train, X_val, y_val, nthread):
+    dtrain = to_dmatrix(X_train, y_train, nthread)
+    dval = to_dmatrix(X_val, y_val, nthread)
+    _, fit = train_booster(
+        XGB_PARAMS, dtrain, dval, XGB_PARAMS["n_estimators"], nthread
+    )
+    return fit["rounds"], fit["val_rmse"]
+
+
+def measure(func, data, nthread, repeat):
+    wall, cpu = [], []
+    for _ in range(repeat):
+        start, cpu_start = time.perf_counter(), time.process_time()
+        rounds, rmse = func(*data, nthread)
+        wall.append(time.perf_counter() - start)
+        cpu.append(time.process_time() - cpu_start)
+    return min(wall), min(cpu), rounds, rmse
+
+
+def main():
+    parser = argparse.ArgumentParser(description="forecast model training benchmark")
+    parser.add_argument("--years", type=int, nargs="+", default=[3, 10])
+    parser.add_argument("--nthread", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    results = []
+    for years in args.years:
+        df = make_history(years * TRADING_DAYS_PER_YEAR)
+        X_train, y_train, X_val, y_val, _, _ = create_dfs(df, 10)
+        data = (X_train, y_train, X_val, y_val)
+        for nthread in args.nthread:
+            for name, func in [("legacy", fit_legacy), ("native", fit_native)]:
+                wall, cpu, rounds, rmse = measure(func, data, nthread, args.repeat)
+                results.append(
+                    {
+                        "rows": len(X_train),
+                        "nthread": nthread,
+                        "path": name,
+                        "fit_ms": wall * 1e3,
+                        "cpu_ms": cpu * 1e3,
+                        "rounds": rounds,
+                        "val_rmse": rmse,
+                    }
+                )
+
+    print(pd.DataFrame(results).round(4).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
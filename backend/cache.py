@@ -0,0 +1,306 @@
+# import libraries
+import asyncio
+import fcntl
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import yaml
+from box import Box
+from flask_caching import Cache
+from offload import run_blocking
+
+cfg = Box(yaml.safe_load(open("config_db.yml")))
+
+### set up logging and other params ----
+logger = logging.getLogger()
+
+# shared payload cache, the backend (file system, redis, ...) is set in config_db.yml so
+# every gunicorn worker reads the same entries
+cache = Cache()
+_app = None
+
+# per-process counters
+_stats_lock = threading.Lock()
+_stats = {
+    "hits": 0,
+    "stale_hits": 0,
+    "misses": 0,
+    "loads": 0,
+    "refreshes": 0,
+    "refresh_errors": 0,
+}
+
+# in-process single flight: one lock per key, and the keys being refreshed in the background
+_key_locks = {}
+_key_locks_lock = threading.Lock()
+_refreshing = set()
+_async_key_locks = {}
+
+
+def _incr(key):
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def _key_lock(key: str) -> threading.Lock:
+    with _key_locks_lock:
+        return _key_locks.setdefault(key, threading.Lock())
+
+
+# function to take the cross-worker lock of a key without blocking: an open file holding an
+# exclusive flock, or None if another worker (or thread) holds it. the kernel releases it when
+# the file is closed or the process dies, so a crashed loader never leaves it behind
+def _try_lock(key: str):
+    os.makedirs(cfg.cache.lock_dir, exist_ok=True)
+    lock_file = open(os.path.join(cfg.cache.lock_dir, f"{key}.lock"), "a+")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+# function to release a lock taken by _try_lock. the file stays, unlinking it would let the
+# next worker lock a new file while another still holds the old one
+def _unlock(lock_file):
+    if lock_file is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+
+# blocking version of _try_lock, for short check-then-set sections that the workers of a host
+# must not interleave (the forecast jobs' ticker claims)
+@contextmanager
+def host_lock(key: str):
+    os.makedirs(cfg.cache.lock_dir, exist_ok=True)
+    with open(os.path.join(cfg.cache.lock_dir, f"{key}.lock"), "a+") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+# function to attach the cache to the flask app
+def init_cache(app):
+    global _app
+
+    cache.init_app(app, config=cfg.cache.backend.to_dict())
+    # without an app context (the asgi app's executor threads) the cache falls back to cache.app
+    cache.app = app
+    _app = app
+
+
+# function to store a payload along with when it was built, readers see either the old
+# or the new entry
+def publish(key: str, payload, ttl: int):
+    cache.set(
+        key,
+        {"built_at": time.time(), "payload": payload},
+        timeout=ttl + cfg.cache.stale_ttl,
+    )
+
+
+# function to run the loader and store the payload
+def _load(key: str, loader, ttl: int):
+    payload = loader()
+    publish(key, payload, ttl)
+    _incr("loads")
+    return payload
+
+
+def _refresh(key: str, loader, ttl: int, lock_file):
+    try:
+        with _app.app_context():
+            try:
+                _load(key, loader, ttl)
+                _incr("refreshes")
+            finally:
+                _unlock(lock_file)
+    except Exception:
+        _incr("refresh_errors")
+        logger.exception(f"background refresh of {key} failed, serving stale data")
+    finally:
+        with _key_locks_lock:
+            _refreshing.discard(key)
+
+
+# function to start a background refresh, unless one is already running in this or another worker
+def _refresh_in_background(key: str, loader, ttl: int):
+    with _key_locks_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    lock_file = _try_lock(key)
+    if lock_file is None:
+        with _key_locks_lock:
+            _refreshing.discard(key)
+        return
+
+    threading.Thread(
+        target=_refresh, args=(key, loader, ttl, lock_file), daemon=True
+    ).start()
+
+
+# function to wait for another worker that is loading the key, returns (entry, lock file):
+# its entry once published, or the lock if it gave up without publishing. after lock_timeout
+# seconds it returns (None, None) and the caller loads without the lock
+def _wait_for_other_worker(key: str) -> tuple:
+    deadline = time.time() + cfg.cache.lock_timeout
+    while time.time() < deadline:
+        entry = cache.get(key)
+        if entry is not None:
+            return entry, None
+        lock_file = _try_lock(key)
+        if lock_file is not None:
+            return cache.get(key), lock_file
+        time.sleep(0.1)
+    logger.warning(f"gave up waiting for another worker to load {key}, loading it here")
+    return None, None
+
+
+# function to lock the key, waiting for the worker holding it. returns (entry, lock file) as
+# _wait_for_other_worker, the entry only if someone else published it in the meantime
+def _lock_or_wait(key: str) -> tuple:
+    lock_file = _try_lock(key)
+    if lock_file is None:
+        return _wait_for_other_worker(key)
+    # the holder may have published just before we locked
+    return cache.get(key), lock_file
+
+
+# function to return a cached payload, stale-while-revalidate with single-flight loading
+def get_or_load(key: str, loader, ttl: int):
+    entry = cache.get(key)
+    if entry is not None:
+        age = time.time() - entry["built_at"]
+        if age < ttl:
+            _incr("hits")
+            return entry["payload"]
+        _incr("stale_hits")
+        _refresh_in_background(key, loader, ttl)
+        return entry["payload"]
+
+    _incr("misses")
+    with _key_lock(key):
+        # another thread may have loaded it while we waited on the lock
+        entry = cache.get(key)
+        if entry is not None:
+            return entry["payload"]
+
+        entry, lock_file = _lock_or_wait(key)
+        try:
+            if entry is not None:
+                return entry["payload"]
+            return _load(key, loader, ttl)
+        finally:
+            _unlock(lock_file)
+
+
+### async version for the asgi app ----
+# the loader is a coroutine function, cache reads and writes run on the blocking executor
+
+
+def _async_key_lock(key: str) -> asyncio.Lock:
+    return _async_key_locks.setdefault(key, asyncio.Lock())
+
+
+async def _load_async(key: str, loader, ttl: int):
+    payload = await loader()
+    await run_blocking(publish, key, payload, ttl)
+    _incr("loads")
+    return payload
+
+
+async def _refresh_async(key: str, loader, ttl: int, lock_file):
+    try:
+        try:
+            await _load_async(key, loader, ttl)
+            _incr("refreshes")
+        finally:
+            _unlock(lock_file)
+    except Exception:
+        _incr("refresh_errors")
+        logger.exception(f"background refresh of {key} failed, serving stale data")
+    finally:
+        with _key_locks_lock:
+            _refreshing.discard(key)
+
+
+async def _refresh_in_background_async(key: str, loader, ttl: int):
+    with _key_locks_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    lock_file = await run_blocking(_try_lock, key)
+    if lock_file is None:
+        with _key_locks_lock:
+            _refreshing.discard(key)
+        return
+
+    asyncio.ensure_future(_refresh_async(key, loader, ttl, lock_file))
+
+
+async def _wait_for_other_worker_async(key: str) -> tuple:
+    deadline = time.time() + cfg.cache.lock_timeout
+    while time.time() < deadline:
+        entry = await run_blocking(cache.get, key)
+        if entry is not None:
+            return entry, None
+        lock_file = await run_blocking(_try_lock, key)
+        if lock_file is not None:
+            return await run_blocking(cache.get, key), lock_file
+        await asyncio.sleep(0.1)
+    logger.warning(f"gave up waiting for another worker to load {key}, loading it here")
+    return None, None
+
+
+# function to return a cached payload from a coroutine, same as get_or_load
+async def get_or_load_async(key: str, loader, ttl: int):
+    entry = await run_blocking(cache.get, key)
+    if entry is not None:
+        age = time.time() - entry["built_at"]
+        if age < ttl:
+            _incr("hits")
+            return entry["payload"]
+        _incr("stale_hits")
+        await _refresh_in_background_async(key, loader, ttl)
+        return entry["payload"]
+
+    _incr("misses")
+    async with _async_key_lock(key):
+        entry = await run_blocking(cache.get, key)
+        if entry is not None:
+            return entry["payload"]
+
+        lock_file = await run_blocking(_try_lock, key)
+        if lock_file is None:
+            entry, lock_file = await _wait_for_other_worker_async(key)
+        else:
+            entry = await run_blocking(cache.get, key)
+        try:
+            if entry is not None:
+                return entry["payload"]
+            return await _load_async(key, loader, ttl)
+        finally:
+            _unlock(lock_file)
+
+
+# function to drop a cached payload, e.g. after a scraper run
+def invalidate(key: str):
+    cache.delete(key)
+
+
+# function to return the cache counters
+def cache_stats() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["pid"] = os.getpid()
+    stats["refreshing"] = sorted(_refreshing)
+    return stats
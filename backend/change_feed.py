@@ -0,0 +1,383 @@
+# import libraries
+import asyncio
+import base64
+import json
+import logging
+import time
+from datetime import datetime
+
+import db_async
+import polars as pl
+import yaml
+from app import join_announcements
+from box import Box
+from database import (
+    INCREMENTAL_TABLES,
+    NEWS_TABLES,
+    get_marketindex_async,
+    prepare_frame,
+    read_frame_async,
+)
+from offload import run_blocking
+from serialise import encode_json
+
+cfg = Box(yaml.safe_load(open("config_db.yml")))
+
+### set up logging and other params ----
+logger = logging.getLogger()
+
+"""
+    change feed behind GET /api/contents/stream (server-sent events)
+
+    the announcements and news tables carry a change_seq column, numbered from one sequence by
+    a trigger on every insert and update (migrations/0004_change_seq.sql). one poller per worker
+    reads the rows numbered past its cursor, when postgres NOTIFYs a change on
+    cfg.stream.notify_channel (see migrations/0002_change_notify.sql) or every poll_interval
+    seconds otherwise, and fans them out to every connected client, so edited rows are sent as
+    well as new ones and the number of clients doesn't change the polling load.
+
+    an event's id is the feed's cursor, the latest change_seq it has published per table. ids
+    don't depend on the worker, so a client that reconnects (EventSource sends the id back as
+    Last-Event-ID) to any worker is sent the rows changed after its cursor, then the live
+    events. a client connecting with ?since= (the time of the newest row it holds) is sent the
+    rows newer than that first. a catch up is one read per table of at most max_catch_up rows
+"""
+
+TOPICS = {"announcements": ["announcements"], "news": NEWS_TABLES}
+FEED_TABLES = [table for tables in TOPICS.values() for table in tables]
+SEQ_COL = "change_seq"
+MAX_SEQ = 2**63 - 1
+
+# news tables in the sections of the /api/contents/news payload
+NEWS_SECTIONS = {"aus_dataroom": "aus_sections", "aus_tradingday": "aus_sections"}
+
+
+# function to validate the topics of a stream request, a comma separated list
+def parse_topics(value: str = None) -> list:
+    if not value:
+        return list(TOPICS)
+    topics = [t.strip() for t in value.split(",") if t.strip()]
+    unknown = [t for t in topics if t not in TOPICS]
+    if unknown or not topics:
+        raise ValueError(f"topics must be among {list(TOPICS)}")
+    return topics
+
+
+### event ids ----
+def encode_event_id(cursor: dict) -> str:
+    raw = json.dumps(cursor)
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+# function to decode a last event id into a cursor, table -> change_seq. raises ValueError
+# unless it is one encode_event_id could have produced
+def decode_event_id(event_id: str) -> dict:
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(event_id.encode()).decode())
+    except ValueError:
+        raise ValueError("invalid last event id")
+    if not isinstance(cursor, dict) or not set(cursor) <= set(FEED_TABLES):
+        raise ValueError("invalid last event id")
+    for seq in cursor.values():
+        if not isinstance(seq, int) or isinstance(seq, bool) or seq < 0:
+            raise ValueError("invalid last event id")
+    return cursor
+
+
+def _format_event(event_id: str, topic: str, data: bytes) -> bytes:
+    return f"id: {event_id}\nevent: {topic}\n".encode() + b"data: " + data + b"\n\n"
+
+
+### deltas ----
+# function to build the query of the rows of a table changed after since, up to and including
+# until, in change order. since is a change_seq, or with by_time the time of a row
+def changes_query(table: str, by_time: bool = False) -> str:
+    if by_time:
+        ts_col = INCREMENTAL_TABLES[table]["ts_col"]
+        after = f"{ts_col} > cast(cast(:since as text) as timestamp)"
+    else:
+        after = f"{SEQ_COL} > :since"
+    return (
+        f"Select * from {table} where {after} and {SEQ_COL} <= :until "
+        f"order by {SEQ_COL} limit :limit"
+    )
+
+
+def cursor_query(table: str) -> str:
+    return f"Select coalesce(max({SEQ_COL}), 0) as seq from {table}"
+
+
+# function to turn the rows read from a table into the rows of its payload
+def _payload_rows(table: str, df: pl.DataFrame) -> pl.DataFrame:
+    spec = INCREMENTAL_TABLES[table]
+    df = prepare_frame(df, spec["ts_col"], spec["unique_on"])
+    return df.rename({"heading": "headline"}) if "heading" in df.columns else df
+
+
+# function to build the events of the rows changed per table, in the shapes of the
+# /api/contents and /api/contents/news payloads
+async def _events(frames: dict, topics: list) -> list:
+    events = []
+    if "announcements" in topics and frames.get("announcements") is not None:
+        df_new = frames["announcements"]
+        df_market_idx = await get_marketindex_async()
+        df_rows = await run_blocking(
+            join_announcements,
+            df_new,
+            df_market_idx.filter(pl.col("ticker").is_in(df_new["ticker"])),
+        )
+        events.append(("announcements", encode_json({"items": df_rows})))
+
+    if "news" in topics:
+        sections = {}
+        for table in NEWS_TABLES:
+            if frames.get(table) is not None:
+                section = NEWS_SECTIONS.get(table, table)
+                sections.setdefault(section, []).append(frames[table])
+        if sections:
+            items = {name: pl.concat(dfs) for name, dfs in sections.items()}
+            events.append(("news", encode_json({"items": items})))
+    return events
+
+
+# function to read from a table for the feed, None if the read failed
+async def _read(table: str, query: str, params: dict = None):
+    try:
+        return await read_frame_async(query, params)
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        logger.exception(
+            f"change feed could not read {table}, if it was recreated run "
+            "python migrate.py --force to add its change_seq back"
+        )
+        return None
+
+
+# function to read the rows of the tables changed after their since values (change_seq, or
+# row times), up to until, as payload rows. returns (rows per table, whether a read hit the
+# limit, the latest change_seq read per table), tables that couldn't be read are left out
+async def _changes(since: dict, until: dict, limit: int) -> tuple:
+    tables = list(since)
+    frames = await asyncio.gather(
+        *(
+            _read(
+                table,
+                changes_query(table, by_time=isinstance(since[table], str)),
+                {"since": since[table], "until": until[table], "limit": limit},
+            )
+            for table in tables
+        )
+    )
+    changed, truncated, seqs = {}, False, {}
+    for table, df in zip(tables, frames):
+        if df is None or df.height == 0:
+            continue
+        truncated = truncated or df.height >= limit
+        seqs[table] = int(df[SEQ_COL].max())
+        changed[table] = await run_blocking(_payload_rows, table, df)
+    return changed, truncated, seqs
+
+
+class _Subscriber:
+    def __init__(self, topics: list):
+        self.topics = topics
+        self.queue = asyncio.Queue(maxsize=cfg.stream.queue_size)
+        # set when the client fell queue_size events behind, its stream then ends and the
+        # client catches up from its last event id when it reconnects
+        self.dropped = False
+
+
+class ChangeFeed:
+    def __init__(self):
+        self.cursor = {}
+        self.subscribers = set()
+        self.polls = 0
+        self.last_poll_at = None
+        self._task = None
+        self._ready = None
+        self._wake = None
+        self._listener = None
+        self._listen_retry_at = 0.0
+
+    # function to start the poller on the running event loop, on the first subscriber
+    def start(self):
+        if self._task is None:
+            self._ready = asyncio.Event()
+            self._wake = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._listener is not None:
+            await self._listener.close()
+            self._listener = None
+
+    def _notified(self, *args):
+        self._wake.set()
+
+    def _listener_lost(self, *args):
+        logger.warning("change feed lost its LISTEN connection")
+        self._listener = None
+
+    async def _listen(self):
+        if (
+            self._listener is not None
+            or not db_async.pool_ready()
+            or time.time() < self._listen_retry_at
+        ):
+            return
+        try:
+            self._listener = await db_async.listen(
+                cfg.stream.notify_channel, self._notified, self._listener_lost
+            )
+            logger.info(f"change feed listening on {cfg.stream.notify_channel}")
+        except Exception:
+            logger.exception("change feed could not LISTEN, polling only")
+            self._listen_retry_at = time.time() + cfg.stream.listen_retry
+
+    async def _run(self):
+        while True:
+            await self._listen()
+            try:
+                await self.poll()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("change feed poll failed")
+            self._ready.set()
+
+            try:
+                await asyncio.wait_for(self._wake.wait(), cfg.stream.poll_interval)
+                # let the rest of a scraper run's inserts arrive
+                await asyncio.sleep(cfg.stream.debounce)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    # function to read the rows changed since the last poll and publish them. a table's first
+    # poll only sets its cursor
+    async def poll(self):
+        new_tables = [t for t in FEED_TABLES if t not in self.cursor]
+        if new_tables:
+            frames = await asyncio.gather(
+                *(_read(table, cursor_query(table)) for table in new_tables)
+            )
+            for table, df in zip(new_tables, frames):
+                if df is not None:
+                    self.cursor[table] = int(df[0, 0])
+
+        since = dict(self.cursor)
+        changed, truncated, seqs = await _changes(
+            since, {t: MAX_SEQ for t in since}, cfg.stream.max_catch_up
+        )
+        self.cursor.update(seqs)
+        self.polls += 1
+        self.last_poll_at = time.time()
+        # a table had more changes than one read takes, read the rest straight away
+        if truncated and self._wake is not None:
+            self._wake.set()
+
+        if changed and self.subscribers:
+            event_id = encode_event_id(self.cursor)
+            for topic, data in await _events(changed, list(TOPICS)):
+                self._publish(event_id, topic, data)
+            logger.info(
+                f"change feed published {sum(df.height for df in changed.values())} rows "
+                f"to {len(self.subscribers)} clients"
+            )
+
+    def _publish(self, event_id: str, topic: str, data: bytes):
+        event = _format_event(event_id, topic, data)
+        for subscriber in list(self.subscribers):
+            if topic not in subscriber.topics:
+                continue
+            try:
+                subscriber.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                subscriber.dropped = True
+                self.subscribers.discard(subscriber)
+
+    # function to build the catch up events of a client whose cursor is since, None if there
+    # are more than max_catch_up rows (the client is told to reload instead)
+    async def _catch_up(self, since: dict, cursor: dict, topics: list):
+        tables = [t for topic in topics for t in TOPICS[topic]]
+        since = {t: since[t] for t in tables if t in since and t in cursor}
+        changed, _, _ = await _changes(since, cursor, cfg.stream.max_catch_up + 1)
+        if sum(df.height for df in changed.values()) > cfg.stream.max_catch_up:
+            return None
+        return [
+            _format_event(encode_event_id(cursor), topic, data)
+            for topic, data in await _events(changed, topics)
+        ]
+
+    # the event stream of one client. since is the cursor of its last event id (or the time
+    # of the newest row it holds), None to only get rows changed from now on
+    async def stream(self, topics: list, since: dict = None):
+        self.start()
+        await self._ready.wait()
+
+        subscriber = _Subscriber(topics)
+        # subscribed and cursor copied without an await in between, so every row after the
+        # cursor comes through the queue
+        self.subscribers.add(subscriber)
+        cursor = dict(self.cursor)
+        try:
+            yield f"retry: {cfg.stream.retry}\n\n".encode()
+            if since is not None:
+                events = await self._catch_up(since, cursor, topics)
+                if events is None:
+                    yield _format_event(encode_event_id(cursor), "reset", b"{}")
+                    events = []
+                for event in events:
+                    yield event
+
+            while not (subscriber.dropped and subscriber.queue.empty()):
+                try:
+                    yield await asyncio.wait_for(
+                        subscriber.queue.get(), cfg.stream.heartbeat
+                    )
+                except asyncio.TimeoutError:
+                    yield b": ping\n\n"
+        finally:
+            self.subscribers.discard(subscriber)
+
+    def status(self) -> dict:
+        return {
+            "running": self._task is not None,
+            "listening": self._listener is not None,
+            "subscribers": len(self.subscribers),
+            "polls": self.polls,
+            "last_poll_at": self.last_poll_at,
+            "cursor": dict(self.cursor),
+        }
+
+
+# the feed of this worker
+feed = ChangeFeed()
+
+
+# function to turn a stream request's last event id, or ?since= (an iso time or epoch ms, the
+# newest row the client holds), into a cursor. raises ValueError on bad input, before the
+# stream is opened
+def parse_since(last_event_id: str = None, since: str = None, topics: list = None):
+    if last_event_id:
+        return decode_event_id(last_event_id)
+    if not since:
+        return None
+    try:
+        # the json payloads carry datetimes as epoch ms
+        value = datetime.utcfromtimestamp(float(since) / 1000).isoformat(sep=" ")
+    except (ValueError, OverflowError, OSError):
+        value = since.replace("T", " ")
+        try:
+            datetime.fromisoformat(value)
+        except ValueError:
+            raise ValueError("since must be an iso time or epoch milliseconds")
+    return {t: value for topic in topics or TOPICS for t in TOPICS[topic]}
@@ -1,220 +1,573 @@
 # import libraries
+import asyncio
+import contextvars
 import logging
+import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from decimal import Decimal
+from functools import partial
+from typing import Tuple
 
-import pandas as pd
+import db_async
 import polars as pl
 import yaml
 from box import Box
-from sqlalchemy import create_engine
-from utils.util import get_mem
+from db_pool import db_connection, get_database_url
+from instrumentation import stage
+from offload import run_blocking
+from sqlalchemy import text
+
+try:
+    import connectorx as cx
+except ImportError:  # optional, read_frame falls back to pd.read_sql
+    cx = None
 
 cfg = Box(yaml.safe_load(open("config_db.yml")))
 
 ### set up logging and other params ----
 logger = logging.getLogger()
 
-# function to get data from hotcopper table
-def get_hotcopper():
-    start = time.time()
-    logger.debug(f"connecting to DB and grabing HotCopper data...")
-    # Get required database params
-    DATABASE_URL = (
-        "postgresql://"
-        + cfg.db.user
-        + ":"
-        + cfg.db.password
-        + "@"
-        + cfg.db.host
-        + ":"
-        + str(cfg.db.port)
-        + "/"
-        + cfg.db.name
-        + "?sslmode=require"
+# source tables that are loaded incrementally, with the watermark column and the
+# columns each table is de-duplicated on
+INCREMENTAL_TABLES = {
+    "announcements": {
+        "ts_col": "date_time",
+        "unique_on": ["ticker", "announcement", "price_sensitive"],
+        "distinct": True,
+    },
+    "afr_homepage": {"ts_col": "extract_ts", "unique_on": ["headline"]},
+    "afr_street_talk": {"ts_col": "extract_ts", "unique_on": ["headline"]},
+    "aus_homepage": {"ts_col": "extract_ts", "unique_on": ["heading"]},
+    "aus_dataroom": {"ts_col": "extract_ts", "unique_on": ["heading", "summary"]},
+    "aus_tradingday": {"ts_col": "extract_ts", "unique_on": ["heading", "summary"]},
+}
+
+NEWS_TABLES = [
+    "afr_homepage",
+    "afr_street_talk",
+    "aus_homepage",
+    "aus_dataroom",
+    "aus_tradingday",
+]
+
+# in-memory state of the incremental loader, one entry per table
+_frames = {}
+_watermarks = {}
+_loaded_at = {}
+# bumped on every full load, between two full loads a table's frame only grows at the end
+_generations = {}
+_table_locks = {table: threading.Lock() for table in INCREMENTAL_TABLES}
+
+# set once a read has fallen back from connectorx to pandas
+_fallback_logged = False
+
+# executor for concurrent table reads
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+# function to inline query parameters, connectorx does not take bind parameters. only whole
+# :name tokens are replaced, the same ones db_async binds, so :since never touches :since_ts
+# and :: casts are left alone
+def _render_query(query: str, params: dict = None) -> str:
+    params = params or {}
+
+    def literal(match):
+        name = match.group(1)
+        if name not in params:
+            return match.group(0)
+        value = params[name]
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return repr(value)
+        return "'" + str(value).replace("'", "''") + "'"
+
+    return db_async.BIND_PARAM.sub(literal, query)
+
+
+# read through connectorx, which decodes straight into arrow buffers that polars wraps without
+# copying. each read opens its own connection outside the pool, so it only pays off on bulk reads
+@stage("query", "connectorx")
+def read_frame_arrow(query: str, params: dict = None) -> pl.DataFrame:
+    table = cx.read_sql(
+        get_database_url(), _render_query(query, params), return_type="arrow"
     )
-    postgresql_engine = create_engine(DATABASE_URL)
-
-    query = "Select distinct * from announcements"
-    df = (
-        pl.from_pandas(pd.read_sql(query, postgresql_engine))
-        .lazy()
-        .drop("index")
-        .sort("date_time")
-        .unique(subset=["ticker", "announcement", "price_sensitive"], keep="first")
-        .collect()
+    return pl.from_arrow(table, rechunk=False)
+
+
+# read through a pooled sqlalchemy connection and pandas
+@stage("query", "pandas")
+def read_frame_pandas(query: str, params: dict = None) -> pl.DataFrame:
+    # pandas is only imported on this fallback path, the connectorx path doesn't need it
+    import pandas as pd
+
+    with db_connection() as conn:
+        df_raw = pd.read_sql(text(query), conn, params=params)
+    return pl.from_pandas(df_raw)
+
+
+# function to log why a read falls back to pandas, as a warning the first time only
+def _log_fallback(reason: str):
+    global _fallback_logged
+    if _fallback_logged:
+        logger.debug(f"{reason}, reading through pd.read_sql")
+        return
+    _fallback_logged = True
+    logger.warning(f"{reason}, reading through pd.read_sql (logged once)")
+
+
+# function to run a query and return the result as a polars df, using the configured ingestion
+# backend: ingest.bulk_backend for bulk reads (full table loads), ingest.backend for the rest
+def read_frame(query: str, params: dict = None, bulk: bool = False) -> pl.DataFrame:
+    backend = cfg.ingest.bulk_backend if bulk else cfg.ingest.backend
+    if backend == "connectorx":
+        if cx is None:
+            _log_fallback("connectorx is not installed")
+        else:
+            try:
+                return read_frame_arrow(query, params)
+            except (RuntimeError, OSError) as e:
+                # connectorx raises connection and query errors as RuntimeError
+                _log_fallback(f"connectorx read failed: {e}")
+    return read_frame_pandas(query, params)
+
+
+# function to drop the index column (and the change feed's change_seq), standardise the
+# timestamp column and de-duplicate, unless postgres already did the de-duplication
+def prepare_frame(df: pl.DataFrame, ts_col: str, unique_on: list) -> pl.DataFrame:
+    drop = ["index"] + (["change_seq"] if "change_seq" in df.columns else [])
+    df_lazy = df.lazy().drop(drop).rename({ts_col: "date_time"})
+    if cfg.query.dedup != "sql":
+        df_lazy = df_lazy.sort("date_time").unique(subset=[*unique_on], keep="first")
+    return df_lazy.collect()
+
+
+# function to merge newly fetched rows into the already de-duplicated frame
+def merge_new_rows(df: pl.DataFrame, df_new: pl.DataFrame, unique_on: list):
+    if df_new.height == 0:
+        return df
+    df_new = df_new.select([pl.col(c).cast(dtype) for c, dtype in df.schema.items()])
+    # new rows are never older than the watermark, so any key already held keeps its earlier row
+    df_new = df_new.join(df.select(unique_on), on=unique_on, how="anti")
+    return pl.concat([df, df_new])
+
+
+# function to reset the incremental state, forcing a full reload on next call
+def reset_incremental(table: str = None):
+    tables = [table] if table else list(INCREMENTAL_TABLES)
+    for t in tables:
+        with _table_locks[t]:
+            _frames.pop(t, None)
+            _watermarks.pop(t, None)
+            _loaded_at.pop(t, None)
+
+
+# function to build the query for a source table. with query.dedup set to sql, postgres keeps the
+# earliest row per key (DISTINCT ON ... ORDER BY) so only de-duplicated rows cross the network
+def table_query(table: str, where: str = "") -> str:
+    spec = INCREMENTAL_TABLES[table]
+    if cfg.query.dedup == "sql":
+        keys = ", ".join(spec["unique_on"])
+        # nulls first, matching polars' sort before unique(keep="first")
+        return (
+            f"Select distinct on ({keys}) * from {table}{where} "
+            f"order by {keys}, {spec['ts_col']} nulls first"
+        )
+    select = "Select distinct *" if spec.get("distinct") else "Select *"
+    return f"{select} from {table}{where}"
+
+
+# function to get the latest non-null timestamp of a freshly read table
+def _max_ts(df: pl.DataFrame, ts_col: str):
+    values = df[ts_col].drop_nulls()
+    return values.sort()[-1] if len(values) > 0 else None
+
+
+# function to (re)load a whole table into the incremental state, caller holds the table lock
+def _full_load(table: str, df_raw: pl.DataFrame):
+    spec = INCREMENTAL_TABLES[table]
+    _frames[table] = prepare_frame(df_raw, spec["ts_col"], spec["unique_on"])
+    _watermarks[table] = _max_ts(df_raw, spec["ts_col"])
+    _loaded_at[table] = time.time()
+    _generations[table] = _generations.get(table, 0) + 1
+
+
+# function to decide how to load a table, returns (full, query, params): the whole table, or
+# only the rows from the watermark on. caller holds the table lock
+def _load_plan(table: str) -> tuple:
+    ts_col = INCREMENTAL_TABLES[table]["ts_col"]
+    if (
+        not cfg.incremental.enabled
+        or table not in _frames
+        or _watermarks[table] is None
+        or time.time() - _loaded_at[table] > cfg.incremental.full_reload_every
+    ):
+        return True, table_query(table), None
+    # >= so rows written in the same second as the watermark are not missed,
+    # they are dropped again by the merge
+    return (
+        False,
+        table_query(table, where=f" where {ts_col} >= :watermark"),
+        {"watermark": _watermarks[table]},
     )
 
-    postgresql_engine.dispose()
 
-    logger.info(f"memory being used: {get_mem()}")
+# function to fold the rows read per _load_plan into the incremental state, caller holds the
+# table lock. returns the table's frame, or None if its schema changed and it needs a full load
+def _apply_load(table: str, full: bool, df_raw: pl.DataFrame):
+    spec = INCREMENTAL_TABLES[table]
+    ts_col = spec["ts_col"]
 
-    end = time.time()
-    logger.info(f"{end-start} secs used to get announcements data...")
-    return df
+    if full:
+        _full_load(table, df_raw)
+        logger.info(f"full load of {table}, {df_raw.height} rows read")
+        return _frames[table]
+    if df_raw.height == 0:
+        return _frames[table]
 
+    df_new = prepare_frame(df_raw, ts_col, spec["unique_on"])
+    if set(df_new.columns) != set(_frames[table].columns):
+        logger.warning(f"schema of {table} changed, reloading the full table...")
+        return None
 
-# function to get data from market index table
-def get_marketindex():
-    start = time.time()
-    logger.debug(f"connecting to DB and grabing Market Index data...")
-    # Get required database params
-    DATABASE_URL = (
-        "postgresql://"
-        + cfg.db.user
-        + ":"
-        + cfg.db.password
-        + "@"
-        + cfg.db.host
-        + ":"
-        + str(cfg.db.port)
-        + "/"
-        + cfg.db.name
-        + "?sslmode=require"
+    _frames[table] = merge_new_rows(_frames[table], df_new, spec["unique_on"])
+    batch_max = _max_ts(df_raw, ts_col)
+    if batch_max is not None:
+        _watermarks[table] = max(_watermarks[table], batch_max)
+
+    logger.info(
+        f"loaded {df_raw.height} new rows from {table}, {_frames[table].height} rows held"
     )
-    postgresql_engine = create_engine(DATABASE_URL)
+    return _frames[table]
+
+
+# function to load a table incrementally, only fetching rows newer than the last watermark
+def load_incremental(table: str) -> pl.DataFrame:
+    with _table_locks[table]:
+        full, query, params = _load_plan(table)
+        df = _apply_load(table, full, read_frame(query, params, bulk=full))
+        if df is None:
+            df = _apply_load(table, True, read_frame(table_query(table), bulk=True))
+        return df
+
 
-    query = "Select * from market_index"
-    df = (
-        pl.from_pandas(pd.read_sql(query, postgresql_engine))
-        .lazy()
+# function to get the frame held for a table and its generation, (None, 0) before the first
+# load. frames of the same generation are prefixes of each other
+def frame_state(table: str) -> tuple:
+    with _table_locks[table]:
+        return _frames.get(table), _generations.get(table, 0)
+
+
+# function to get data from hotcopper table
+@stage("load", "announcements")
+def get_hotcopper():
+    logger.debug(f"connecting to DB and grabing HotCopper data...")
+    return load_incremental("announcements")
+
+
+# multiplier for each market cap unit, e.g. "$1.2B" -> 1.2 * 1e9
+MARKET_CAP_UNITS = pl.DataFrame(
+    {
+        "market_cap_unit": ["", "TH", "M", "B"],
+        "market_cap_multiplier": [1.0, 1e3, 1e6, 1e9],
+    }
+)
+
+# changes whenever market_index is written to (the trigger from
+# migrations/0003_table_versions.sql bumps its version) or recreated (a new oid), read from the
+# catalog and one row of table_versions instead of the table
+MARKET_INDEX_SIGNATURE_QUERY = (
+    "Select c.oid::text || ':' || coalesce(v.version, 0)::text as signature "
+    "from pg_class c left join table_versions v on v.table_name = c.relname "
+    "where c.oid = 'market_index'::regclass"
+)
+# the signature before migrations/0003_table_versions.sql is applied: changes whenever any row
+# of market_index changes, but hashes the whole table
+MARKET_INDEX_HASH_QUERY = (
+    "Select md5(string_agg(m::text, ',' order by m.ticker)) as signature "
+    "from market_index m"
+)
+TABLE_VERSIONS_QUERY = "Select to_regclass('table_versions') is not null as present"
+
+# set once table_versions has been seen, until then every signature checks for it so the
+# migration is picked up without a restart
+_table_versions = {"present": False, "warned": False}
+
+# last market index frame served, and the market_index signature it was built from
+_market_index = {"signature": None, "df": None}
+
+
+# function to turn market cap strings like "$1.2B" into numbers, using a unit lookup
+# instead of a when/then chain per unit
+def normalise_market_index(df: pl.DataFrame) -> pl.DataFrame:
+    return (
+        df.lazy()
         .with_column(pl.col("market_cap").str.replace(r"\$", "").alias("market_cap"))
         .with_columns(
-            pl.col("market_cap").str.extract(r"(\d+(\.\d+)?)").alias("market_cap_num"),
-            pl.col("market_cap")
-            .str.replace(r"(\d+(\.\d+)?)", "")
-            .alias("market_cap_unit"),
+            [
+                pl.col("market_cap")
+                .str.extract(r"(\d+(?:\.\d+)?)", 1)
+                .cast(pl.Float64)
+                .alias("market_cap_num"),
+                pl.col("market_cap")
+                .str.replace(r"\d+(?:\.\d+)?", "")
+                .fill_null("")
+                .alias("market_cap_unit"),
+            ]
         )
+        .join(MARKET_CAP_UNITS.lazy(), on="market_cap_unit", how="left")
         .with_column(
-            pl.when(pl.col("market_cap_unit") == "B")
-            .then(pl.col("market_cap_num").cast(pl.Float64) * 1000000000)
-            .otherwise(
-                pl.when(pl.col("market_cap_unit") == "M")
-                .then(pl.col("market_cap_num").cast(pl.Float64) * 1000000)
-                .otherwise(
-                    pl.when(pl.col("market_cap_unit") == "TH")
-                    .then(pl.col("market_cap_num").cast(pl.Float64) * 1000)
-                    .otherwise(pl.col("market_cap_num"))
-                )
-            )
-            .alias("market_cap_mod")
+            (
+                pl.col("market_cap_num")
+                * pl.col("market_cap_multiplier").fill_null(1.0)
+            ).alias("market_cap_mod")
         )
-        .drop(["index", "market_cap_num", "market_cap_unit"])
+        .drop(["index", "market_cap_num", "market_cap_unit", "market_cap_multiplier"])
         .collect()
     )
 
-    postgresql_engine.dispose()
 
-    logger.info(f"memory being used: {get_mem()}")
-
-    end = time.time()
-    logger.info(f"{end-start} secs used to get market_index data...")
+# function to get the market index frame held for a signature, None if market_index changed
+def _cached_market_index(signature):
+    if signature is not None and signature == _market_index["signature"]:
+        logger.info("market_index unchanged, using the cached market index data...")
+        return _market_index["df"]
+    return None
+
+
+# function to read the market index frame for a signature. market_cap_mod is read from
+# market_index_norm, built by normalise.py after each scraper run, and only parsed here if that
+# table is out of date
+def _reload_market_index(signature) -> pl.DataFrame:
+    try:
+        df = read_frame(
+            "Select * from market_index_norm where source_signature = :signature",
+            params={"signature": signature},
+        ).drop("source_signature")
+    except Exception:
+        logger.exception("could not read market_index_norm")
+        df = None
+
+    if df is None or df.height == 0:
+        logger.warning("market_index_norm is out of date, parsing market_cap in process...")
+        df = normalise_market_index(read_frame("Select * from market_index"))
+
+    _market_index.update(signature=signature, df=df)
     return df
 
 
+# function to pick the signature query, the md5 of the table while table_versions is missing
+def _signature_query(present: bool) -> str:
+    if present:
+        _table_versions["present"] = True
+        return MARKET_INDEX_SIGNATURE_QUERY
+    if not _table_versions["warned"]:
+        _table_versions["warned"] = True
+        logger.warning(
+            "table_versions does not exist, hashing market_index to detect changes "
+            "(apply the migrations with python migrate.py)"
+        )
+    return MARKET_INDEX_HASH_QUERY
+
+
+# function to get the signature of market_index, changes whenever the table does
+def market_index_signature():
+    present = _table_versions["present"] or read_frame(TABLE_VERSIONS_QUERY)[0, 0]
+    return read_frame(_signature_query(present))[0, 0]
+
+
+# function to get data from market index table, only read again when market_index changed
+@stage("load", "market_index")
+def get_marketindex():
+    logger.debug(f"connecting to DB and grabing Market Index data...")
+    signature = market_index_signature()
+    df = _cached_market_index(signature)
+    return df if df is not None else _reload_market_index(signature)
+
+
 # generic function to get news article tables
-def get_news(
-    query: str, engine, index_col, dt_col, col_to_unique_on: list
-) -> pl.DataFrame:
-    df = (
-        pl.from_pandas(pd.read_sql(query, engine))
-        .lazy()
-        .drop(index_col)
-        .rename({dt_col: "date_time"})
-        .sort("date_time")
-        .unique(subset=[*col_to_unique_on], keep="first")
-        .collect()
-    )
-    return df
+def get_news(table: str) -> pl.DataFrame:
+    with stage("load", table):
+        return _rename_heading(load_incremental(table))
+
+
+# The Australian tables call the headline column heading
+def _rename_heading(df: pl.DataFrame) -> pl.DataFrame:
+    return df.rename({"heading": "headline"}) if "heading" in df.columns else df
+
+
+# function to get the bounded executor for concurrent table reads, re-created after a fork
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor, _executor_pid
+
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(
+                max_workers=cfg.fanout.max_workers, thread_name_prefix="db-fanout"
+            )
+            _executor_pid = os.getpid()
+    return _executor
+
+
+# function to fill in the sources that could not be read with the last frame the incremental
+# loader holds
+def _fill_missing(results: dict, missing: list):
+    for name in list(missing):
+        if name in _frames:
+            logger.warning(f"serving the last loaded {name} data instead")
+            results[name] = _rename_heading(_frames[name])
+            missing.remove(name)
 
 
-# function to get data from afr tables
-def get_afr():
+# function to run independent table reads concurrently, each with its own timeout.
+# a source that fails or times out falls back to the last frame the incremental loader holds,
+# otherwise it is reported as missing
+def fetch_concurrently(sources: dict) -> Tuple[dict, list]:
     start = time.time()
-    logger.debug(f"connecting to DB and grabing AFR data...")
-    # Get required database params
-    DATABASE_URL = (
-        "postgresql://"
-        + cfg.db.user
-        + ":"
-        + cfg.db.password
-        + "@"
-        + cfg.db.host
-        + ":"
-        + str(cfg.db.port)
-        + "/"
-        + cfg.db.name
-        + "?sslmode=require"
-    )
-    postgresql_engine = create_engine(DATABASE_URL)
+    executor = _get_executor()
+    with stage("fanout", "+".join(sources)) as timer:
+        # each read runs in a copy of this context, so its stages join the caller's trace
+        futures = {
+            name: executor.submit(contextvars.copy_context().run, fn)
+            for name, fn in sources.items()
+        }
+
+        results, missing = {}, []
+        for name, future in futures.items():
+            timeout = cfg.fanout.timeouts.get(name, cfg.fanout.default_timeout)
+            try:
+                results[name] = future.result(
+                    timeout=max(0, start + timeout - time.time())
+                )
+            except FuturesTimeoutError:
+                future.cancel()
+                logger.warning(f"{name} did not load within {timeout} secs")
+                missing.append(name)
+            except Exception:
+                logger.exception(f"failed to load {name}")
+                missing.append(name)
 
-    query_homepage = "Select * from afr_homepage"
-    query_afr_street_talk = "Select * from afr_street_talk"
+        _fill_missing(results, missing)
+
+    logger.info(f"{timer.seconds} secs used to fetch {list(sources)} concurrently")
+    return results, missing
 
-    df_afr_homepage = get_news(
-        query_homepage, postgresql_engine, "index", "extract_ts", ["headline"]
-    )
 
-    df_afr_street_talk = get_news(
-        query_afr_street_talk, postgresql_engine, "index", "extract_ts", ["headline"]
+# function to get all news tables at once
+def get_news_tables() -> Tuple[dict, list]:
+    return fetch_concurrently(
+        {table: partial(get_news, table) for table in NEWS_TABLES}
     )
 
-    postgresql_engine.dispose()
 
-    logger.info(f"memory being used: {get_mem()}")
+### async loaders, used by the asgi app ----
+# the reads go through the asyncpg pool and the polars work runs on the blocking executor, the
+# incremental state is shared with the sync loaders above (the scheduler thread keeps using them)
+
+
+# function to build a polars df from asyncpg rows, numeric columns come back as Decimal and
+# are made floats like connectorx returns them
+def records_frame(columns: list, rows: list) -> pl.DataFrame:
+    data = {}
+    for i, name in enumerate(columns):
+        values = [row[i] for row in rows]
+        if any(isinstance(v, Decimal) for v in values):
+            values = [None if v is None else float(v) for v in values]
+        data[name] = values
+    return pl.DataFrame(data)
+
+
+# function to run a query from a coroutine, through the sync readers if the async pool isn't open
+async def read_frame_async(query: str, params: dict = None) -> pl.DataFrame:
+    if not db_async.pool_ready():
+        return await run_blocking(read_frame, query, params)
+    with stage("query", "asyncpg"):
+        columns, rows = await db_async.fetch(query, params)
+        return await run_blocking(records_frame, columns, rows)
+
+
+def _with_table_lock(table: str, fn, *args):
+    with _table_locks[table]:
+        return fn(*args)
+
+
+# function to load a table incrementally from a coroutine. the table lock is only held to plan
+# and to apply the read (on the executor), not while the read is awaited; a sync load of the
+# same table in between is harmless as new rows are merged on the table's keys
+async def load_incremental_async(table: str) -> pl.DataFrame:
+    full, query, params = await run_blocking(_with_table_lock, table, _load_plan, table)
+    df_raw = await read_frame_async(query, params)
+    df = await run_blocking(_with_table_lock, table, _apply_load, table, full, df_raw)
+    if df is None:
+        df_raw = await read_frame_async(table_query(table))
+        df = await run_blocking(
+            _with_table_lock, table, _apply_load, table, True, df_raw
+        )
+    return df
 
-    end = time.time()
-    logger.info(f"{end-start} secs used to get afr data...")
-    return df_afr_homepage, df_afr_street_talk
 
+@stage("load", "announcements")
+async def get_hotcopper_async():
+    return await load_incremental_async("announcements")
 
-# function to get data from The Australian tables
-def get_aus():
-    start = time.time()
-    logger.debug(f"connecting to DB and grabing The Australian data...")
-    # Get required database params
-    DATABASE_URL = (
-        "postgresql://"
-        + cfg.db.user
-        + ":"
-        + cfg.db.password
-        + "@"
-        + cfg.db.host
-        + ":"
-        + str(cfg.db.port)
-        + "/"
-        + cfg.db.name
-        + "?sslmode=require"
+
+@stage("load", "market_index")
+async def get_marketindex_async():
+    present = (
+        _table_versions["present"]
+        or (await read_frame_async(TABLE_VERSIONS_QUERY))[0, 0]
+    )
+    signature = (await read_frame_async(_signature_query(present)))[0, 0]
+    df = _cached_market_index(signature)
+    if df is not None:
+        return df
+    # only after market_index changed, the reload reads through the sync pool on the executor
+    return await run_blocking(_reload_market_index, signature)
+
+
+async def get_news_async(table: str) -> pl.DataFrame:
+    with stage("load", table):
+        return _rename_heading(await load_incremental_async(table))
+
+
+# function to run independent async reads concurrently, same timeouts and fallback as
+# fetch_concurrently. sources maps names to coroutine functions
+async def fetch_concurrently_async(sources: dict) -> Tuple[dict, list]:
+    timer = stage("fanout", "+".join(sources))
+
+    async def fetch(name, fn):
+        timeout = cfg.fanout.timeouts.get(name, cfg.fanout.default_timeout)
+        try:
+            return await asyncio.wait_for(fn(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"{name} did not load within {timeout} secs")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception(f"failed to load {name}")
+        return None
+
+    with timer:
+        frames = await asyncio.gather(
+            *(fetch(name, fn) for name, fn in sources.items())
+        )
+
+        results, missing = {}, []
+        for name, df in zip(sources, frames):
+            if df is None:
+                missing.append(name)
+            else:
+                results[name] = df
+        _fill_missing(results, missing)
+
+    logger.info(f"{timer.seconds} secs used to fetch {list(sources)} concurrently")
+    return results, missing
+
+
+async def get_news_tables_async() -> Tuple[dict, list]:
+    return await fetch_concurrently_async(
+        {table: partial(get_news_async, table) for table in NEWS_TABLES}
     )
-    postgresql_engine = create_engine(DATABASE_URL)
-
-    query_aus_homepage = "Select * from aus_homepage"
-    query_aus_dataroom = "Select * from aus_dataroom"
-    query_aus_tradingday = "Select * from aus_tradingday"
-
-    df_aus_homepage = get_news(
-        query_aus_homepage, postgresql_engine, "index", "extract_ts", ["heading"]
-    ).rename({"heading": "headline"})
-
-    df_aus_dataroom = get_news(
-        query_aus_dataroom,
-        postgresql_engine,
-        "index",
-        "extract_ts",
-        ["heading", "summary"],
-    ).rename({"heading": "headline"})
-
-    df_aus_tradingday = get_news(
-        query_aus_tradingday,
-        postgresql_engine,
-        "index",
-        "extract_ts",
-        ["heading", "summary"],
-    ).rename({"heading": "headline"})
-
-    postgresql_engine.dispose()
-
-    logger.info(f"memory being used: {get_mem()}")
-
-    end = time.time()
-    logger.info(f"{end-start} secs used to get aus data...")
-    return df_aus_homepage, df_aus_dataroom, df_aus_tradingday
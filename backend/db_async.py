@@ -0,0 +1,136 @@
+# import libraries
+import logging
+import os
+import re
+import time
+
+import yaml
+from box import Box
+from db_pool import get_database_url
+
+try:
+    import asyncpg
+except ImportError:  # optional, async reads then go through the sync pool
+    asyncpg = None
+
+cfg = Box(yaml.safe_load(open("config_db.yml")))
+
+### set up logging and other params ----
+logger = logging.getLogger()
+
+# asyncpg pool of the asgi app, one per worker process, opened and closed with the app's
+# event loop
+_pool = None
+_pool_pid = None
+_stats = {}
+
+# :name bind parameters, not postgres' :: casts, also used by database._render_query
+BIND_PARAM = re.compile(r"(?<!:):([A-Za-z_]\w*)")
+
+
+def _reset_stats():
+    global _stats
+    _stats = {
+        "queries": 0,
+        "wait_time_total": 0.0,
+        "wait_time_max": 0.0,
+        "query_time_total": 0.0,
+    }
+
+
+# function to turn the :name parameters the sync readers use into asyncpg's $1, $2, ...
+def to_positional(query: str, params: dict = None) -> tuple:
+    params = params or {}
+    names = []
+
+    def replace(match):
+        name = match.group(1)
+        if name not in params:
+            return match.group(0)
+        if name not in names:
+            names.append(name)
+        return f"${names.index(name) + 1}"
+
+    return BIND_PARAM.sub(replace, query), [params[name] for name in names]
+
+
+def pool_ready() -> bool:
+    return _pool is not None and _pool_pid == os.getpid()
+
+
+# function to open the pool, on the app's startup
+async def open_pool():
+    global _pool, _pool_pid
+
+    if asyncpg is None:
+        logger.warning("asyncpg is not installed, async reads use the sync pool")
+        return
+    if pool_ready():
+        return
+    db_cfg = cfg.asgi.db
+    _reset_stats()
+    _pool = await asyncpg.create_pool(
+        get_database_url(),
+        min_size=db_cfg.min_size,
+        max_size=db_cfg.max_size,
+        command_timeout=db_cfg.command_timeout,
+        max_inactive_connection_lifetime=cfg.pool.recycle,
+    )
+    _pool_pid = os.getpid()
+    logger.info(
+        f"created async db pool for pid {os.getpid()}, size {db_cfg.min_size} to {db_cfg.max_size}"
+    )
+
+
+# function to close the pool, on the app's shutdown
+async def close_pool():
+    global _pool, _pool_pid
+
+    if pool_ready():
+        await _pool.close()
+    _pool = None
+    _pool_pid = None
+
+
+# function to run a query, returns (column names, rows)
+async def fetch(query: str, params: dict = None) -> tuple:
+    query, args = to_positional(query, params)
+    start = time.time()
+    async with _pool.acquire() as conn:
+        wait = time.time() - start
+        statement = await conn.prepare(query)
+        rows = await statement.fetch(*args)
+        columns = [attr.name for attr in statement.get_attributes()]
+    _stats["queries"] += 1
+    _stats["wait_time_total"] += wait
+    _stats["wait_time_max"] = max(_stats["wait_time_max"], wait)
+    _stats["query_time_total"] += time.time() - start - wait
+    return columns, rows
+
+
+# function to LISTEN on a postgres channel. the listener needs a connection of its own, a pooled
+# one would be handed to other queries; returns the connection, close it to stop listening
+async def listen(channel: str, callback, on_lost=None):
+    conn = await asyncpg.connect(get_database_url())
+    await conn.add_listener(channel, callback)
+    if on_lost is not None:
+        conn.add_termination_listener(on_lost)
+    return conn
+
+
+# function to return the pool metrics
+def async_pool_stats() -> dict:
+    if not pool_ready():
+        return {"pid": os.getpid(), "initialised": False}
+    stats = dict(_stats)
+    stats.update(
+        {
+            "pid": os.getpid(),
+            "initialised": True,
+            "size": _pool.get_size(),
+            "idle": _pool.get_idle_size(),
+            "min_size": _pool.get_min_size(),
+            "max_size": _pool.get_max_size(),
+        }
+    )
+    return stats
@@ -0,0 +1,173 @@
+# import libraries
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import yaml
+from box import Box
+from sqlalchemy import create_engine, event
+
+cfg = Box(yaml.safe_load(open("config_db.yml")))
+
+### set up logging and other params ----
+logger = logging.getLogger()
+
+# one engine per process, re-created after a fork so workers never share sockets
+_engine = None
+_engine_pid = None
+_engine_lock = threading.Lock()
+
+# pool-level counters, reset together with the engine
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+def _reset_stats():
+    global _stats
+    with _stats_lock:
+        _stats = {
+            "connects": 0,
+            "checkouts": 0,
+            "checkins": 0,
+            "invalidations": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "connection_age_max": 0.0,
+        }
+
+
+def _incr(key, value=1):
+    with _stats_lock:
+        _stats[key] += value
+
+
+# function to build the database url from config_db.yml
+def get_database_url() -> str:
+    return (
+        "postgresql://"
+        + cfg.db.user
+        + ":"
+        + cfg.db.password
+        + "@"
+        + cfg.db.host
+        + ":"
+        + str(cfg.db.port)
+        + "/"
+        + cfg.db.name
+        + "?sslmode="
+        + cfg.db.get("sslmode", "require")
+    )
+
+
+# attach listeners that feed the pool metrics
+def _register_pool_events(engine):
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        connection_record.info["created_at"] = time.time()
+        _incr("connects")
+
+    @event.listens_for(engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        age = time.time() - connection_record.info.get("created_at", time.time())
+        with _stats_lock:
+            _stats["checkouts"] += 1
+            _stats["connection_age_max"] = max(_stats["connection_age_max"], age)
+
+    @event.listens_for(engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        _incr("checkins")
+
+    @event.listens_for(engine, "invalidate")
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        _incr("invalidations")
+
+
+def _create_engine():
+    pool_cfg = cfg.pool
+    engine = create_engine(
+        get_database_url(),
+        pool_size=pool_cfg.size,
+        max_overflow=pool_cfg.max_overflow,
+        pool_timeout=pool_cfg.timeout,
+        pool_recycle=pool_cfg.recycle,
+        pool_pre_ping=pool_cfg.pre_ping,
+    )
+    _register_pool_events(engine)
+    logger.info(
+        f"created db pool for pid {os.getpid()}, size={pool_cfg.size}, max_overflow={pool_cfg.max_overflow}"
+    )
+    return engine
+
+
+# function to get the shared engine, fork-safe
+def get_engine():
+    global _engine, _engine_pid
+
+    pid = os.getpid()
+    if _engine is not None and _engine_pid == pid:
+        return _engine
+
+    with _engine_lock:
+        if _engine is not None and _engine_pid != pid:
+            # inherited from the parent process: drop the pooled sockets without closing them,
+            # the parent still owns them
+            _engine.dispose(close=False)
+            _engine = None
+        if _engine is None:
+            _reset_stats()
+            _engine = _create_engine()
+            _engine_pid = pid
+    return _engine
+
+
+# context manager to check a connection out of the pool, timing the wait
+@contextmanager
+def db_connection():
+    engine = get_engine()
+    start = time.time()
+    conn = engine.connect()
+    wait = time.time() - start
+    with _stats_lock:
+        _stats["wait_time_total"] += wait
+        _stats["wait_time_max"] = max(_stats["wait_time_max"], wait)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+# function to close the pool, e.g. on worker shutdown
+def dispose_engine():
+    global _engine, _engine_pid
+
+    with _engine_lock:
+        if _engine is not None:
+            _engine.dispose()
+        _engine = None
+        _engine_pid = None
+
+
+# function to return the pool metrics
+def pool_stats() -> dict:
+    if _engine is None or _engine_pid != os.getpid():
+        return {"pid": os.getpid(), "initialised": False}
+
+    pool = _engine.pool
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["wait_time_avg"] = (
+        stats["wait_time_total"] / stats["checkouts"] if stats["checkouts"] else 0.0
+    )
+    stats.update(
+        {
+            "pid": os.getpid(),
+            "initialised": True,
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+        }
+    )
+    return stats
@@ -1,5 +1,5 @@
 #!/bin/sh
 
-echo "Starting Quart ASGI Backend..."
+echo "Starting ASGI Backend (Starlette on uvicorn)..."
 
-python /usr/src/backend/app.py
\ No newline at end of file
+python /usr/src/backend/asgi.py
\ No newline at end of file
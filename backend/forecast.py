@@ -1,31 +1,22 @@
 # Import libraries
-import itertools
 import logging
-import math
-import os
-import random
-import sys
-import time
 from datetime import date
 from datetime import datetime as dt
 from datetime import timedelta
 from pathlib import Path
 
-import holidays
-import matplotlib.pyplot as plt
-import numpy as np
 import pandas as pd
-import polars as pl
-import regex as re
-import seaborn as sns
 import yaml
-import yfinance as yf
 from box import Box
 from dateutil.relativedelta import relativedelta
-import xgboost as xgb
-from sklearn.metrics import mean_absolute_error, mean_squared_error
+from forecast_engine import recursive_forecast
+from instrumentation import stage
+from model_registry import find_previous, get_model, save_model
+from price_store import get_prices
+from trainer import default_nthread, to_dmatrix, train_booster
 from utils.logging import set_up_logging
-from utils.global_functions import add_datepart, add_lags
+from utils.global_functions import add_datepart, add_lags_vectorised
+from utils.trading_calendar import asx_calendar
 
 cfg = Box(yaml.safe_load(open("config_db.yml")))
 
@@ -41,50 +32,34 @@ log_dir_exp.mkdir(parents=True, exist_ok=True)
 set_up_logging(logger, log_dir_exp / "logs.txt")  # appends to file by default if exists
 logging.getLogger("fbprophet").setLevel(logging.WARNING)
 
-# define date range to get holidays in between
-holiday_start = date(2023, 1, 1)
-holiday_end = date(2033, 1, 1)
+# hyperparameters of the forecast model, part of the model registry key. n_estimators is the most
+# boosting rounds, training stops once the validation rmse hasn't improved for
+# early_stopping_rounds
+XGB_PARAMS = {
+    "colsample_bytree": 0.9,
+    "learning_rate": 0.03,
+    "max_depth": 8,
+    "min_child_weight": 3,
+    "n_estimators": 200,
+    "subsample": 0.65,
+    "tree_method": "hist",
+    "early_stopping_rounds": 20,
+}
 
-
-# Get stock quote
-def get_stock_price(ticker, startdate, enddate) -> pd.DataFrame:
-    stock = yf.Ticker(ticker)
-    stock_df = pd.DataFrame(stock.history(start=startdate, end=enddate).reset_index())
-    stock_df["Date"] = stock_df["Date"].dt.tz_localize(None)
-    return stock_df
+# xgboost threads per model, None uses every core. batch workers lower it so that several
+# forecasts running side by side don't oversubscribe the cpus
+_nthread = None
 
 
-# Function to return holiday df
-def get_holiday() -> pd.DataFrame:
-    year_range = [year for year in range(holiday_start.year, holiday_end.year + 1)]
+def set_nthread(nthread):
+    global _nthread
 
-    holiday = pd.DataFrame([])
-    for date, name in sorted(holidays.Australia(years=year_range).items()):
-        holiday = holiday.append(
-            pd.DataFrame({"ds": date, "holiday": "AUS-Holidays"}, index=[0]),
-            ignore_index=True,
-        )
-    holiday["ds"] = pd.to_datetime(holiday["ds"], format="%Y-%m-%d", errors="ignore")
-    return holiday
+    _nthread = nthread
 
 
-def date_by_adding_business_days_l(from_date, add_days) -> list:
-    business_days_to_add = add_days
-    current_date = from_date
-    holidays_l = (
-        get_holiday()["ds"].apply(lambda x: dt.strftime(x, "%Y-%m-%d")).to_list()
-    )
-    future_date_l = []
-    while business_days_to_add > 0:
-        current_date += timedelta(days=1)
-        weekday = current_date.weekday()
-        if weekday >= 5:  # sunday = 6
-            continue
-        if dt.strftime(current_date, "%Y-%m-%d") in holidays_l:
-            continue
-        future_date_l.append(current_date)
-        business_days_to_add -= 1
-    return future_date_l
+# Get stock quote, from the local price store which only fetches bars it doesn't have yet
+def get_stock_price(ticker, startdate, enddate) -> pd.DataFrame:
+    return get_prices(ticker, startdate, enddate)
 
 
 # Function to get stock price for stock and split data into train and test
@@ -94,7 +69,7 @@ def create_dfs(df: pd.DataFrame, N: int):
     - this section is to generate some features for the xgboost regression model to predict the stock price
     """
     # add lags up to N number of days to use as features
-    df_lags = add_lags(df, N, ["close"])
+    df_lags = add_lags_vectorised(df, N, ["close"])
 
     """
         Shift label column and drop invalid samples
@@ -138,8 +113,82 @@ def create_dfs(df: pd.DataFrame, N: int):
     return X_train, y_train, X_val, y_val, X_test, y_test
 
 
+# function to get the model for a ticker from the registry, or fit it. a model trained on the same
+# data (i.e. earlier the same trading day) is reused as is, and one trained on data only a few
+# bars older is boosted further with xgb_model= instead of being refit from scratch, as long as
+# that keeps it within max_rounds. returns (booster, fit stats)
+def get_or_fit_model(
+    ticker: str, data_end_date, stock_df, X_train, y_train, X_val, y_val
+) -> tuple:
+    nthread = _nthread or default_nthread()
+    model = get_model(ticker, data_end_date, XGB_PARAMS, nthread)
+    if model is not None:
+        return model, {"source": "registry", "rounds": model.num_boosted_rounds()}
+
+    # the feature matrices are converted once and used for training and early stopping
+    dtrain = to_dmatrix(X_train, y_train, nthread)
+    dval = to_dmatrix(X_val, y_val, nthread)
+
+    previous_end_date, previous_model = find_previous(
+        ticker, data_end_date, XGB_PARAMS, nthread
+    )
+    new_bars = (
+        (stock_df["date"].dt.date > previous_end_date).sum()
+        if previous_end_date
+        else None
+    )
+    # every warm start adds trees, past max_rounds the model is refit from scratch
+    too_deep = (
+        previous_model is not None
+        and previous_model.num_boosted_rounds()
+        + cfg.forecast.registry.warm_start_rounds
+        > cfg.forecast.registry.max_rounds
+    )
+    if too_deep:
+        logger.info(
+            f"the {ticker} model from {previous_end_date} has "
+            f"{previous_model.num_boosted_rounds()} rounds, refitting it"
+        )
+
+    if (
+        new_bars is not None
+        and new_bars <= cfg.forecast.registry.max_new_bars
+        and not too_deep
+    ):
+        logger.info(
+            f"continuing the {ticker} model from {previous_end_date}, {new_bars} new bars"
+        )
+        with stage("fit", "warm_start", ticker=ticker):
+            model, fit = train_booster(
+                XGB_PARAMS,
+                dtrain,
+                dval,
+                cfg.forecast.registry.warm_start_rounds,
+                nthread,
+                xgb_model=previous_model,
+            )
+        fit["source"] = "warm_start"
+    else:
+        with stage("fit", "full_fit", ticker=ticker):
+            model, fit = train_booster(
+                XGB_PARAMS, dtrain, dval, XGB_PARAMS["n_estimators"], nthread
+            )
+        fit["source"] = "full_fit"
+    logger.info(
+        f"{fit['source']} of the {ticker} model took {fit['fit_secs']:.3f} secs "
+        f"({fit['cpu_secs']:.3f} cpu secs, {fit['nthread']} threads), "
+        f"{fit['new_rounds']} rounds added, {fit['rounds']} in total, "
+        f"val rmse {fit['val_rmse']:.4f}"
+    )
+
+    save_model(model, ticker, data_end_date, XGB_PARAMS)
+    return model, fit
+
+
 # def main():
-def do_forecast(ticker: str) -> pl.DataFrame:
+# returns the history and forecast as a list of dicts, and with return_fit=True also how the
+# model was obtained (see get_or_fit_model)
+def do_forecast(ticker: str, horizon: int = 4, return_fit: bool = False):
     ticker_code = ticker
 
     # variables
@@ -183,39 +232,25 @@ def do_forecast(ticker: str) -> pl.DataFrame:
     logger.info(f"the shape for X_val is {X_val.shape}")
     logger.info(f"the shape for df_test is {X_test.shape}")
 
-    start = time.time()
-    eval_set = [(X_train, y_train), (X_val, y_val)]
-    model = xgb.XGBRegressor(
-        colsample_bytree=0.9,
-        learning_rate=0.03,
-        max_depth=8,
-        min_child_weight=3,
-        n_estimators=200,
-        subsample=0.65,
+    data_end_date = stock_df_mod["date"].max().date()
+    model, fit = get_or_fit_model(
+        ticker_code, data_end_date, stock_df_mod, X_train, y_train, X_val, y_val
     )
 
-    model.fit(X_train, y_train, eval_set=eval_set, verbose=True)
-
-    # Forecast 3 business days into future
-    future = date_by_adding_business_days_l(
-        prev_date - timedelta(days=1), 4
+    # Forecast horizon trading days, today included
+    future = asx_calendar().next_trading_days(
+        prev_date - timedelta(days=1), horizon
     )  # here we need to do prev_date - timedelta(days=1) because we still want to forecast for the current day (i.e. today)
-    df_future = pd.DataFrame(future, columns=["date"])
-
-    df_future_pred = pd.concat([stock_df_mod, df_future], axis=0).reset_index(drop=True)
-    df_future_pred_lags = add_lags(df_future_pred, N, ["close"])
-    drop_cols = ["date", "order_day"]
-    df_future_pred_lags = df_future_pred_lags.drop(drop_cols, axis=1)
-    X_future_pred = df_future_pred_lags.drop(["close"], axis=1)[-4:]
 
-    # NOTE: Can only predict next day good, subsequent dates aren't great...
-    forecast = model.predict(X_future_pred)
-    df_forecast = df_future_pred[-4:].copy()
-    df_forecast["close"] = forecast
+    # predict one trading day at a time, each prediction becomes a lag of the following days
+    with stage("predict", ticker=ticker_code, horizon=horizon) as timer:
+        forecast = recursive_forecast(
+            [model], [stock_df_mod["close"].to_numpy()], N, horizon
+        )[0]
+    df_forecast = pd.DataFrame({"date": future, "close": forecast})
 
     logger.info(f"prediction for the next day is {forecast[0]}")
-    end = time.time()
-    logger.info(f"XGB regression model and prediction took {end-start} seconds")
+    logger.info(f"XGB regression prediction took {timer.seconds} seconds")
 
     # wrangle dataframe to return
     df_hist = stock_df[["Date", "Close"]].rename(
@@ -228,6 +263,8 @@ def do_forecast(ticker: str) -> pl.DataFrame:
     # convert the pandas df into a list of dict
     df_full_dict = df_full.to_dict("records")
 
+    if return_fit:
+        return df_full_dict, fit
     return df_full_dict
 
 
@@ -0,0 +1,125 @@
+# import libraries
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, TimeoutError, as_completed
+
+import yaml
+from box import Box
+from instrumentation import set_role, stage
+
+cfg = Box(yaml.safe_load(open("config_db.yml")))
+
+### set up logging and other params ----
+logger = logging.getLogger()
+
+# forecasts are cpu bound (feature building, xgboost training), so a batch is fanned out over
+# a process pool. each process runs one forecast at a time with nthread xgboost threads, so
+# max_workers * nthread should stay within the cores of the host
+_executor = None
+_executor_pid = None
+
+
+# function to work out the xgboost threads per forecast process
+def batch_nthread(max_workers: int) -> int:
+    if cfg.forecast.batch.nthread:
+        return cfg.forecast.batch.nthread
+    return max(1, (os.cpu_count() or 1) // max_workers)
+
+
+def _init_worker(nthread: int, price_fixture_dir=None):
+    # the forecast module is imported here, in the worker, rather than in every web process
+    from flask import Flask
+    from forecast import set_nthread
+    from forecast_jobs import init_jobs
+
+    set_role("forecast")
+    set_nthread(nthread)
+    init_jobs(Flask("forecast_worker"))
+    if price_fixture_dir is not None:
+        from price_store import FixtureSource, set_source
+
+        set_source(FixtureSource(price_fixture_dir))
+
+
+def _run_forecast(ticker: str):
+    from forecast import do_forecast
+
+    with stage("forecast", ticker=ticker) as timer:
+        items, fit = do_forecast(ticker, return_fit=True)
+    return items, fit, timer.seconds
+
+
+# function to create a forecast process pool. processes are spawned rather than forked, as the
+# web workers run threads (scheduler, db fan-out) that a fork would copy mid-flight
+def make_executor(
+    max_workers: int, nthread: int = None, price_fixture_dir=None
+) -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context(cfg.forecast.batch.start_method),
+        initializer=_init_worker,
+        initargs=(nthread or batch_nthread(max_workers), price_fixture_dir),
+    )
+
+
+# function to get this process' forecast pool, created on first use and again if one of its
+# processes died (which breaks the whole pool)
+def get_executor() -> ProcessPoolExecutor:
+    global _executor, _executor_pid
+
+    if (
+        _executor is None
+        or _executor_pid != os.getpid()
+        or getattr(_executor, "_broken", False)
+    ):
+        _executor = make_executor(cfg.forecast.batch.max_workers)
+        _executor_pid = os.getpid()
+    return _executor
+
+
+# function to validate the tickers of a batch request, raises ValueError on bad input
+def parse_tickers(body) -> list:
+    tickers = (body or {}).get("tickers")
+    if not isinstance(tickers, list) or not tickers:
+        raise ValueError("tickers must be a non-empty list")
+    if not all(isinstance(t, str) and t.strip() for t in tickers):
+        raise ValueError("tickers must be non-empty strings")
+
+    # keep the order of the request, without repeats
+    tickers = list(dict.fromkeys(t.strip().upper() for t in tickers))
+    if len(tickers) > cfg.forecast.batch.max_tickers:
+        raise ValueError(f"at most {cfg.forecast.batch.max_tickers} tickers per batch")
+    return tickers
+
+
+# function to forecast a list of tickers, yielding a result per ticker as soon as it is done
+def forecast_batch(tickers: list, executor: ProcessPoolExecutor = None, timeout=None):
+    executor = executor or get_executor()
+    timeout = timeout or cfg.forecast.batch.timeout
+    futures = {executor.submit(_run_forecast, ticker): ticker for ticker in tickers}
+
+    pending = set(futures)
+    try:
+        for future in as_completed(futures, timeout=timeout):
+            pending.discard(future)
+            ticker = futures[future]
+            try:
+                items, fit, elapsed = future.result()
+                yield {
+                    "ticker": ticker,
+                    "status": "ok",
+                    "elapsed": elapsed,
+                    "fit": fit,
+                    "items": items,
+                }
+            except Exception as e:
+                logger.exception(f"forecast for {ticker} failed")
+                yield {"ticker": ticker, "status": "error", "error": repr(e)}
+    except TimeoutError:
+        for future in pending:
+            yield {"ticker": futures[future], "status": "error", "error": "timed out"}
+    finally:
+        # the client went away or the batch timed out, don't start what is still queued
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,46 @@
+# import libraries
+import numpy as np
+
+"""
+    recursive multi-step forecasting on lag features
+
+    the model is trained on rows whose features are close_lag_1 ... close_lag_N (the N closes
+    before the row) and whose label is the next row's close, i.e. f(close[t-1] ... close[t-N])
+    = close[t+1]. so the close of step h after the last bar T comes from the closes
+    T+h-2 ... T+h-1-N, and from step 3 on some of those are earlier predictions.
+
+    every series keeps a buffer of its last N+1 closes followed by room for its predictions,
+    each step reads the N lags of every series from it, predicts them in one call per model
+    and writes the predictions back, so a step costs O(series x N) whatever the history length
+"""
+
+
+# function to forecast horizon steps ahead for many series at once. boosters[i] is the model of
+# histories[i] (series may share a model, their rows are then predicted together), returns an
+# array of shape (n_series, horizon)
+def recursive_forecast(boosters: list, histories: list, N: int, horizon: int):
+    n_series = len(histories)
+    if len(boosters) != n_series:
+        raise ValueError("need one booster per history")
+
+    buffer = np.empty((n_series, N + 1 + horizon), dtype=np.float32)
+    for i, history in enumerate(histories):
+        history = np.asarray(history, dtype=np.float32)
+        if len(history) < N + 1:
+            raise ValueError(f"need at least {N + 1} closes, got {len(history)}")
+        buffer[i, : N + 1] = history[-(N + 1) :]
+
+    # rows predicted by each distinct model
+    groups = {}
+    for i, booster in enumerate(boosters):
+        groups.setdefault(id(booster), (booster, []))[1].append(i)
+    groups = [(booster, np.array(rows)) for booster, rows in groups.values()]
+
+    features = np.empty((n_series, N), dtype=np.float32)
+    for h in range(1, horizon + 1):
+        # lag_1 ... lag_N of step h are buffer[h + N - 2] ... buffer[h - 1]
+        features[:] = buffer[:, h - 1 : h - 1 + N][:, ::-1]
+        for booster, rows in groups:
+            buffer[rows, N + h] = booster.inplace_predict(features[rows])
+
+    return buffer[:, N + 1 :].copy()
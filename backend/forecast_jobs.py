@@ -0,0 +1,273 @@
+# import libraries
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+
+import yaml
+from box import Box
+from cache import host_lock
+from flask_caching import Cache
+from forecast_batch import get_executor
+from instrumentation import stage
+from offload import run_blocking
+
+cfg = Box(yaml.safe_load(open("config_db.yml")))
+
+### set up logging and other params ----
+logger = logging.getLogger()
+
+# forecast jobs run in the forecast process pool, not in the request thread. the job records
+# live in their own shared cache (not the payload cache, so they never evict payloads), which
+# lets any gunicorn worker report on a job submitted through another one
+jobs = Cache()
+_app = None
+
+ACTIVE = ("queued", "running")
+
+# futures of the jobs submitted from this process, to cancel jobs that haven't started
+_futures = {}
+_futures_lock = threading.Lock()
+
+
+class QueueFull(Exception):
+    pass
+
+
+def _job_key(job_id: str) -> str:
+    return f"forecast_job:{job_id}"
+
+
+# at most one job per ticker and horizon is queued or running at a time, identical requests
+# share it. the claim is only read, set and deleted under host_lock of the key: the job store's
+# add is not atomic on the file system backend
+def _inflight_key(ticker: str, horizon: int) -> str:
+    return f"forecast_inflight:{ticker}:{horizon}"
+
+
+# function to validate the ticker and horizon of a forecast request (query string or json
+# body), raises ValueError on bad input
+def parse_forecast_args(args) -> tuple:
+    ticker = args.get("ticker")
+    if not isinstance(ticker, str) or not ticker.strip():
+        raise ValueError("Ticker code not provided")
+
+    horizon = args.get("horizon", cfg.forecast.horizon)
+    try:
+        horizon = int(horizon)
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid horizon {horizon!r}")
+    if not 1 <= horizon <= cfg.forecast.max_horizon:
+        raise ValueError(f"horizon must be between 1 and {cfg.forecast.max_horizon}")
+    return ticker.strip().upper(), horizon
+
+
+# function to attach the job store to a flask app, the web app or the pool processes' own
+def init_jobs(app):
+    global _app
+
+    jobs.init_app(app, config=cfg.forecast.jobs.backend.to_dict())
+    jobs.app = app
+    _app = app
+
+
+def _save(job: dict):
+    jobs.set(_job_key(job["id"]), job, timeout=cfg.forecast.jobs.result_ttl)
+
+
+# url to poll a job at, handed back with 202 responses
+def job_url(job_id: str) -> str:
+    return f"/api/forecast/jobs/{job_id}"
+
+
+def _timed_out(job: dict) -> bool:
+    return (
+        job["status"] in ACTIVE
+        and time.time() - job["submitted_at"] > cfg.forecast.jobs.max_runtime
+    )
+
+
+# function to get a job record, None if unknown or expired. a job that has been active
+# for longer than max_runtime is reported as failed, its process is stuck or gone (the
+# submitting process records that too, see reap_stale_jobs)
+def get_job(job_id: str):
+    job = jobs.get(_job_key(job_id))
+    if job is not None and _timed_out(job):
+        job = {**job, "status": "failed", "error": "timed out"}
+    return job
+
+
+def _release(job: dict):
+    key = _inflight_key(job["ticker"], job["horizon"])
+    with host_lock(key):
+        if jobs.get(key) == job["id"]:
+            jobs.delete(key)
+
+
+# function to record how a job ended, unless it was cancelled or timed out in the meantime
+def _finish(job_id: str, **fields):
+    job = jobs.get(_job_key(job_id))
+    if job is None:
+        return
+    if job["status"] in ACTIVE:
+        _save({**job, **fields, "finished_at": time.time()})
+    _release(job)
+
+
+# runs in a pool process
+def _run_job(job_id: str):
+    from forecast import do_forecast
+
+    with _app.app_context():
+        job = jobs.get(_job_key(job_id))
+        if job is None or job["status"] not in ACTIVE:
+            return
+        # queued behind stuck jobs for longer than a job may take, not worth starting
+        if _timed_out(job):
+            _finish(job_id, status="failed", error="timed out")
+            return
+        _save({**job, "status": "running", "started_at": time.time()})
+        try:
+            with stage("forecast", ticker=job["ticker"], job_id=job_id):
+                items, fit = do_forecast(job["ticker"], job["horizon"], return_fit=True)
+        except Exception as e:
+            logger.exception(f"forecast job {job_id} for {job['ticker']} failed")
+            _finish(job_id, status="failed", error=repr(e))
+            return
+        _finish(job_id, status="done", result=items, fit=fit)
+
+
+# runs in the web process when a job's future is done
+def _on_done(job_id: str, future):
+    with _futures_lock:
+        _futures.pop(job_id, None)
+    if future.cancelled():
+        return
+    # _run_job records its own errors, this is the pool process dying under it
+    error = future.exception()
+    if error is not None:
+        with _app.app_context():
+            _finish(job_id, status="failed", error=repr(error))
+
+
+# function to fail the jobs submitted from this process that have been active for longer than
+# max_runtime, so they free their ticker and stop counting towards max_queued
+def reap_stale_jobs():
+    with _futures_lock:
+        job_ids = list(_futures)
+    for job_id in job_ids:
+        job = jobs.get(_job_key(job_id))
+        if job is not None and not _timed_out(job):
+            continue
+        with _futures_lock:
+            future = _futures.pop(job_id, None)
+        if future is not None:
+            future.cancel()
+        if job is not None:
+            logger.warning(f"forecast job {job_id} for {job['ticker']} timed out")
+            _finish(job_id, status="failed", error="timed out")
+
+
+# function to queue a forecast, returns (job, whether it was created). a ticker and horizon
+# that already have a queued or running job get that job back
+def submit_job(ticker: str, horizon: int = None):
+    ticker = ticker.strip().upper()
+    horizon = horizon or cfg.forecast.horizon
+    key = _inflight_key(ticker, horizon)
+    reap_stale_jobs()
+
+    with host_lock(key):
+        inflight_id = jobs.get(key)
+        if inflight_id is not None:
+            job = get_job(inflight_id)
+            if job is not None and job["status"] in ACTIVE:
+                return job, False
+
+        with _futures_lock:
+            if len(_futures) >= cfg.forecast.jobs.max_queued:
+                raise QueueFull(f"{len(_futures)} forecast jobs are already queued")
+
+        job = {
+            "id": uuid.uuid4().hex,
+            "ticker": ticker,
+            "horizon": horizon,
+            "status": "queued",
+            "submitted_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+            "fit": None,
+            "error": None,
+        }
+        # the record is saved before claiming the ticker, so whoever sees the claim can read it.
+        # the claim replaces the one of a finished job
+        _save(job)
+        jobs.set(key, job["id"], timeout=cfg.forecast.jobs.max_runtime)
+
+    future = get_executor().submit(_run_job, job["id"])
+    with _futures_lock:
+        _futures[job["id"]] = future
+    future.add_done_callback(lambda f: _on_done(job["id"], f))
+    logger.info(f"queued forecast job {job['id']} for {ticker}")
+    return job, True
+
+
+# function to cancel a job. a queued job never runs; a running one can't be interrupted
+# (its process finishes the forecast) but its result is dropped. returns None if unknown
+def cancel_job(job_id: str):
+    job = get_job(job_id)
+    if job is None or job["status"] not in ACTIVE:
+        return job
+
+    with _futures_lock:
+        future = _futures.get(job_id)
+    if future is not None:
+        future.cancel()
+
+    job = {**job, "status": "cancelled", "finished_at": time.time()}
+    _save(job)
+    _release(job)
+    logger.info(f"cancelled forecast job {job_id} for {job['ticker']}")
+    return job
+
+
+# function to wait for a job to finish, returns the job as it is at the end of the wait
+def wait_for_job(job_id: str, timeout: float):
+    deadline = time.time() + timeout
+    with _futures_lock:
+        future = _futures.get(job_id)
+    # a job submitted from this process can be waited on directly
+    if future is not None:
+        try:
+            future.result(timeout=timeout)
+        except Exception:
+            pass
+
+    job = get_job(job_id)
+    while job is not None and job["status"] in ACTIVE and time.time() < deadline:
+        time.sleep(cfg.forecast.jobs.poll_interval)
+        job = get_job(job_id)
+    return job
+
+
+# function to wait for a job from a coroutine, same as wait_for_job
+async def wait_for_job_async(job_id: str, timeout: float):
+    deadline = time.time() + timeout
+    with _futures_lock:
+        future = _futures.get(job_id)
+    if future is not None:
+        try:
+            # shielded, a wait that times out mustn't cancel the job
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            pass
+
+    job = await run_blocking(get_job, job_id)
+    while job is not None and job["status"] in ACTIVE and time.time() < deadline:
+        await asyncio.sleep(cfg.forecast.jobs.poll_interval)
+        job = await run_blocking(get_job, job_id)
+    return job
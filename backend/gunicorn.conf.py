@@ -0,0 +1,68 @@
+# import libraries
+import gc
+import os
+import sys
+
+import yaml
+from box import Box
+
+cfg = Box(yaml.safe_load(open("config_db.yml")))
+
+"""
+    gunicorn settings, picked up from the working directory
+
+        gunicorn asgi:app    (or app:app with worker_class sync)
+
+    with preload the app is imported once in the master and every worker is forked from it.
+    the imports (polars, flask, sqlalchemy, ...) are then paid once, and the workers share the
+    master's memory pages until they write to them. to keep those pages shared:
+    - the master starts no threads, the scheduler is started per worker in post_fork
+    - the garbage collector is off while the app is imported. once it is loaded its objects
+      are frozen (and again before each fork) and the master collects as usual from then on.
+      collections never scan frozen objects, so they don't write to the shared pages in the
+      master or the workers
+    - db pools and executors are created on first use and re-created when the pid changes
+      (db_pool, offload, forecast_batch), so nothing opened in the master is shared
+"""
+
+bind = f"{cfg.asgi.host}:{cfg.asgi.port}"
+workers = cfg.asgi.workers
+worker_class = cfg.gunicorn.worker_class
+timeout = cfg.gunicorn.timeout
+preload_app = cfg.gunicorn.preload
+
+if preload_app:
+    # read by scheduler.start_scheduler (PRELOAD_MASTER_ENV), the master doesn't run it
+    os.environ["STOCK_APP_PRELOAD_MASTER"] = str(os.getpid())
+    gc.disable()
+
+
+def on_starting(server):
+    # the metrics files of an earlier run, see instrumentation.py
+    from instrumentation import clear_metrics
+
+    clear_metrics()
+
+
+# the app is loaded (preloaded apps are imported before this hook), the workers not forked yet
+def when_ready(server):
+    if preload_app:
+        gc.freeze()
+        gc.enable()
+
+
+def pre_fork(server, worker):
+    if preload_app:
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    if not preload_app:
+        return
+    gc.enable()
+    # the app is already imported when it was preloaded, start this worker's scheduler
+    if "app" in sys.modules:
+        from app import app
+        from scheduler import start_scheduler
+
+        start_scheduler(app)
@@ -0,0 +1,496 @@
+# import libraries
+import atexit
+import contextvars
+import fcntl
+import inspect
+import json
+import logging
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+from pathlib import Path
+
+import psutil
+import yaml
+from box import Box
+from flask import g, request
+from utils.util import get_mem
+
+cfg = Box(yaml.safe_load(open("config_db.yml")))
+
+### set up logging and other params ----
+logger = logging.getLogger()
+
+"""
+    metrics and traces of the backend
+
+    stage() times a block, as a context manager or a decorator (of functions or coroutines):
+
+        with stage("load", "announcements") as timer:
+            ...
+        logger.info(f"{timer.seconds} secs used to ...")
+
+        @stage("fit")
+        def train_booster(...):
+
+    each stage is observed in the stage_duration_seconds histogram (labels stage and name, so
+    keep name to a handful of values; anything per request such as a ticker goes in the span
+    attributes) and recorded as a span of the current trace. requests are traced by
+    init_metrics (flask) and MetricsMiddleware (asgi), other work (the scheduler, the forecast
+    processes) starts a trace of its own.
+
+    every process keeps its histograms in memory and writes them to cfg.metrics.dir/<pid>.json
+    at most every flush_interval seconds, so GET /metrics on any worker merges all the web
+    workers, the scheduler and the forecast processes (prometheus text format). the files of
+    processes that exited are kept so counters don't go back, the directory is cleared when the
+    server starts (clear_metrics).
+
+    finished traces (a sample_rate share of them) are appended to cfg.tracing.file, one
+    OTLP/JSON ExportTraceServiceRequest per line, which the opentelemetry collector's
+    otlpjsonfile receiver reads. the file is rotated at max_bytes
+"""
+
+STAGE_METRIC = "stage_duration_seconds"
+REQUEST_METRIC = "http_request_duration_seconds"
+METRIC_HELP = {
+    STAGE_METRIC: "Time spent in each stage: loaders, queries, joins, serialisation, "
+    "price fetches, model fits and predictions",
+    REQUEST_METRIC: "Time from a request arriving to its response starting",
+}
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+
+# this process' histograms, (metric, labels) -> cumulative bucket counts, sum, count, errors
+_histograms = {}
+_lock = threading.Lock()
+_last_flush = 0.0
+# what this process does, web or forecast, a label of its memory gauge
+_role = "web"
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_export_lock = threading.Lock()
+
+
+def set_role(role: str):
+    global _role
+
+    _role = role
+
+
+### metrics ----
+# function to add one observation to a histogram of this process
+def observe(metric: str, seconds: float, labels: dict, error: bool = False):
+    if not cfg.metrics.enabled:
+        return
+    key = (metric, tuple(sorted(labels.items())))
+    buckets = cfg.metrics.buckets
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = {"buckets": [0] * len(buckets), "sum": 0.0, "count": 0, "errors": 0}
+            _histograms[key] = hist
+        for i in range(bisect_left(buckets, seconds), len(buckets)):
+            hist["buckets"][i] += 1
+        hist["sum"] += seconds
+        hist["count"] += 1
+        hist["errors"] += int(error)
+    if time.monotonic() - _last_flush > cfg.metrics.flush_interval:
+        flush_metrics()
+
+
+def _metrics_path(pid: int) -> Path:
+    return Path(cfg.metrics.dir) / f"{pid}.json"
+
+
+# function to write this process' histograms and memory for /metrics to read
+def flush_metrics():
+    global _last_flush
+
+    if not cfg.metrics.enabled or not _histograms:
+        return
+    with _lock:
+        histograms = [
+            [metric, labels, {**hist, "buckets": list(hist["buckets"])}]
+            for (metric, labels), hist in _histograms.items()
+        ]
+        _last_flush = time.monotonic()
+    data = {
+        "pid": os.getpid(),
+        "role": _role,
+        "rss": psutil.Process().memory_info().rss,
+        "histograms": histograms,
+    }
+    path = _metrics_path(os.getpid())
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(data))
+        os.replace(tmp_path, path)
+    except OSError:
+        logger.exception("could not write the metrics of this process")
+
+
+atexit.register(flush_metrics)
+
+
+# function to remove the metrics of earlier runs, when the server starts
+def clear_metrics():
+    for path in Path(cfg.metrics.dir).glob("*.json"):
+        path.unlink()
+
+
+def _read_processes() -> list:
+    flush_metrics()
+    processes = []
+    for path in Path(cfg.metrics.dir).glob("*.json"):
+        try:
+            processes.append(json.loads(path.read_text()))
+        except (OSError, ValueError):
+            continue
+    return processes
+
+
+def _format_labels(labels) -> str:
+    return ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+        for k, v in labels
+    )
+
+
+# function to render the merged metrics of every process in the prometheus text format
+def metrics_text() -> str:
+    processes = _read_processes()
+    merged = {}
+    for process in processes:
+        for metric, labels, hist in process["histograms"]:
+            key = (metric, tuple(tuple(label) for label in labels))
+            total = merged.setdefault(
+                key,
+                {
+                    "buckets": [0] * len(hist["buckets"]),
+                    "sum": 0.0,
+                    "count": 0,
+                    "errors": 0,
+                },
+            )
+            total["buckets"] = [
+                a + b for a, b in zip(total["buckets"], hist["buckets"])
+            ]
+            total["sum"] += hist["sum"]
+            total["count"] += hist["count"]
+            total["errors"] += hist["errors"]
+
+    lines = []
+    for metric, help_text in METRIC_HELP.items():
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} histogram"]
+        for (name, labels), hist in sorted(merged.items()):
+            if name != metric:
+                continue
+            for bound, count in zip(cfg.metrics.buckets, hist["buckets"]):
+                le = _format_labels(labels + (("le", bound),))
+                lines.append(f"{metric}_bucket{{{le}}} {count}")
+            le = _format_labels(labels + (("le", "+Inf"),))
+            lines.append(f"{metric}_bucket{{{le}}} {hist['count']}")
+            lines.append(f"{metric}_sum{{{_format_labels(labels)}}} {hist['sum']}")
+            lines.append(f"{metric}_count{{{_format_labels(labels)}}} {hist['count']}")
+
+    lines += [
+        "# HELP stage_errors_total Stages that raised",
+        "# TYPE stage_errors_total counter",
+    ]
+    for (name, labels), hist in sorted(merged.items()):
+        if name == STAGE_METRIC:
+            lines.append(
+                f"stage_errors_total{{{_format_labels(labels)}}} {hist['errors']}"
+            )
+
+    lines += [
+        "# HELP process_resident_memory_bytes Resident memory of each running process",
+        "# TYPE process_resident_memory_bytes gauge",
+    ]
+    for process in sorted(processes, key=lambda p: p["pid"]):
+        if psutil.pid_exists(process["pid"]):
+            labels = _format_labels(
+                (("pid", process["pid"]), ("role", process["role"]))
+            )
+            lines.append(f"process_resident_memory_bytes{{{labels}}} {process['rss']}")
+    return "\n".join(lines) + "\n"
+
+
+### memory ----
+# sample this process' rss (in MB, through utils.util.get_mem) in the background and keep the
+# highest value seen, for the benchmarks and backtests to report the peak of a block
+class PeakMemSampler:
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = get_mem()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, get_mem())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, get_mem())
+
+
+### tracing ----
+class _Trace:
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.sampled = cfg.tracing.enabled and random.random() < cfg.tracing.sample_rate
+        self.spans = []
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: dict) -> list:
+    return [
+        {"key": k, "value": _otlp_value(v)}
+        for k, v in attributes.items()
+        if v is not None
+    ]
+
+
+# a span of the current trace, or the root of a new one. start() makes it the parent of the
+# spans started after it in the same context, end() records it
+class Span:
+    def __init__(self, name: str, attributes: dict = None, kind=SPAN_KIND_INTERNAL):
+        parent = _current_span.get()
+        self.trace = parent.trace if parent is not None else _Trace()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.span_id = os.urandom(8).hex()
+        self.name = name
+        self.attributes = attributes or {}
+        self.kind = kind
+        self._token = None
+
+    def start(self):
+        self.start_ns = time.time_ns()
+        self._token = _current_span.set(self)
+        return self
+
+    def end(self, error: BaseException = None):
+        end_ns = time.time_ns()
+        _current_span.reset(self._token)
+        if not self.trace.sampled:
+            return
+        span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(end_ns),
+            "attributes": _otlp_attributes(self.attributes),
+        }
+        if error is not None:
+            span["status"] = {"code": 2, "message": repr(error)}
+        self.trace.spans.append(span)
+        # a trace is written once its root ends
+        if self.parent_id is None:
+            _export(self.trace.spans)
+
+
+# function to move the trace file aside once it reached max_bytes, keeping backup_count of
+# them. the workers share the file, so the rotation holds a lock file and checks the size again
+# (another process may have just rotated it); writers open the file per trace and so never
+# keep appending to a rotated one
+def _rotate(path: Path):
+    with open(path.with_name(f"{path.name}.lock"), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            if path.stat().st_size < cfg.tracing.max_bytes:
+                return
+        except FileNotFoundError:
+            return
+        for i in range(cfg.tracing.backup_count - 1, 0, -1):
+            older = path.with_name(f"{path.name}.{i}")
+            if older.exists():
+                os.replace(older, path.with_name(f"{path.name}.{i + 1}"))
+        if cfg.tracing.backup_count > 0:
+            os.replace(path, path.with_name(f"{path.name}.1"))
+        else:
+            path.unlink()
+
+
+# function to append the spans of a trace to the trace file
+def _export(spans: list):
+    resource = {
+        "service.name": cfg.tracing.service_name,
+        "process.pid": os.getpid(),
+        "process.role": _role,
+    }
+    line = json.dumps(
+        {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": _otlp_attributes(resource)},
+                    "scopeSpans": [
+                        {"scope": {"name": "instrumentation"}, "spans": spans}
+                    ],
+                }
+            ]
+        }
+    )
+    path = Path(cfg.tracing.file)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # one append per trace, the workers share the file
+        with _export_lock:
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, (line + "\n").encode())
+                size = os.fstat(fd).st_size
+            finally:
+                os.close(fd)
+        if size >= cfg.tracing.max_bytes:
+            _rotate(path)
+    except OSError:
+        logger.exception("could not write the trace")
+
+
+### stages ----
+class Stage:
+    def __init__(self, stage: str, name: str = "", **attributes):
+        self.stage = stage
+        self.name = name
+        self.attributes = attributes
+        self.seconds = None
+
+    def __enter__(self):
+        span_name = f"{self.stage} {self.name}".strip()
+        attributes = {"stage": self.stage, "name": self.name, **self.attributes}
+        self._span = Span(span_name, attributes).start()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.perf_counter() - self._start
+        # the name may have been set inside the block, e.g. once the response format is known
+        self._span.name = f"{self.stage} {self.name}".strip()
+        self._span.attributes["name"] = self.name
+        self._span.end(exc)
+        labels = {"stage": self.stage, "name": self.name}
+        observe(STAGE_METRIC, self.seconds, labels, error=exc is not None)
+        logger.debug(f"{self._span.name} took {self.seconds} secs")
+        return False
+
+    def __call__(self, fn):
+        stage_args = (self.stage, self.name)
+
+        if inspect.iscoroutinefunction(fn):
+
+            @wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with Stage(*stage_args, **self.attributes):
+                    return await fn(*args, **kwargs)
+
+            return async_wrapper
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with Stage(*stage_args, **self.attributes):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+
+# function to time a block or a function as a stage, see the module notes
+def stage(stage: str, name: str = "", **attributes) -> Stage:
+    return Stage(stage, name, **attributes)
+
+
+### requests ----
+# function to time and trace every request of the flask app
+def init_metrics(app):
+    @app.before_request
+    def _start_request():
+        g._request_start = time.perf_counter()
+        g._request_span = Span(
+            f"{request.method} {request.endpoint}",
+            {"http.method": request.method, "http.target": request.full_path},
+            kind=SPAN_KIND_SERVER,
+        ).start()
+
+    @app.after_request
+    def _observe_request(response):
+        if "_request_start" in g:
+            labels = {
+                "endpoint": request.endpoint or "none",
+                "method": request.method,
+                "status": str(response.status_code),
+            }
+            observe(REQUEST_METRIC, time.perf_counter() - g._request_start, labels)
+            g._request_span.attributes["http.status_code"] = response.status_code
+        return response
+
+    @app.teardown_request
+    def _end_request(exc):
+        span = g.pop("_request_span", None)
+        if span is not None:
+            span.end(exc)
+
+
+# asgi middleware doing the same for the asgi app. the histogram takes the time to the
+# response's start, the span lasts until the response is sent (streams included)
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        method = scope["method"]
+        span = Span(
+            f"{method} {scope['path']}",
+            {"http.method": method, "http.target": scope["path"]},
+            kind=SPAN_KIND_SERVER,
+        ).start()
+
+        async def send_observed(message):
+            if message["type"] == "http.response.start":
+                # set by the router once the route matched
+                endpoint = getattr(scope.get("endpoint"), "__name__", "none")
+                span.name = f"{method} {endpoint}"
+                span.attributes["http.status_code"] = message["status"]
+                labels = {
+                    "endpoint": endpoint,
+                    "method": method,
+                    "status": str(message["status"]),
+                }
+                observe(REQUEST_METRIC, time.perf_counter() - start, labels)
+            await send(message)
+
+        error = None
+        try:
+            await self.app(scope, receive, send_observed)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            span.end(error)
@@ -0,0 +1,67 @@
+# import libraries
+import argparse
+import logging
+from pathlib import Path
+
+from db_pool import get_engine
+from utils.logging import set_up_logging
+
+### set up logging and other params ----
+logger = logging.getLogger()
+MIGRATIONS_DIR = Path(__file__).parent / "migrations"
+
+
+# function to split a migration file into single statements, CREATE INDEX CONCURRENTLY
+# cannot run inside a multi-statement transaction. semicolons inside $$ quoted function
+# bodies don't end a statement
+def split_statements(sql: str) -> list:
+    lines = [line for line in sql.splitlines() if not line.strip().startswith("--")]
+    statements, current = [], ""
+    for i, part in enumerate("\n".join(lines).split("$$")):
+        if i % 2:
+            current += "$$" + part + "$$"
+            continue
+        pieces = part.split(";")
+        if len(pieces) > 1:
+            statements += [current + pieces[0], *pieces[1:-1]]
+            current = ""
+        current += pieces[-1]
+    statements.append(current)
+    return [s.strip() for s in statements if s.strip()]
+
+
+# apply the sql files in migrations/ in order, recording applied ones in schema_migrations.
+# --force re-applies everything, e.g. after a scraper recreated a table and dropped its indexes
+def main():
+    parser = argparse.ArgumentParser(description="apply database migrations")
+    parser.add_argument("--force", action="store_true")
+    args = parser.parse_args()
+
+    engine = get_engine()
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql(
+            "create table if not exists schema_migrations "
+            "(name text primary key, applied_at timestamptz default now())"
+        )
+        applied = {
+            row[0] for row in conn.exec_driver_sql("select name from schema_migrations")
+        }
+
+        for path in sorted(MIGRATIONS_DIR.glob("*.sql")):
+            if path.name in applied and not args.force:
+                continue
+            logger.info(f"applying {path.name}...")
+            for statement in split_statements(path.read_text()):
+                conn.exec_driver_sql(statement)
+            conn.exec_driver_sql(
+                "insert into schema_migrations (name) values (%(name)s) "
+                "on conflict (name) do update set applied_at = now()",
+                {"name": path.name},
+            )
+
+    logger.info("migrations applied")
+
+
+if __name__ == "__main__":
+    set_up_logging(logger, None)
+    main()
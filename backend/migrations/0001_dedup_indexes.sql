@@ -0,0 +1,33 @@
+-- composite indexes backing the DISTINCT ON (...) ORDER BY queries built by
+-- database.table_query when query.dedup is sql, plus a timestamp index per table for
+-- the incremental loader's watermark filter
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS announcements_dedup_idx
+    ON announcements (ticker, announcement, price_sensitive, date_time NULLS FIRST);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS announcements_date_time_idx
+    ON announcements (date_time);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS afr_homepage_dedup_idx
+    ON afr_homepage (headline, extract_ts NULLS FIRST);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS afr_homepage_extract_ts_idx
+    ON afr_homepage (extract_ts);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS afr_street_talk_dedup_idx
+    ON afr_street_talk (headline, extract_ts NULLS FIRST);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS afr_street_talk_extract_ts_idx
+    ON afr_street_talk (extract_ts);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS aus_homepage_dedup_idx
+    ON aus_homepage (heading, extract_ts NULLS FIRST);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS aus_homepage_extract_ts_idx
+    ON aus_homepage (extract_ts);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS aus_dataroom_dedup_idx
+    ON aus_dataroom (heading, summary, extract_ts NULLS FIRST);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS aus_dataroom_extract_ts_idx
+    ON aus_dataroom (extract_ts);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS aus_tradingday_dedup_idx
+    ON aus_tradingday (heading, summary, extract_ts NULLS FIRST);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS aus_tradingday_extract_ts_idx
+    ON aus_tradingday (extract_ts);
@@ -0,0 +1,35 @@
+-- NOTIFY stock_changes with the table name after every statement that writes to the
+-- announcements or news tables, the change feed behind /api/contents/stream LISTENs on it
+-- instead of waiting for its next poll. re-apply with python migrate.py --force after a
+-- scraper recreated a table
+
+CREATE OR REPLACE FUNCTION notify_stock_changes() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('stock_changes', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS announcements_notify ON announcements;
+CREATE TRIGGER announcements_notify AFTER INSERT OR UPDATE ON announcements
+    FOR EACH STATEMENT EXECUTE PROCEDURE notify_stock_changes();
+
+DROP TRIGGER IF EXISTS afr_homepage_notify ON afr_homepage;
+CREATE TRIGGER afr_homepage_notify AFTER INSERT OR UPDATE ON afr_homepage
+    FOR EACH STATEMENT EXECUTE PROCEDURE notify_stock_changes();
+
+DROP TRIGGER IF EXISTS afr_street_talk_notify ON afr_street_talk;
+CREATE TRIGGER afr_street_talk_notify AFTER INSERT OR UPDATE ON afr_street_talk
+    FOR EACH STATEMENT EXECUTE PROCEDURE notify_stock_changes();
+
+DROP TRIGGER IF EXISTS aus_homepage_notify ON aus_homepage;
+CREATE TRIGGER aus_homepage_notify AFTER INSERT OR UPDATE ON aus_homepage
+    FOR EACH STATEMENT EXECUTE PROCEDURE notify_stock_changes();
+
+DROP TRIGGER IF EXISTS aus_dataroom_notify ON aus_dataroom;
+CREATE TRIGGER aus_dataroom_notify AFTER INSERT OR UPDATE ON aus_dataroom
+    FOR EACH STATEMENT EXECUTE PROCEDURE notify_stock_changes();
+
+DROP TRIGGER IF EXISTS aus_tradingday_notify ON aus_tradingday;
+CREATE TRIGGER aus_tradingday_notify AFTER INSERT OR UPDATE ON aus_tradingday
+    FOR EACH STATEMENT EXECUTE PROCEDURE notify_stock_changes();
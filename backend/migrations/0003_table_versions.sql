@@ -0,0 +1,22 @@
+-- version counters bumped by every statement that writes to a table, so loaders can tell the
+-- table changed without reading it. database.get_marketindex compares market_index's version
+-- (and oid, which changes when a scraper recreates the table) with the one it last loaded
+
+CREATE TABLE IF NOT EXISTS table_versions (
+    table_name text PRIMARY KEY,
+    version bigint NOT NULL DEFAULT 0,
+    updated_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO table_versions (table_name, version) VALUES (TG_TABLE_NAME, 1)
+    ON CONFLICT (table_name)
+    DO UPDATE SET version = table_versions.version + 1, updated_at = now();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS market_index_version ON market_index;
+CREATE TRIGGER market_index_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON market_index
+    FOR EACH STATEMENT EXECUTE PROCEDURE bump_table_version();
@@ -0,0 +1,49 @@
+-- change_seq on the announcements and news tables, numbered from one sequence on every insert
+-- and update, so the change feed behind /api/contents/stream reads the rows written after its
+-- cursor, edited ones included. rows written before this migration keep a null change_seq.
+-- re-apply with python migrate.py --force after a scraper recreated a table
+
+CREATE SEQUENCE IF NOT EXISTS stock_change_seq;
+
+CREATE OR REPLACE FUNCTION set_change_seq() RETURNS trigger AS $$
+BEGIN
+    NEW.change_seq := nextval('stock_change_seq');
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+ALTER TABLE announcements ADD COLUMN IF NOT EXISTS change_seq bigint;
+DROP TRIGGER IF EXISTS announcements_change_seq ON announcements;
+CREATE TRIGGER announcements_change_seq BEFORE INSERT OR UPDATE ON announcements
+    FOR EACH ROW EXECUTE PROCEDURE set_change_seq();
+CREATE INDEX CONCURRENTLY IF NOT EXISTS announcements_change_seq_idx ON announcements (change_seq);
+
+ALTER TABLE afr_homepage ADD COLUMN IF NOT EXISTS change_seq bigint;
+DROP TRIGGER IF EXISTS afr_homepage_change_seq ON afr_homepage;
+CREATE TRIGGER afr_homepage_change_seq BEFORE INSERT OR UPDATE ON afr_homepage
+    FOR EACH ROW EXECUTE PROCEDURE set_change_seq();
+CREATE INDEX CONCURRENTLY IF NOT EXISTS afr_homepage_change_seq_idx ON afr_homepage (change_seq);
+
+ALTER TABLE afr_street_talk ADD COLUMN IF NOT EXISTS change_seq bigint;
+DROP TRIGGER IF EXISTS afr_street_talk_change_seq ON afr_street_talk;
+CREATE TRIGGER afr_street_talk_change_seq BEFORE INSERT OR UPDATE ON afr_street_talk
+    FOR EACH ROW EXECUTE PROCEDURE set_change_seq();
+CREATE INDEX CONCURRENTLY IF NOT EXISTS afr_street_talk_change_seq_idx ON afr_street_talk (change_seq);
+
+ALTER TABLE aus_homepage ADD COLUMN IF NOT EXISTS change_seq bigint;
+DROP TRIGGER IF EXISTS aus_homepage_change_seq ON aus_homepage;
+CREATE TRIGGER aus_homepage_change_seq BEFORE INSERT OR UPDATE ON aus_homepage
+    FOR EACH ROW EXECUTE PROCEDURE set_change_seq();
+CREATE INDEX CONCURRENTLY IF NOT EXISTS aus_homepage_change_seq_idx ON aus_homepage (change_seq);
+
+ALTER TABLE aus_dataroom ADD COLUMN IF NOT EXISTS change_seq bigint;
+DROP TRIGGER IF EXISTS aus_dataroom_change_seq ON aus_dataroom;
+CREATE TRIGGER aus_dataroom_change_seq BEFORE INSERT OR UPDATE ON aus_dataroom
+    FOR EACH ROW EXECUTE PROCEDURE set_change_seq();
+CREATE INDEX CONCURRENTLY IF NOT EXISTS aus_dataroom_change_seq_idx ON aus_dataroom (change_seq);
+
+ALTER TABLE aus_tradingday ADD COLUMN IF NOT EXISTS change_seq bigint;
+DROP TRIGGER IF EXISTS aus_tradingday_change_seq ON aus_tradingday;
+CREATE TRIGGER aus_tradingday_change_seq BEFORE INSERT OR UPDATE ON aus_tradingday
+    FOR EACH ROW EXECUTE PROCEDURE set_change_seq();
+CREATE INDEX CONCURRENTLY IF NOT EXISTS aus_tradingday_change_seq_idx ON aus_tradingday (change_seq);
@@ -0,0 +1,111 @@
+# import libraries
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import date
+from pathlib import Path
+
+import xgboost as xgb
+import yaml
+from box import Box
+from trainer import default_nthread
+
+cfg = Box(yaml.safe_load(open("config_db.yml")))
+
+### set up logging and other params ----
+logger = logging.getLogger()
+
+# fitted models are saved as <dir>/<ticker>/<params hash>/<training data end date>.json
+# (xgboost's native json format) and the most recently used ones are kept in memory too
+REGISTRY_DIR = Path(cfg.forecast.registry.dir)
+
+_models = OrderedDict()
+_models_lock = threading.Lock()
+
+
+# function to hash the hyperparameters, models trained with different ones never mix
+def params_key(params: dict) -> str:
+    return hashlib.md5(json.dumps(params, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def _model_dir(ticker: str, params: dict) -> Path:
+    return REGISTRY_DIR / ticker.upper() / params_key(params)
+
+
+def _model_path(ticker: str, end_date: date, params: dict) -> Path:
+    return _model_dir(ticker, params) / f"{end_date.isoformat()}.json"
+
+
+def _remember(path: Path, model: xgb.Booster):
+    with _models_lock:
+        _models[path] = model
+        _models.move_to_end(path)
+        while len(_models) > cfg.forecast.registry.max_in_memory:
+            _models.popitem(last=False)
+
+
+# function to load a model, with its threads set before it is shared: a booster in use by other
+# threads must not be reconfigured
+def _load(path: Path, nthread: int) -> xgb.Booster:
+    with _models_lock:
+        if path in _models:
+            _models.move_to_end(path)
+            return _models[path]
+    model = xgb.Booster()
+    model.load_model(str(path))
+    model.set_param("nthread", nthread or default_nthread())
+    _remember(path, model)
+    return model
+
+
+# function to get the model trained on data up to end_date, None if there isn't one
+def get_model(ticker: str, end_date: date, params: dict, nthread: int = None):
+    path = _model_path(ticker, end_date, params)
+    if not path.exists():
+        return None
+    os.utime(path)  # mark as recently used for the lru eviction
+    logger.info(f"reusing the {ticker} model trained on data up to {end_date}")
+    return _load(path, nthread)
+
+
+# function to find the latest model for a ticker trained on data before end_date,
+# returns (its end date, model) or (None, None)
+def find_previous(ticker: str, end_date: date, params: dict, nthread: int = None):
+    model_dir = _model_dir(ticker, params)
+    if not model_dir.exists():
+        return None, None
+    end_dates = sorted(
+        date.fromisoformat(p.stem)
+        for p in model_dir.glob("*.json")
+        if date.fromisoformat(p.stem) < end_date
+    )
+    if not end_dates:
+        return None, None
+    return end_dates[-1], _load(_model_path(ticker, end_dates[-1], params), nthread)
+
+
+# function to persist a fitted model and evict the least recently used ones past the limit
+def save_model(model: xgb.Booster, ticker: str, end_date: date, params: dict):
+    path = _model_path(ticker, end_date, params)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # xgboost picks the format from the suffix, so the temporary file is a .json too
+    tmp_path = REGISTRY_DIR / ".tmp" / f"{os.getpid()}-{threading.get_ident()}.json"
+    tmp_path.parent.mkdir(parents=True, exist_ok=True)
+    model.save_model(str(tmp_path))
+    os.replace(tmp_path, path)  # other workers never see a half written model
+    _remember(path, model)
+    evict()
+
+
+def evict():
+    paths = sorted(REGISTRY_DIR.glob("*/*/*.json"), key=lambda p: p.stat().st_mtime)
+    for path in paths[: max(0, len(paths) - cfg.forecast.registry.max_models)]:
+        try:
+            path.unlink()
+        except FileNotFoundError:  # already evicted by another worker
+            pass
+        with _models_lock:
+            _models.pop(path, None)
@@ -0,0 +1,41 @@
+# import libraries
+import logging
+
+import polars as pl
+from database import market_index_signature, normalise_market_index, read_frame
+from db_pool import get_engine
+from instrumentation import stage
+from utils.logging import set_up_logging
+
+### set up logging and other params ----
+logger = logging.getLogger()
+
+
+# function to rebuild market_index_norm from market_index, with market_cap parsed into numbers once.
+# the table is written under a temporary name and swapped in so readers never see it half written
+def build_market_index_norm() -> int:
+    with stage("build", "market_index_norm") as timer:
+        signature = market_index_signature()
+        df = normalise_market_index(
+            read_frame("Select * from market_index", bulk=True)
+        ).with_column(pl.lit(signature).alias("source_signature"))
+
+        engine = get_engine()
+        df.to_pandas().to_sql(
+            "market_index_norm_tmp", engine, if_exists="replace", index=False
+        )
+        with engine.begin() as conn:
+            conn.exec_driver_sql("drop table if exists market_index_norm")
+            conn.exec_driver_sql(
+                "alter table market_index_norm_tmp rename to market_index_norm"
+            )
+
+    logger.info(
+        f"{timer.seconds} secs used to build market_index_norm, {df.height} rows"
+    )
+    return df.height
+
+
+if __name__ == "__main__":
+    set_up_logging(logger, None)
+    build_market_index_norm()
@@ -0,0 +1,51 @@
+# import libraries
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import yaml
+from box import Box
+
+cfg = Box(yaml.safe_load(open("config_db.yml")))
+
+# blocking calls made from the asgi app (cache reads, polars work, serialisation, sync db reads)
+# run on this bounded executor so the event loop keeps serving other requests meanwhile
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+# function to get the executor, re-created after a fork
+def get_blocking_executor() -> ThreadPoolExecutor:
+    global _executor, _executor_pid
+
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(
+                max_workers=cfg.asgi.blocking_threads, thread_name_prefix="blocking"
+            )
+            _executor_pid = os.getpid()
+    return _executor
+
+
+# function to await a blocking call on the executor. it runs in a copy of the caller's context,
+# so its stages are part of the request's trace
+async def run_blocking(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        get_blocking_executor(), partial(context.run, fn, *args, **kwargs)
+    )
+
+
+def shutdown_blocking_executor():
+    global _executor, _executor_pid
+
+    with _executor_lock:
+        if _executor is not None and _executor_pid == os.getpid():
+            _executor.shutdown(wait=False)
+        _executor = None
+        _executor_pid = None
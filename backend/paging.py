@@ -0,0 +1,164 @@
+# import libraries
+import base64
+import json
+
+import polars as pl
+import yaml
+from box import Box
+
+cfg = Box(yaml.safe_load(open("config_db.yml")))
+
+# columns of the announcements table the api can sort on
+SORTABLE_COLUMNS = ["ticker", "name", "market_cap", "announcement_time"]
+PRICE_SENSITIVE_VALUES = {
+    "true": "PRICE SENSITIVE",
+    "yes": "PRICE SENSITIVE",
+    "1": "PRICE SENSITIVE",
+    "false": "NOT PRICE SENSITIVE",
+    "no": "NOT PRICE SENSITIVE",
+    "0": "NOT PRICE SENSITIVE",
+}
+PAGING_ARGS = ["page", "page_size", "sort", "cursor"]
+
+
+# function to encode/decode the opaque cursor handed back to the client
+def encode_cursor(sort: str, value, key: str) -> str:
+    raw = json.dumps({"s": sort, "v": value, "k": key})
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except ValueError:
+        raise ValueError("invalid cursor")
+    # anything that decodes but was not produced by encode_cursor is rejected here, not in polars
+    if (
+        not isinstance(decoded, dict)
+        or set(decoded) != {"s", "v", "k"}
+        or not isinstance(decoded["s"], str)
+        or not isinstance(decoded["k"], str)
+        or isinstance(decoded["v"], bool)
+        or not isinstance(decoded["v"], (str, int, float))
+    ):
+        raise ValueError("invalid cursor")
+    return decoded
+
+
+# function to validate the query string of /api/contents, raises ValueError on bad input
+def parse_announcement_args(args) -> dict:
+    opts = {"paged": any(a in args for a in PAGING_ARGS)}
+
+    try:
+        opts["page"] = int(args.get("page", 1))
+        opts["page_size"] = int(args.get("page_size", cfg.paging.default_page_size))
+        opts["min_market_cap"] = (
+            float(args["min_market_cap"]) if "min_market_cap" in args else None
+        )
+    except ValueError:
+        raise ValueError("page, page_size and min_market_cap must be numbers")
+    if opts["page"] < 1 or not 1 <= opts["page_size"] <= cfg.paging.max_page_size:
+        raise ValueError(
+            f"page must be >= 1 and page_size between 1 and {cfg.paging.max_page_size}"
+        )
+
+    sort = args.get("sort", "ticker")
+    if sort.lstrip("-") not in SORTABLE_COLUMNS:
+        raise ValueError(
+            f"sort must be one of {SORTABLE_COLUMNS}, prefix - for descending"
+        )
+    opts["sort"] = sort
+
+    opts["ticker"] = args.get("ticker", "").upper() or None
+    price_sensitive = args.get("price_sensitive")
+    opts["price_sensitive"] = (
+        PRICE_SENSITIVE_VALUES.get(price_sensitive.lower(), price_sensitive.upper())
+        if price_sensitive
+        else None
+    )
+    # the frontend's datetime-local inputs send 2023-01-31T09:00
+    opts["since"] = args.get("since", "").replace("T", " ") or None
+
+    opts["cursor"] = decode_cursor(args["cursor"]) if args.get("cursor") else None
+    if opts["cursor"] and opts["cursor"]["s"] != sort:
+        raise ValueError("cursor was issued for a different sort order")
+    # market_cap pages on a number, every other column on its text form
+    numeric = sort.lstrip("-") == "market_cap"
+    if opts["cursor"] and isinstance(opts["cursor"]["v"], str) == numeric:
+        raise ValueError("invalid cursor")
+    return opts
+
+
+# expression used to order rows by the requested column, with nulls made comparable
+def _sort_expr(column: str) -> pl.Expr:
+    if column == "market_cap":
+        return pl.col(column).fill_null(float("-inf"))
+    return pl.col(column).cast(pl.Utf8).fill_null("")
+
+
+# function to filter, sort and page the cached announcements frame
+def query_announcements(df: pl.DataFrame, opts: dict) -> dict:
+    lf = df.lazy()
+
+    if opts["ticker"]:
+        lf = lf.filter(pl.col("ticker").str.starts_with(opts["ticker"]))
+    if opts["price_sensitive"]:
+        lf = lf.filter(pl.col("price_sensitive") == opts["price_sensitive"])
+    if opts["since"]:
+        lf = lf.filter(pl.col("announcement_time").cast(pl.Utf8) >= opts["since"])
+    if opts["min_market_cap"] is not None:
+        lf = lf.filter(pl.col("market_cap") >= opts["min_market_cap"])
+
+    if not opts["paged"]:
+        items = lf.collect()
+        return {"items": items, "total": items.height}
+
+    column = opts["sort"].lstrip("-")
+    descending = opts["sort"].startswith("-")
+    # ticker + announcement + time identify a row, so ties on the sort column page deterministically
+    lf = lf.with_columns(
+        [
+            _sort_expr(column).alias("_sort"),
+            pl.concat_str(
+                [
+                    pl.col("ticker"),
+                    pl.col("announcement"),
+                    pl.col("announcement_time").cast(pl.Utf8),
+                ],
+                separator="\x1f",
+            ).alias("_key"),
+        ]
+    )
+    df_sorted = lf.sort(["_sort", "_key"], descending=[descending, False]).collect()
+    total = df_sorted.height
+
+    cursor = opts["cursor"]
+    if cursor:
+        after = (
+            pl.col("_sort") < cursor["v"]
+            if descending
+            else pl.col("_sort") > cursor["v"]
+        )
+        df_sorted = df_sorted.filter(
+            after | ((pl.col("_sort") == cursor["v"]) & (pl.col("_key") > cursor["k"]))
+        )
+        offset = 0
+    else:
+        offset = (opts["page"] - 1) * opts["page_size"]
+
+    df_page = df_sorted.slice(offset, opts["page_size"])
+    has_more = df_sorted.height > offset + df_page.height
+
+    next_cursor = None
+    if has_more and df_page.height > 0:
+        next_cursor = encode_cursor(
+            opts["sort"], df_page["_sort"][-1], df_page["_key"][-1]
+        )
+
+    return {
+        "items": df_page.drop(["_sort", "_key"]),
+        "total": total,
+        "page": None if cursor else opts["page"],
+        "page_size": opts["page_size"],
+        "next_cursor": next_cursor,
+    }
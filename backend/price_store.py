@@ -0,0 +1,221 @@
+# import libraries
+import fcntl
+import json
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from datetime import date
+from pathlib import Path
+
+import pandas as pd
+import polars as pl
+import yaml
+from box import Box
+from instrumentation import stage
+from utils.trading_calendar import asx_calendar
+
+cfg = Box(yaml.safe_load(open("config_db.yml")))
+
+### set up logging and other params ----
+logger = logging.getLogger()
+
+PRICE_COLUMNS = [
+    "Date",
+    "Open",
+    "High",
+    "Low",
+    "Close",
+    "Volume",
+    "Dividends",
+    "Stock Splits",
+]
+
+# daily bars are kept as one arrow ipc file per ticker, read memory mapped, next to a small json
+# file recording the date range already fetched (weekends and holidays have no bars, so gaps
+# can't be told apart from missing data by looking at the bars alone)
+STORE_DIR = Path(cfg.forecast.prices.dir)
+
+_ticker_locks = {}
+_ticker_locks_lock = threading.Lock()
+
+
+### price sources ----
+# a source returns the daily bars of a ticker for [start, end) as a pandas df with PRICE_COLUMNS
+class PriceSource(ABC):
+    @abstractmethod
+    def fetch(self, ticker: str, start: date, end: date) -> pd.DataFrame:
+        ...
+
+
+class YFinanceSource(PriceSource):
+    @stage("price_fetch", "yfinance")
+    def fetch(self, ticker: str, start: date, end: date) -> pd.DataFrame:
+        import yfinance as yf
+
+        stock = yf.Ticker(ticker)
+        stock_df = pd.DataFrame(stock.history(start=start, end=end).reset_index())
+        stock_df["Date"] = stock_df["Date"].dt.tz_localize(None)
+        return stock_df
+
+
+# reads <fixture_dir>/<TICKER>.csv, for tests and offline runs
+class FixtureSource(PriceSource):
+    def __init__(self, fixture_dir):
+        self.fixture_dir = Path(fixture_dir)
+
+    @stage("price_fetch", "fixture")
+    def fetch(self, ticker: str, start: date, end: date) -> pd.DataFrame:
+        path = self.fixture_dir / f"{ticker.upper()}.csv"
+        if not path.exists():
+            return pd.DataFrame(columns=PRICE_COLUMNS)
+        df = pd.read_csv(path, parse_dates=["Date"])
+        mask = (df["Date"] >= pd.Timestamp(start)) & (df["Date"] < pd.Timestamp(end))
+        return df[mask].reset_index(drop=True)
+
+
+_source = None
+
+
+# function to get the configured price source, can be replaced with set_source
+def get_source() -> PriceSource:
+    global _source
+
+    if _source is None:
+        if cfg.forecast.prices.source == "fixture":
+            _source = FixtureSource(cfg.forecast.prices.fixture_dir)
+        else:
+            _source = YFinanceSource()
+    return _source
+
+
+def set_source(source: PriceSource):
+    global _source
+
+    _source = source
+
+
+### store ----
+def _paths(ticker: str):
+    name = ticker.upper()
+    return (
+        STORE_DIR / f"{name}.arrow",
+        STORE_DIR / f"{name}.json",
+        STORE_DIR / f"{name}.lock",
+    )
+
+
+def _ticker_lock(ticker: str) -> threading.Lock:
+    with _ticker_locks_lock:
+        return _ticker_locks.setdefault(ticker.upper(), threading.Lock())
+
+
+def _read_coverage(meta_path: Path):
+    if not meta_path.exists():
+        return None, None
+    meta = json.loads(meta_path.read_text())
+    return date.fromisoformat(meta["start"]), date.fromisoformat(meta["end"])
+
+
+def _write_atomic(path: Path, write):
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+# function to work out which parts of [start, end) haven't been fetched yet
+def missing_ranges(start: date, end: date, cov_start: date, cov_end: date) -> list:
+    if cov_start is None:
+        return [(start, end)]
+    ranges = []
+    if start < cov_start:
+        ranges.append((start, cov_start))
+    if end > cov_end:
+        ranges.append((cov_end, end))
+    return ranges
+
+
+# function to fetch the missing date ranges of a ticker from the source and append them
+def fill_gaps(ticker: str, start: date, end: date):
+    data_path, meta_path, lock_path = _paths(ticker)
+    STORE_DIR.mkdir(parents=True, exist_ok=True)
+
+    # thread lock within the worker, file lock across workers
+    with _ticker_lock(ticker), open(lock_path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        cov_start, cov_end = _read_coverage(meta_path)
+        ranges = missing_ranges(start, end, cov_start, cov_end)
+        if not ranges:
+            return
+
+        fetched = []
+        new_start, new_end = cov_start, cov_end
+        for range_start, range_end in ranges:
+            logger.info(f"fetching {ticker} prices for {range_start} to {range_end}...")
+            df = get_source().fetch(ticker, range_start, range_end)
+            # no bars are only expected when the market was closed the whole range, otherwise
+            # the download failed and the range is left uncovered to be retried next time
+            if (
+                len(df) == 0
+                and asx_calendar().trading_days_between(range_start, range_end) > 0
+            ):
+                logger.warning(f"no {ticker} prices for {range_start} to {range_end}")
+                continue
+            if len(df) > 0:
+                fetched.append(pl.from_pandas(df[PRICE_COLUMNS]))
+            new_start = min(range_start, new_start) if new_start else range_start
+            new_end = max(range_end, new_end) if new_end else range_end
+
+        if fetched:
+            frames = [pl.read_ipc(data_path)] if data_path.exists() else []
+            frames += [
+                df.with_columns(
+                    [pl.col(c).cast(pl.Float64) for c in PRICE_COLUMNS[1:]]
+                    + [pl.col("Date").cast(pl.Datetime("us"))]
+                )
+                for df in fetched
+            ]
+            df_all = (
+                pl.concat(frames).unique(subset=["Date"], keep="first").sort("Date")
+            )
+            _write_atomic(data_path, df_all.write_ipc)
+
+        if new_start is not None:
+            _write_atomic(
+                meta_path,
+                lambda p: p.write_text(
+                    json.dumps(
+                        {"start": new_start.isoformat(), "end": new_end.isoformat()}
+                    )
+                ),
+            )
+
+
+# function to get the daily bars of a ticker for [start, end), only fetching what the
+# store doesn't have yet
+def get_prices(ticker: str, start: date, end: date) -> pd.DataFrame:
+    if isinstance(start, str):
+        start, end = date.fromisoformat(start), date.fromisoformat(end)
+    fill_gaps(ticker, start, end)
+
+    data_path, _, _ = _paths(ticker)
+    if not data_path.exists():
+        return pd.DataFrame(columns=PRICE_COLUMNS)
+    df = (
+        pl.read_ipc(data_path, memory_map=True)
+        .filter(
+            (pl.col("Date") >= pl.lit(pd.Timestamp(start).to_pydatetime()))
+            & (pl.col("Date") < pl.lit(pd.Timestamp(end).to_pydatetime()))
+        )
+        .to_pandas()
+    )
+    return df
+
+
+# function to drop everything stored for a ticker so it is refetched, e.g. after a split
+# changed the adjusted history
+def invalidate(ticker: str):
+    data_path, meta_path, _ = _paths(ticker)
+    for path in [data_path, meta_path]:
+        if path.exists():
+            path.unlink()
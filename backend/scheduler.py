@@ -0,0 +1,138 @@
+# import libraries
+import fcntl
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime as dt
+
+import yaml
+from box import Box
+from cache import cache, publish
+from instrumentation import stage
+
+cfg = Box(yaml.safe_load(open("config_db.yml")))
+
+### set up logging and other params ----
+logger = logging.getLogger()
+
+STATUS_KEY = "scheduler_status"
+# pid of the gunicorn master when it preloads the app, set by gunicorn.conf.py
+PRELOAD_MASTER_ENV = "STOCK_APP_PRELOAD_MASTER"
+
+# payloads the scheduler rebuilds: key -> (loader, cache ttl)
+_jobs = {}
+_started_pid = None
+_leader_lock_file = None
+
+
+# function to register a payload for periodic rebuilding
+def register_job(key: str, loader, ttl: int):
+    _jobs[key] = (loader, ttl)
+
+
+# function to try to become the leader, only one process on the host holds the lock file
+# and the os releases it if that process dies
+def _acquire_leadership() -> bool:
+    global _leader_lock_file
+
+    if _leader_lock_file is not None:
+        return True
+    lock_file = open(cfg.scheduler.lock_file, "a+")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    _leader_lock_file = lock_file
+    logger.info(f"pid {os.getpid()} is now the refresh scheduler leader")
+    return True
+
+
+def _next_run(key: str) -> float:
+    return (
+        time.time()
+        + cfg.scheduler.jobs[key].interval
+        + random.uniform(0, cfg.scheduler.jitter)
+    )
+
+
+# function to rebuild one payload and publish it, recording the outcome in the shared status
+def run_job(key: str):
+    loader, ttl = _jobs[key]
+    timer = stage("refresh", key)
+    job_status = {"leader_pid": os.getpid()}
+    try:
+        with timer:
+            publish(key, loader(), ttl)
+        job_status["last_refreshed_at"] = dt.now().isoformat(timespec="seconds")
+        job_status["last_error"] = None
+    except Exception as e:
+        logger.exception(f"scheduled refresh of {key} failed")
+        job_status["last_error"] = repr(e)
+    job_status["build_duration"] = timer.seconds
+
+    status = cache.get(STATUS_KEY) or {}
+    status[key] = {**status.get(key, {}), **job_status}
+    cache.set(STATUS_KEY, status, timeout=0)
+    logger.info(f"scheduled refresh of {key} took {job_status['build_duration']} secs")
+
+
+# the scheduler loop: wait for leadership, then rebuild each payload when it is due
+def run_forever(app):
+    if not _jobs:
+        raise RuntimeError(
+            "no payloads are registered with the scheduler, import the app first"
+        )
+    next_runs = {key: 0.0 for key in _jobs}
+    with app.app_context():
+        while True:
+            if not _acquire_leadership():
+                time.sleep(cfg.scheduler.leader_retry)
+                continue
+
+            for key in _jobs:
+                if time.time() >= next_runs[key]:
+                    run_job(key)
+                    next_runs[key] = _next_run(key)
+
+            time.sleep(max(0.0, min(next_runs.values()) - time.time()))
+
+
+# function to start the scheduler thread in this worker, every worker runs one and only
+# the leader does any work
+def start_scheduler(app):
+    global _started_pid
+
+    if not cfg.scheduler.enabled or cfg.scheduler.mode != "thread":
+        return
+    if _started_pid == os.getpid():
+        return
+    # a gunicorn master preloading the app (see gunicorn.conf.py) runs no threads of its own,
+    # the post_fork hook starts the scheduler in each worker instead
+    if os.environ.get(PRELOAD_MASTER_ENV) == str(os.getpid()):
+        return
+    _started_pid = os.getpid()
+    threading.Thread(
+        target=run_forever, args=(app,), name="refresh-scheduler", daemon=True
+    ).start()
+
+
+# function to return when each payload was last rebuilt and how long it took
+def scheduler_status() -> dict:
+    return {
+        "enabled": cfg.scheduler.enabled,
+        "mode": cfg.scheduler.mode,
+        "jobs": cache.get(STATUS_KEY) or {},
+    }
+
+
+# separate process mode: python scheduler.py
+if __name__ == "__main__":
+    # run as a script this file is __main__, while the app registers its jobs with the
+    # scheduler module it imports, so run that module's loop
+    import scheduler
+    from app import app
+
+    scheduler.run_forever(app)
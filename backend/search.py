@@ -0,0 +1,559 @@
+# import libraries
+import heapq
+import logging
+import math
+import re
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime, timezone
+from functools import partial
+
+import numpy as np
+import polars as pl
+import yaml
+from box import Box
+from database import (
+    INCREMENTAL_TABLES,
+    NEWS_TABLES,
+    fetch_concurrently,
+    frame_state,
+    load_incremental,
+)
+from instrumentation import stage
+
+cfg = Box(yaml.safe_load(open("config_db.yml")))
+
+### set up logging and other params ----
+logger = logging.getLogger()
+
+"""
+    full-text search over the announcements and news headlines, behind GET /api/search
+
+    each worker keeps an inverted index of the frames the incremental loader holds: per term,
+    the ids of the documents (rows) it is in and how often, as numpy arrays. queries are
+    ranked with BM25, and a query's last word (unless it ends with a space) and words ending
+    in * also match the terms they are a prefix of. the index is built on the first search and
+    refreshed in the background every refresh_interval seconds: rows the loader appended since
+    are indexed, a full reload of any table (a new generation, see database.frame_state)
+    rebuilds the whole index.
+
+    a refresh replaces the arrays it changes instead of writing into them, documents before
+    postings, so queries read the index without a lock and ignore document ids newer than the
+    documents they started with
+"""
+
+# text indexed per row, whichever of these columns a table has
+TEXT_COLUMNS = ["ticker", "announcement", "headline", "heading", "summary"]
+SOURCES = list(INCREMENTAL_TABLES)
+TOPICS = {"announcements": ["announcements"], "news": NEWS_TABLES}
+
+TOKEN_PATTERN = r"\w+"
+MAX_QUERY_LENGTH = 200
+MAX_QUERY_TERMS = 16
+EMPTY_MATCH = (np.zeros(0, np.int32), np.zeros(0, np.float32))
+EMPTY_POSTINGS = (*EMPTY_MATCH, 0)
+# columns of the /api/search items
+ITEM_COLUMNS = {
+    "source": pl.Utf8,
+    "ticker": pl.Utf8,
+    "title": pl.Utf8,
+    "summary": pl.Utf8,
+    "price_sensitive": pl.Utf8,
+    "date_time": pl.Int64,
+    "score": pl.Float32,
+}
+# scores sampled to find the threshold of a query's best documents
+SAMPLE_SIZE = 4096
+
+
+# function to get the ticker a symbol like bhp.ax refers to in the announcements table
+def _ticker_key(symbol: str) -> str:
+    return symbol.strip().upper().split(".")[0]
+
+
+# function to turn a date_time column into epoch milliseconds, 0 where it is missing
+def _epoch_ms(col: pl.Series) -> np.ndarray:
+    if col.dtype == pl.Utf8:
+        col = col.str.strptime(pl.Datetime, strict=False)
+    elif col.dtype == pl.Date:
+        col = col.cast(pl.Datetime)
+    if col.dtype != pl.Datetime:
+        return np.zeros(len(col), np.int64)
+    return col.dt.timestamp("ms").fill_null(0).to_numpy().astype(np.int64)
+
+
+# function to split each row's text into lowercase terms, a list column
+def _row_terms(df: pl.DataFrame) -> pl.Series:
+    columns = [c for c in TEXT_COLUMNS if c in df.columns]
+    if not columns:
+        return pl.Series(
+            "terms", [[] for _ in range(df.height)], dtype=pl.List(pl.Utf8)
+        )
+    return df.select(
+        pl.concat_str(
+            [pl.col(c).cast(pl.Utf8).fill_null("") for c in columns], separator=" "
+        )
+        .str.to_lowercase()
+        .str.extract_all(TOKEN_PATTERN)
+        .alias("terms")
+    )["terms"]
+
+
+# function to group the terms of each document into postings: term -> (sorted doc ids, BM25
+# term weights), views into one pair of arrays. docs are numbered from 0 in df_terms and norm
+# (each document's length normalisation), from offset in the postings
+def _postings(df_terms: pl.DataFrame, norm: np.ndarray, offset: int) -> dict:
+    terms = (
+        df_terms.lazy()
+        .explode("terms")
+        .drop_nulls("terms")
+        .with_column(pl.col("terms").cast(pl.Categorical))
+        .collect()
+    )
+    if terms.height == 0:
+        return {}
+    # one integer per (term, doc) pair, sorted its runs are the term counts of each document
+    codes = terms["terms"].to_physical().to_numpy().astype(np.uint64)
+    keys = np.sort((codes << 32) | terms["doc"].to_numpy().astype(np.uint64))
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    tfs = np.diff(np.r_[starts, len(keys)]).astype(np.float32)
+    keys = keys[starts]
+    codes = keys >> 32
+    ids = (keys & 0xFFFFFFFF).astype(np.int32)
+
+    k1 = cfg.search.bm25.k1
+    weights = tfs * (k1 + 1) / (tfs + norm[ids])
+    ids += offset
+    labels = terms["terms"].unique()
+    label_of = dict(zip(labels.to_physical().to_list(), labels.cast(pl.Utf8).to_list()))
+    bounds = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1], True]).tolist()
+    return {
+        label_of[code]: (ids[start:end], weights[start:end])
+        for code, start, end in zip(codes[bounds[:-1]].tolist(), bounds, bounds[1:])
+    }
+
+
+def _parse_time(value: str, end: bool) -> int:
+    try:
+        return int(float(value))
+    except ValueError:
+        pass
+    try:
+        when = datetime.fromisoformat(value.replace("T", " "))
+    except ValueError:
+        raise ValueError(
+            "from and to must be iso dates or times, or epoch milliseconds"
+        )
+    ms = int(when.replace(tzinfo=timezone.utc).timestamp() * 1000)
+    # a date on its own as the end of the range takes in the whole day
+    if end and len(value) == 10:
+        ms += 24 * 3600 * 1000 - 1
+    return ms
+
+
+# function to validate the query string of /api/search, raises ValueError on bad input
+def parse_search_args(args) -> dict:
+    q = args.get("q", "")
+    if not q.strip():
+        raise ValueError("q is required")
+    if len(q) > MAX_QUERY_LENGTH:
+        raise ValueError(f"q must be at most {MAX_QUERY_LENGTH} characters")
+    opts = {"q": q}
+
+    try:
+        opts["limit"] = int(args.get("limit", cfg.search.default_limit))
+    except ValueError:
+        raise ValueError("limit must be a number")
+    if not 1 <= opts["limit"] <= cfg.search.max_limit:
+        raise ValueError(f"limit must be between 1 and {cfg.search.max_limit}")
+
+    tickers = [t for t in args.get("ticker", "").split(",") if t.strip()]
+    opts["tickers"] = sorted({_ticker_key(t) for t in tickers}) or None
+
+    sources = set()
+    for source in [s.strip() for s in args.get("source", "").split(",") if s.strip()]:
+        if source not in TOPICS and source not in NEWS_TABLES:
+            raise ValueError(f"source must be among {[*TOPICS, *NEWS_TABLES]}")
+        sources.update(TOPICS.get(source, [source]))
+    opts["sources"] = sorted(sources) or None
+
+    # the frontend's datetime-local inputs send 2023-01-31T09:00
+    opts["since"] = _parse_time(args["from"], False) if args.get("from") else None
+    opts["until"] = _parse_time(args["to"], True) if args.get("to") else None
+    return opts
+
+
+# function to split a query into groups of terms: a term, or for a prefix the terms it
+# expands to. a document has to match every group
+def _query_groups(index, q: str) -> list:
+    words = q.lower().replace("*", "* ").split()
+    if not q[-1].isspace() and not words[-1].endswith("*"):
+        words[-1] += "*"
+    groups = []
+    for word in words:
+        terms = re.findall(TOKEN_PATTERN, word)
+        for i, term in enumerate(terms):
+            last = i == len(terms) - 1
+            if last and word.endswith("*") and len(term) >= cfg.search.min_prefix:
+                groups.append(index.expand(term))
+            else:
+                groups.append([term])
+    return groups[:MAX_QUERY_TERMS]
+
+
+# function to copy arrays into ones with room for at least size elements, doubling so
+# appends stay cheap
+def _grow(arrays: tuple, size: int) -> tuple:
+    capacity = max(2 * size, 16)
+    grown = tuple(np.empty(capacity, values.dtype) for values in arrays)
+    for values, held in zip(arrays, grown):
+        held[: len(values)] = values
+    return grown
+
+
+# function to pick the positions of the limit best scores, newest first between equal ones.
+# times is indexed by doc id. a threshold from a sample of the scores narrows them down first:
+# ranking them all is slow with many matches, and argpartition is slow with the many equal
+# scores BM25 gives short texts
+def _top(scores: np.ndarray, ids: np.ndarray, times: np.ndarray, limit: int):
+    if len(scores) <= SAMPLE_SIZE:
+        candidates = np.arange(len(scores))
+    else:
+        sample = np.sort(scores[:: len(scores) // SAMPLE_SIZE])[::-1]
+        rank = max(len(sample) * 4 * limit // len(scores), 8)
+        threshold = sample[min(rank, len(sample) - 1)]
+        candidates = np.flatnonzero(scores >= threshold)
+        if len(candidates) < limit:
+            candidates = np.arange(len(scores))
+        else:
+            # those at the threshold are only ranked by time, the newest that fit are kept
+            tied = scores[candidates] == threshold
+            needed = limit - (len(candidates) - np.count_nonzero(tied))
+            if needed <= 0:
+                candidates = candidates[~tied]
+            elif np.count_nonzero(tied) > needed:
+                at = candidates[tied]
+                at = at[np.argpartition(-times[ids[at]], needed - 1)[:needed]]
+                candidates = np.concatenate([candidates[~tied], at])
+    order = np.lexsort((-times[ids[candidates]], -scores[candidates]))
+    return candidates[order[:limit]]
+
+
+class SearchIndex:
+    def __init__(self, generations: dict):
+        # generation of each table's frame, rows indexed and the frame they are read from
+        self.generations = dict(generations)
+        self.rows = {}
+        self.frames = {}
+        # per document: its table (index into SOURCES), row, ticker code and epoch ms. like
+        # the postings the arrays have room to append to, they are held with the number of
+        # documents in them and replaced together with it (see docs)
+        self._docs = (
+            {
+                "table": np.zeros(0, np.int8),
+                "row": np.zeros(0, np.int32),
+                "ticker": np.zeros(0, np.int32),
+                "time": np.zeros(0, np.int64),
+            },
+            0,
+        )
+        # term -> (doc ids, term weights, size), the arrays have room to append to, readers
+        # only look at their first size elements
+        self.postings = {}
+        self.vocab = []
+        self.tickers = {}
+        # average terms per document, set by the first add. kept until the next build so the
+        # term weights of the postings stay comparable
+        self.avgdl = None
+        self.updated_at = None
+
+    def __len__(self) -> int:
+        return self._docs[1]
+
+    # the documents indexed so far, views of the arrays up to their size
+    @property
+    def docs(self) -> dict:
+        arrays, size = self._docs
+        return {key: values[:size] for key, values in arrays.items()}
+
+    def _ticker_codes(self, df: pl.DataFrame) -> np.ndarray:
+        if "ticker" not in df.columns:
+            return np.full(df.height, -1, np.int32)
+        symbols = df["ticker"].cast(pl.Utf8).fill_null("").to_list()
+        codes = {}
+        for symbol in set(symbols):
+            codes[symbol] = self.tickers.setdefault(
+                _ticker_key(symbol), len(self.tickers)
+            )
+        return np.array([codes[symbol] for symbol in symbols], np.int32)
+
+    # function to index the rows of each frame past those already indexed, returns how many.
+    # frames must be of the index's generations
+    def add(self, frames: dict) -> int:
+        n = len(self)
+        docs = {key: [] for key in self._docs[0]}
+        lengths, df_terms = [], []
+        for table, df in frames.items():
+            start = self.rows.get(table, 0)
+            df_new = df.slice(start)
+            if df_new.height == 0:
+                continue
+            terms = _row_terms(df_new)
+            df_terms.append(
+                pl.DataFrame({"terms": terms})
+                .with_row_count("doc", n - len(self))
+                .select([pl.col("doc").cast(pl.Int64), "terms"])
+            )
+            docs["table"].append(np.full(df_new.height, SOURCES.index(table), np.int8))
+            docs["row"].append(np.arange(start, df.height, dtype=np.int32))
+            docs["ticker"].append(self._ticker_codes(df_new))
+            docs["time"].append(_epoch_ms(df_new["date_time"]))
+            lengths.append(terms.arr.lengths().to_numpy().astype(np.float32))
+            n += df_new.height
+        if not df_terms:
+            return 0
+
+        added = n - len(self)
+        lengths = np.concatenate(lengths)
+        if self.avgdl is None:
+            self.avgdl = max(float(lengths.mean()), 1.0)
+        k1, b = cfg.search.bm25.k1, cfg.search.bm25.b
+        norm = k1 * (1 - b + b * lengths / self.avgdl)
+        postings = _postings(pl.concat(df_terms), norm, len(self))
+        new_terms = sorted(set(postings) - set(self.postings))
+
+        # frames, then documents, then postings: a query only follows ids to documents and
+        # frames that are already there
+        self.frames.update(frames)
+        self.rows.update({table: df.height for table, df in frames.items()})
+        self._docs = self._append_docs(docs, added)
+        for term, (ids, weights) in postings.items():
+            if term not in self.postings:
+                self.postings[term] = (ids, weights, len(ids))
+                continue
+            held_ids, held_weights, size = self.postings[term]
+            end = size + len(ids)
+            if end > len(held_ids):
+                held_ids, held_weights = _grow(
+                    (held_ids[:size], held_weights[:size]), end
+                )
+            held_ids[size:end] = ids
+            held_weights[size:end] = weights
+            self.postings[term] = (held_ids, held_weights, end)
+        if new_terms:
+            self.vocab = list(heapq.merge(self.vocab, new_terms))
+        return added
+
+    # function to write the new documents past the held ones, into the same arrays while they
+    # have room (readers only look up to the old size) or else into grown copies. returns the
+    # arrays and the new size
+    def _append_docs(self, docs: dict, added: int) -> tuple:
+        arrays, size = self._docs
+        end = size + added
+        if end > len(arrays["row"]):
+            keys = list(arrays)
+            grown = _grow(tuple(arrays[key][:size] for key in keys), end)
+            arrays = dict(zip(keys, grown))
+        for key, values in docs.items():
+            arrays[key][size:end] = np.concatenate(values)
+        return arrays, end
+
+    # function to get the terms a prefix expands to, the max_expansions most frequent
+    def expand(self, prefix: str) -> list:
+        vocab = self.vocab
+        start = bisect_left(vocab, prefix)
+        end = bisect_left(vocab, prefix + "\uffff", start)
+        terms = vocab[start:end]
+        if len(terms) > cfg.search.max_expansions:
+            postings = self.postings
+            terms = heapq.nlargest(
+                cfg.search.max_expansions, terms, key=lambda t: postings[t][2]
+            )
+        return terms
+
+    # function to get a term's documents among the first n and their BM25 scores
+    def _term_scores(self, term: str, n: int) -> tuple:
+        ids, weights, size = self.postings.get(term, EMPTY_POSTINGS)
+        end = np.searchsorted(ids[:size], n)
+        idf = math.log(1 + (n - end + 0.5) / (end + 0.5))
+        return ids[:end], idf * weights[:end]
+
+    # function to score a group of terms, the best of its terms in each document
+    def _group_scores(self, terms: list, n: int) -> tuple:
+        if len(terms) == 1:
+            return self._term_scores(terms[0], n)
+        best = np.zeros(n, np.float32)
+        for term in terms:
+            ids, scores = self._term_scores(term, n)
+            best[ids] = np.maximum(best[ids], scores)
+        ids = np.flatnonzero(best).astype(np.int32)
+        return ids, best[ids]
+
+    # function to get the ids of the documents matching every group of terms, and their
+    # summed scores. the groups are intersected from the one with the fewest documents
+    def _match(self, groups: list, n: int) -> tuple:
+        matched = []
+        for terms in groups:
+            ids, scores = self._group_scores(terms, n) if terms else EMPTY_MATCH
+            if len(ids) == 0:
+                return EMPTY_MATCH
+            matched.append((ids, scores))
+        matched.sort(key=lambda m: len(m[0]))
+
+        ids, scores = matched[0]
+        for other_ids, other_scores in matched[1:]:
+            # scores are positive, 0 where the other group has no match
+            dense = np.zeros(n, np.float32)
+            dense[other_ids] = other_scores
+            other = dense[ids]
+            hit = other > 0
+            ids, scores = ids[hit], scores[hit] + other[hit]
+        return ids, scores
+
+    # function to flag the documents that pass the ticker, source and date filters, None
+    # without filters
+    def _filter(self, ids: np.ndarray, docs: dict, opts: dict) -> np.ndarray:
+        if not opts["sources"] and not opts["tickers"]:
+            if opts["since"] is None and opts["until"] is None:
+                return None
+        keep = np.ones(len(ids), bool)
+        if opts["sources"]:
+            codes = [SOURCES.index(s) for s in opts["sources"]]
+            keep &= np.isin(docs["table"][ids], codes)
+        if opts["since"] is not None:
+            keep &= docs["time"][ids] >= opts["since"]
+        if opts["until"] is not None:
+            keep &= docs["time"][ids] <= opts["until"]
+        if opts["tickers"]:
+            # announcements of the tickers, and news that mentions them
+            codes = [self.tickers[t] for t in opts["tickers"] if t in self.tickers]
+            match = np.isin(docs["ticker"][ids], codes)
+            news = docs["table"][ids] != SOURCES.index("announcements")
+            for ticker in opts["tickers"]:
+                ids_of, _, size = self.postings.get(ticker.lower(), EMPTY_POSTINGS)
+                mentions = ids_of[:size]
+                match |= news & np.isin(ids, mentions)
+            keep &= match
+        return keep
+
+    # function to read the matched rows from the frames, in the shape /api/search returns
+    def _items(self, ids: np.ndarray, scores: np.ndarray, docs: dict) -> pl.DataFrame:
+        items = {column: [] for column in ITEM_COLUMNS}
+        for doc in ids.tolist():
+            frame = self.frames[SOURCES[docs["table"][doc]]]
+            row = dict(zip(frame.columns, frame.row(int(docs["row"][doc]))))
+            items["source"].append(SOURCES[docs["table"][doc]])
+            items["ticker"].append(row.get("ticker"))
+            items["title"].append(
+                row.get("announcement") or row.get("headline") or row.get("heading")
+            )
+            items["summary"].append(row.get("summary"))
+            items["price_sensitive"].append(row.get("price_sensitive"))
+        items["date_time"] = docs["time"][ids]
+        items["score"] = scores.round(4)
+        df = pl.DataFrame(
+            [pl.Series(c, values, dtype=ITEM_COLUMNS[c]) for c, values in items.items()]
+        )
+        return df.with_column(pl.col("date_time").cast(pl.Datetime("ms")))
+
+    # function to run a search, opts as parse_search_args returns them
+    def query(self, opts: dict) -> dict:
+        docs = self.docs
+        n = len(docs["row"])
+        groups = _query_groups(self, opts["q"])
+        ids, scores = self._match(groups, n) if groups and n else EMPTY_MATCH
+        keep = self._filter(ids, docs, opts) if len(ids) > 0 else None
+        if keep is not None:
+            ids, scores = ids[keep], scores[keep]
+
+        top = _top(scores, ids, docs["time"], opts["limit"])
+        return {
+            "items": self._items(ids[top], scores[top], docs),
+            "total": len(ids),
+        }
+
+    def stats(self) -> dict:
+        return {
+            "documents": len(self),
+            "terms": len(self.vocab),
+            "rows": dict(self.rows),
+            "generations": dict(self.generations),
+            "updated_at": self.updated_at,
+        }
+
+
+### index of this worker ----
+_index = None
+_refresh_lock = threading.Lock()
+_refreshed_at = 0.0
+
+
+# function to bring the index up to date with the incremental loader's frames
+def refresh_index() -> SearchIndex:
+    global _index, _refreshed_at
+    try:
+        fetch_concurrently({t: partial(load_incremental, t) for t in SOURCES})
+        states = {table: frame_state(table) for table in SOURCES}
+        frames = {t: df for t, (df, _) in states.items() if df is not None}
+        generations = {t: g for t, (df, g) in states.items() if df is not None}
+
+        index = _index
+        if index is None or any(
+            index.generations.get(t) != g for t, g in generations.items()
+        ):
+            with stage("index", "build") as timer:
+                index = SearchIndex(generations)
+                index.add(frames)
+            logger.info(
+                f"built the search index of {len(index)} rows, "
+                f"{len(index.vocab)} terms... time taken: {timer.seconds} seconds"
+            )
+        else:
+            with stage("index", "append") as timer:
+                added = index.add(frames)
+            if added:
+                logger.info(
+                    f"indexed {added} new rows... time taken: {timer.seconds} seconds"
+                )
+        index.updated_at = time.time()
+        _index = index
+        return index
+    finally:
+        _refreshed_at = time.time()
+
+
+def _refresh_in_background():
+    if not _refresh_lock.acquire(blocking=False):
+        return
+    try:
+        refresh_index()
+    except Exception:
+        logger.exception("search index refresh failed")
+    finally:
+        _refresh_lock.release()
+
+
+# function to get the index, built on the first call and refreshed in the background after
+def get_index() -> SearchIndex:
+    if _index is None:
+        with _refresh_lock:
+            if _index is None:
+                return refresh_index()
+    if time.time() - _refreshed_at > cfg.search.refresh_interval:
+        if not _refresh_lock.locked():
+            threading.Thread(target=_refresh_in_background, daemon=True).start()
+    return _index
+
+
+# function to search the announcements and news, the payload of /api/search
+def search(opts: dict) -> dict:
+    index = get_index()
+    with stage("search") as timer:
+        payload = index.query(opts)
+    payload["took_ms"] = round(timer.seconds * 1000, 3)
+    return payload
+
+
+def search_stats() -> dict:
+    return _index.stats() if _index is not None else {"documents": 0}
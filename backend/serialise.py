@@ -0,0 +1,96 @@
+# import libraries
+import io
+
+import orjson
+import polars as pl
+from flask import Response, request
+from instrumentation import stage
+
+# response formats, picked from the request's Accept header: row oriented json (what the
+# frontend reads), {column: [values]} json, and arrow ipc for single table payloads
+JSON = "application/json"
+COLUMNS_JSON = "application/vnd.columns+json"
+ARROW_FILE = "application/vnd.apache.arrow.file"
+ALL_FORMATS = [JSON, COLUMNS_JSON, ARROW_FILE]
+
+
+# function to make temporal columns json friendly: datetimes as epoch ms (what pandas'
+# to_json used to give the frontend) and dates as iso strings
+def json_ready(df: pl.DataFrame) -> pl.DataFrame:
+    exprs = []
+    for name, dtype in df.schema.items():
+        if dtype == pl.Datetime:
+            exprs.append(pl.col(name).dt.timestamp("ms"))
+        elif dtype == pl.Date:
+            exprs.append(pl.col(name).cast(pl.Utf8))
+    return df.with_columns(exprs) if exprs else df
+
+
+# function to encode a frame as a json list of rows, written by polars without going
+# through pandas or python dicts
+def rows_json(df: pl.DataFrame) -> bytes:
+    if df.width == 0:
+        return b"[]"
+    return json_ready(df).write_json(row_oriented=True).encode()
+
+
+# function to encode a frame as a json object of columns, numeric columns without nulls are
+# handed to orjson as numpy arrays
+def columns_json(df: pl.DataFrame) -> bytes:
+    df = json_ready(df)
+    columns = {}
+    for name in df.columns:
+        series = df[name]
+        if series.is_numeric() and series.null_count() == 0:
+            columns[name] = series.to_numpy()
+        else:
+            columns[name] = series.to_list()
+    return orjson.dumps(columns, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+# function to encode a payload, splicing the frames' json into the envelope
+def encode_json(value, orient: str = "rows") -> bytes:
+    if isinstance(value, pl.DataFrame):
+        return rows_json(value) if orient == "rows" else columns_json(value)
+    if isinstance(value, dict):
+        return (
+            b"{"
+            + b",".join(
+                orjson.dumps(str(k)) + b":" + encode_json(v, orient)
+                for k, v in value.items()
+            )
+            + b"}"
+        )
+    return orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+# function to encode a payload whose frames are polars dfs in the format the accept header
+# (werkzeug MIMEAccept) asks for, returns (body, mimetype, headers). arrow is only offered when
+# "items" is a single frame, the other payload fields then go into X- headers
+def encode_payload(payload: dict, accept_mimetypes) -> tuple:
+    formats = (
+        ALL_FORMATS
+        if isinstance(payload.get("items"), pl.DataFrame)
+        else ALL_FORMATS[:2]
+    )
+    mimetype = accept_mimetypes.best_match(formats, default=JSON)
+
+    with stage("serialise", mimetype):
+        if mimetype == ARROW_FILE:
+            buffer = io.BytesIO()
+            payload["items"].write_ipc(buffer)
+            headers = {
+                "X-" + key.replace("_", "-").title(): str(value)
+                for key, value in payload.items()
+                if key != "items" and value is not None
+            }
+            return buffer.getvalue(), ARROW_FILE, headers
+
+        orient = "columns" if mimetype == COLUMNS_JSON else "rows"
+        return encode_json(payload, orient), mimetype, {}
+
+
+# function to build the flask response for a payload whose frames are polars dfs
+def frame_response(payload: dict) -> Response:
+    body, mimetype, headers = encode_payload(payload, request.accept_mimetypes)
+    return Response(body, mimetype=mimetype, headers=headers)
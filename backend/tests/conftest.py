@@ -0,0 +1,9 @@
+# import libraries
+import os
+import sys
+
+# the modules read config_db.yml from the working directory and import each other flat, as
+# they do when run from the backend folder
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(BACKEND_DIR)
+sys.path.insert(0, BACKEND_DIR)
@@ -0,0 +1,56 @@
+# import libraries
+import backtest
+import numpy as np
+import pandas as pd
+
+FIXTURE_DIR = backtest.cfg.forecast.prices.fixture_dir
+
+
+def test_committed_fixtures_are_found():
+    assert backtest.fixture_tickers(FIXTURE_DIR) == ["GOOG"]
+
+
+def test_walk_forward_cutoffs_on_the_fixture():
+    dates = backtest.load_closes(FIXTURE_DIR, "GOOG")["date"]
+
+    cutoffs = backtest.walk_forward_cutoffs(dates, 4, 12, 21)
+
+    # the latest cutoff leaves the last 4 bars to compare with, the others are 21 bars apart
+    positions = [dates[dates == cutoff].index[0] for cutoff in cutoffs]
+    assert len(cutoffs) == 12
+    assert positions[-1] == len(dates) - 4
+    assert np.diff(positions).tolist() == [21] * 11
+
+
+def test_cutoffs_stop_at_three_years_of_history():
+    dates = backtest.load_closes(FIXTURE_DIR, "GOOG")["date"]
+
+    cutoffs = backtest.walk_forward_cutoffs(dates, 4, 100, 21)
+
+    # the earliest cutoff has a full window behind it, the one a step before it would not
+    def lookback_start(cutoff):
+        return cutoff - pd.Timedelta(days=1) - backtest.LOOKBACK
+
+    earliest = dates[dates == cutoffs[0]].index[0]
+    assert len(cutoffs) < 100
+    assert lookback_start(cutoffs[0]) >= dates.iloc[0]
+    assert lookback_start(dates.iloc[earliest - 21]) < dates.iloc[0]
+
+
+def test_backtest_ticker_on_the_fixture():
+    closes = backtest.load_closes(FIXTURE_DIR, "GOOG")
+
+    rows, memory = backtest.backtest_ticker(
+        FIXTURE_DIR, "GOOG", {"small": {"n_estimators": 20}}, 4, 2, 21, nthread=1
+    )
+
+    assert [row["cutoff"] for row in rows] == [
+        c.date() for c in backtest.walk_forward_cutoffs(closes["date"], 4, 2, 21)
+    ]
+    last = rows[-1]
+    # the forecast is scored on the fixture's own last 4 bars
+    actual = [last[f"actual_{h}"] for h in range(1, 5)]
+    assert actual == closes["close"].iloc[-4:].tolist()
+    assert last["rounds"] <= 20
+    assert np.isfinite([last[f"pred_{h}"] for h in range(1, 5)]).all()
+    assert [m["config"] for m in memory] == ["small"]
@@ -0,0 +1,117 @@
+# import libraries
+import asyncio
+import threading
+import time
+
+import cache
+import pytest
+from flask import Flask
+
+
+@pytest.fixture
+def shared_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache.cfg.cache, "lock_dir", str(tmp_path / "locks"))
+    monkeypatch.setattr(cache.cfg.cache, "lock_timeout", 5)
+    monkeypatch.setattr(
+        cache.cfg.cache,
+        "backend",
+        cache.Box({"CACHE_TYPE": "FileSystemCache", "CACHE_DIR": str(tmp_path / "c")}),
+    )
+    app = Flask(__name__)
+    cache.init_cache(app)
+    with app.app_context():
+        yield cache
+
+
+def _counting_loader(calls: list, seconds: float = 0.3):
+    def loader():
+        calls.append(1)
+        time.sleep(seconds)
+        return {"rows": len(calls)}
+
+    return loader
+
+
+def test_concurrent_misses_load_once(shared_cache):
+    calls, results = [], []
+    loader = _counting_loader(calls)
+
+    def worker():
+        with cache._app.app_context():
+            results.append(cache.get_or_load("payload", loader, ttl=60))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [{"rows": 1}] * 8
+
+
+def test_lock_is_released_after_a_load(shared_cache):
+    cache.get_or_load("payload", _counting_loader([], 0), ttl=60)
+    lock_file = cache._try_lock("payload")
+    assert lock_file is not None
+    cache._unlock(lock_file)
+
+
+def test_lock_is_released_when_the_loader_fails(shared_cache):
+    def loader():
+        raise RuntimeError("database down")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_load("payload", loader, ttl=60)
+    lock_file = cache._try_lock("payload")
+    assert lock_file is not None
+    cache._unlock(lock_file)
+
+
+def test_waiting_worker_keeps_the_holders_lock(shared_cache, monkeypatch):
+    monkeypatch.setattr(cache.cfg.cache, "lock_timeout", 0.3)
+    # another worker is loading the key and never publishes within lock_timeout
+    holder = cache._try_lock("payload")
+    try:
+        calls = []
+        payload = cache.get_or_load("payload", _counting_loader(calls, 0), ttl=60)
+        assert payload == {"rows": 1}
+        assert cache._try_lock("payload") is None
+    finally:
+        cache._unlock(holder)
+
+
+def test_waiting_worker_serves_what_the_holder_published(shared_cache):
+    holder = cache._try_lock("payload")
+
+    def other_worker():
+        time.sleep(0.3)
+        with cache._app.app_context():
+            cache.publish("payload", {"rows": "theirs"}, 60)
+        cache._unlock(holder)
+
+    thread = threading.Thread(target=other_worker)
+    thread.start()
+    calls = []
+    assert cache.get_or_load("payload", _counting_loader(calls), ttl=60) == {
+        "rows": "theirs"
+    }
+    thread.join()
+    assert calls == []
+
+
+def test_concurrent_async_misses_load_once(shared_cache):
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.3)
+        return {"rows": len(calls)}
+
+    async def main():
+        return await asyncio.gather(
+            *[cache.get_or_load_async("payload", loader, 60) for _ in range(8)]
+        )
+
+    assert asyncio.run(main()) == [{"rows": 1}] * 8
+    assert len(calls) == 1
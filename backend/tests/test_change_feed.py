@@ -0,0 +1,173 @@
+# import libraries
+import asyncio
+import base64
+import importlib
+import json
+import sys
+import types
+from datetime import datetime
+
+import polars as pl
+import pytest
+
+COLUMNS = ["index", "headline", "summary", "extract_ts", "change_seq"]
+
+
+# the tables of the feed held in memory, answering the queries change_feed builds
+class _Tables:
+    def __init__(self, tables):
+        self.rows = {table: [] for table in tables}
+        self.seq = 0
+
+    # insert a headline, or edit the row held for it, numbering it like the trigger does
+    def write(self, table, headline, summary, extract_ts):
+        self.seq += 1
+        self.rows[table] = [r for r in self.rows[table] if r["headline"] != headline]
+        self.rows[table].append(
+            {
+                "index": 0,
+                "headline": headline,
+                "summary": summary,
+                "extract_ts": datetime.fromisoformat(extract_ts),
+                "change_seq": self.seq,
+            }
+        )
+
+    async def read(self, query, params=None):
+        table = query.split(" from ")[1].split()[0]
+        rows = sorted(self.rows[table], key=lambda r: r["change_seq"])
+        if query.startswith("Select coalesce(max(change_seq), 0)"):
+            return pl.DataFrame({"seq": [max([0] + [r["change_seq"] for r in rows])]})
+        if "cast(" in query:
+            since = datetime.fromisoformat(params["since"])
+            rows = [r for r in rows if r["extract_ts"] > since]
+        else:
+            rows = [r for r in rows if r["change_seq"] > params["since"]]
+        rows = [r for r in rows if r["change_seq"] <= params["until"]]
+        rows = rows[: params["limit"]]
+        return pl.DataFrame(
+            {c: [r[c] for r in rows] for c in COLUMNS},
+            schema={
+                "index": pl.Int64,
+                "headline": pl.Utf8,
+                "summary": pl.Utf8,
+                "extract_ts": pl.Datetime,
+                "change_seq": pl.Int64,
+            },
+        )
+
+
+@pytest.fixture
+def change_feed(monkeypatch):
+    # app.py loads the payloads from the database when imported, the feed only needs its
+    # announcements join, which the news topic used here never calls
+    fake_app = types.ModuleType("app")
+    fake_app.join_announcements = None
+    monkeypatch.setitem(sys.modules, "app", fake_app)
+    monkeypatch.delitem(sys.modules, "change_feed", raising=False)
+    return importlib.import_module("change_feed")
+
+
+@pytest.fixture
+def tables(change_feed, monkeypatch):
+    tables = _Tables(change_feed.FEED_TABLES)
+    monkeypatch.setattr(change_feed, "read_frame_async", tables.read)
+    return tables
+
+
+def _event(raw: bytes) -> tuple:
+    fields = dict(
+        line.split(": ", 1) for line in raw.decode().strip().split("\n") if ": " in line
+    )
+    return fields["id"], fields["event"], json.loads(fields["data"])["items"]
+
+
+def _headlines(items: dict) -> list:
+    return [(r["headline"], r["summary"]) for r in items["afr_homepage"]]
+
+
+def _event_id(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+
+@pytest.mark.parametrize(
+    "last_event_id",
+    [
+        "not an id!",
+        _event_id([1]),
+        _event_id({"unknown_table": 1}),
+        _event_id({"afr_homepage": -1}),
+        _event_id({"afr_homepage": True}),
+        _event_id({"afr_homepage": "2023-01-31 09:00:00"}),
+    ],
+)
+def test_bad_last_event_ids_are_rejected_before_streaming(change_feed, last_event_id):
+    with pytest.raises(ValueError, match="invalid last event id"):
+        change_feed.parse_since(last_event_id, None, ["news"])
+
+
+def test_poll_publishes_new_and_edited_rows(change_feed, tables):
+    tables.write("afr_homepage", "a", "first", "2023-01-31 09:00")
+    tables.write("afr_homepage", "b", "second", "2023-01-31 09:05")
+    feed = change_feed.ChangeFeed()
+    subscriber = change_feed._Subscriber(["news"])
+
+    async def run():
+        await feed.poll()
+        feed.subscribers.add(subscriber)
+        tables.write("afr_homepage", "a", "first, edited", "2023-01-31 09:00")
+        tables.write("afr_homepage", "c", "third", "2023-01-31 09:10")
+        await feed.poll()
+        return subscriber.queue.get_nowait()
+
+    event_id, topic, items = _event(asyncio.run(run()))
+
+    assert topic == "news"
+    assert _headlines(items) == [("a", "first, edited"), ("c", "third")]
+    assert change_feed.decode_event_id(event_id)["afr_homepage"] == 4
+    assert feed.cursor["afr_homepage"] == 4
+
+
+def test_catch_up_sends_the_rows_changed_after_the_last_event(change_feed, tables):
+    for i, headline in enumerate("abcd"):
+        tables.write("afr_homepage", headline, "x", f"2023-01-31 09:0{i}")
+    tables.write("afr_homepage", "a", "edited", "2023-01-31 09:00")
+    feed = change_feed.ChangeFeed()
+    asyncio.run(feed.poll())
+
+    since = change_feed.parse_since(_event_id({"afr_homepage": 3}), None, ["news"])
+    events = asyncio.run(feed._catch_up(since, dict(feed.cursor), ["news"]))
+
+    assert len(events) == 1
+    _, _, items = _event(events[0])
+    assert _headlines(items) == [("d", "x"), ("a", "edited")]
+
+
+def test_catch_up_from_a_row_time(change_feed, tables):
+    tables.write("afr_homepage", "a", "x", "2023-01-31 09:00")
+    tables.write("afr_homepage", "b", "x", "2023-01-31 09:05")
+    feed = change_feed.ChangeFeed()
+    asyncio.run(feed.poll())
+
+    since = change_feed.parse_since(None, "2023-01-31T09:02", ["news"])
+    events = asyncio.run(feed._catch_up(since, dict(feed.cursor), ["news"]))
+
+    _, _, items = _event(events[0])
+    assert _headlines(items) == [("b", "x")]
+
+
+def test_catch_up_past_max_catch_up_asks_for_a_reload(change_feed, tables, monkeypatch):
+    for headline in "abc":
+        tables.write("afr_homepage", headline, "x", "2023-01-31 09:00")
+    feed = change_feed.ChangeFeed()
+    asyncio.run(feed.poll())
+    monkeypatch.setattr(change_feed.cfg.stream, "max_catch_up", 2)
+
+    since = change_feed.parse_since(_event_id({"afr_homepage": 0}), None, ["news"])
+    assert asyncio.run(feed._catch_up(since, dict(feed.cursor), ["news"])) is None
+
+
+@pytest.mark.parametrize("since", ["yesterday", "inf", "nan", "1e30"])
+def test_bad_since_is_rejected_before_streaming(change_feed, since):
+    with pytest.raises(ValueError, match="since must be"):
+        change_feed.parse_since(None, since, ["news"])
@@ -0,0 +1,190 @@
+# import libraries
+import asyncio
+import logging
+
+import database
+import polars as pl
+import pytest
+
+
+class _FailingConnectorx:
+    def __init__(self, error):
+        self.error = error
+        self.calls = 0
+
+    def read_sql(self, *args, **kwargs):
+        self.calls += 1
+        raise self.error
+
+
+@pytest.fixture
+def pandas_reads(monkeypatch):
+    reads = []
+
+    def read_frame_pandas(query, params=None):
+        reads.append(query)
+        return pl.DataFrame({"x": [1]})
+
+    monkeypatch.setattr(database, "read_frame_pandas", read_frame_pandas)
+    monkeypatch.setattr(database, "get_database_url", lambda: "postgresql://")
+    monkeypatch.setattr(database, "_fallback_logged", False)
+    monkeypatch.setattr(database.cfg.ingest, "backend", "connectorx")
+    return reads
+
+
+def test_connection_errors_fall_back_and_warn_once(pandas_reads, monkeypatch, caplog):
+    cx = _FailingConnectorx(RuntimeError("could not connect"))
+    monkeypatch.setattr(database, "cx", cx)
+
+    with caplog.at_level(logging.DEBUG):
+        database.read_frame("select 1")
+        database.read_frame("select 1")
+
+    assert cx.calls == 2
+    assert len(pandas_reads) == 2
+    warnings = [r for r in caplog.records if r.levelno == logging.WARNING]
+    assert len(warnings) == 1
+    assert "could not connect" in warnings[0].getMessage()
+
+
+def test_unexpected_errors_are_raised(pandas_reads, monkeypatch):
+    monkeypatch.setattr(database, "cx", _FailingConnectorx(TypeError("bug")))
+    with pytest.raises(TypeError):
+        database.read_frame("select 1")
+    assert pandas_reads == []
+
+
+def test_missing_connectorx_reads_through_pandas(pandas_reads, monkeypatch):
+    monkeypatch.setattr(database, "cx", None)
+    assert database.read_frame("select 1").height == 1
+    assert pandas_reads == ["select 1"]
+
+
+def test_only_bulk_reads_go_through_connectorx(pandas_reads, monkeypatch):
+    cx = _FailingConnectorx(RuntimeError("could not connect"))
+    monkeypatch.setattr(database, "cx", cx)
+    monkeypatch.setattr(database.cfg.ingest, "backend", "pandas")
+    monkeypatch.setattr(database.cfg.ingest, "bulk_backend", "connectorx")
+
+    database.read_frame("select 1")
+    assert cx.calls == 0
+    database.read_frame("select 2", bulk=True)
+    assert cx.calls == 1
+    assert pandas_reads == ["select 1", "select 2"]
+
+
+def test_render_query_replaces_whole_parameters_only():
+    query = database._render_query(
+        "select * from t where a > :since and b > :since_ts::date and c = :name",
+        {"since": 1, "since_ts": "2023-01-31", "name": "o'neil"},
+    )
+    assert query == (
+        "select * from t where a > 1 and b > '2023-01-31'::date and c = 'o''neil'"
+    )
+    assert database._render_query("select :missing", {}) == "select :missing"
+
+
+### market index ----
+@pytest.fixture
+def market_index_reads(monkeypatch):
+    reads = []
+    signatures = ["16384:1"]
+
+    def read_frame(query, params=None):
+        reads.append(query)
+        if query == database.TABLE_VERSIONS_QUERY:
+            return pl.DataFrame({"present": [True]})
+        if query == database.MARKET_INDEX_SIGNATURE_QUERY:
+            return pl.DataFrame({"signature": [signatures[-1]]})
+        if "market_index_norm" in query:
+            return pl.DataFrame(
+                {"ticker": ["BHP"], "market_cap_mod": [1.0], "source_signature": ["x"]}
+            )
+        raise AssertionError(f"unexpected query {query}")
+
+    async def read_frame_async(query, params=None):
+        return read_frame(query, params)
+
+    monkeypatch.setattr(database, "read_frame", read_frame)
+    monkeypatch.setattr(database, "read_frame_async", read_frame_async)
+    monkeypatch.setattr(database, "_market_index", {"signature": None, "df": None})
+    monkeypatch.setattr(
+        database, "_table_versions", {"present": False, "warned": False}
+    )
+    return reads, signatures
+
+
+def test_signature_query_does_not_scan_market_index():
+    query = database.MARKET_INDEX_SIGNATURE_QUERY.lower()
+    assert "string_agg" not in query
+    assert "from market_index" not in query
+
+
+def test_market_index_is_only_reread_when_its_signature_changes(market_index_reads):
+    reads, signatures = market_index_reads
+    first = database.get_marketindex()
+    database.get_marketindex()
+    assert sum("market_index_norm" in q for q in reads) == 1
+
+    signatures.append("16384:2")
+    database.get_marketindex()
+    assert sum("market_index_norm" in q for q in reads) == 2
+    assert first.columns == ["ticker", "market_cap_mod"]
+
+
+def test_market_index_is_hashed_until_table_versions_exists(monkeypatch, caplog):
+    monkeypatch.setattr(database, "_market_index", {"signature": None, "df": None})
+    monkeypatch.setattr(
+        database, "_table_versions", {"present": False, "warned": False}
+    )
+    migrated = [False]
+    reads = []
+
+    def read_frame(query, params=None):
+        reads.append(query)
+        if query == database.TABLE_VERSIONS_QUERY:
+            return pl.DataFrame({"present": [migrated[0]]})
+        return pl.DataFrame({"signature": [query]})
+
+    monkeypatch.setattr(database, "read_frame", read_frame)
+
+    with caplog.at_level(logging.WARNING):
+        assert database.market_index_signature() == database.MARKET_INDEX_HASH_QUERY
+        assert database.market_index_signature() == database.MARKET_INDEX_HASH_QUERY
+    assert (
+        sum("table_versions does not exist" in r.message for r in caplog.records) == 1
+    )
+
+    # once the migration is applied the version row is used, without checking again
+    migrated[0] = True
+    assert database.market_index_signature() == database.MARKET_INDEX_SIGNATURE_QUERY
+    reads.clear()
+    database.market_index_signature()
+    assert reads == [database.MARKET_INDEX_SIGNATURE_QUERY]
+
+
+def test_async_market_index_shares_the_cached_frame(market_index_reads):
+    reads, _ = market_index_reads
+    sync_df = database.get_marketindex()
+    async_df = asyncio.run(database.get_marketindex_async())
+    assert async_df is sync_df
+    assert sum("market_index_norm" in q for q in reads) == 1
+
+
+def test_table_versions_migration_splits_into_statements():
+    from migrate import MIGRATIONS_DIR, split_statements
+
+    sql = (MIGRATIONS_DIR / "0003_table_versions.sql").read_text()
+    statements = split_statements(sql)
+    assert len(statements) == 4
+    assert statements[1].startswith("CREATE OR REPLACE FUNCTION bump_table_version()")
+    assert "ON CONFLICT (table_name)" in statements[1]
+
+
+def test_change_seq_migration_splits_into_statements():
+    from migrate import MIGRATIONS_DIR, split_statements
+
+    statements = split_statements((MIGRATIONS_DIR / "0004_change_seq.sql").read_text())
+    assert len(statements) == 2 + 4 * 6
+    assert statements[1].startswith("CREATE OR REPLACE FUNCTION set_change_seq()")
+    assert sum(s.startswith("CREATE TRIGGER") for s in statements) == 6
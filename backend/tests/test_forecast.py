@@ -0,0 +1,72 @@
+# import libraries
+from collections import OrderedDict
+
+import forecast
+import model_registry
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    monkeypatch.setattr(model_registry, "REGISTRY_DIR", tmp_path)
+    monkeypatch.setattr(model_registry, "_models", OrderedDict())
+    # without early stopping every round is kept, so the tree count is predictable
+    monkeypatch.setattr(
+        forecast,
+        "XGB_PARAMS",
+        {**forecast.XGB_PARAMS, "n_estimators": 10, "early_stopping_rounds": None},
+    )
+    monkeypatch.setattr(forecast.cfg.forecast.registry, "warm_start_rounds", 5)
+    monkeypatch.setattr(forecast.cfg.forecast.registry, "max_rounds", 20)
+    return tmp_path
+
+
+def _stock_df(end: str) -> pd.DataFrame:
+    dates = pd.bdate_range(end=end, periods=120)
+    close = 10 + np.cumsum(np.random.default_rng(0).normal(0, 0.1, len(dates)))
+    return pd.DataFrame({"date": dates, "close": close})
+
+
+def test_warm_starts_stop_at_max_rounds(registry):
+    fits = []
+    for end in pd.bdate_range("2023-03-01", periods=5):
+        stock_df = _stock_df(end)
+        X_train, y_train, X_val, y_val, _, _ = forecast.create_dfs(stock_df, 10)
+        model, fit = forecast.get_or_fit_model(
+            "ABC", end.date(), stock_df, X_train, y_train, X_val, y_val
+        )
+        fits.append((fit["source"], model.num_boosted_rounds()))
+
+    assert fits == [
+        ("full_fit", 10),
+        ("warm_start", 15),
+        ("warm_start", 20),
+        ("full_fit", 10),
+        ("warm_start", 15),
+    ]
+
+
+def test_loaded_models_get_their_threads_once(registry, monkeypatch):
+    stock_df = _stock_df("2023-03-01")
+    X_train, y_train, X_val, y_val, _, _ = forecast.create_dfs(stock_df, 10)
+    end = stock_df["date"].max().date()
+    forecast.get_or_fit_model("ABC", end, stock_df, X_train, y_train, X_val, y_val)
+    model_registry._models.clear()
+
+    model, fit = forecast.get_or_fit_model(
+        "ABC", end, stock_df, X_train, y_train, X_val, y_val
+    )
+    assert fit["source"] == "registry"
+
+    # the shared booster is returned as loaded, never reconfigured per call
+    calls = []
+    monkeypatch.setattr(
+        type(model), "set_param", lambda self, *args: calls.append(args)
+    )
+    again, _ = forecast.get_or_fit_model(
+        "ABC", end, stock_df, X_train, y_train, X_val, y_val
+    )
+    assert again is model
+    assert calls == []
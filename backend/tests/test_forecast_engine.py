@@ -0,0 +1,76 @@
+# import libraries
+import numpy as np
+import pandas as pd
+import pytest
+import xgboost as xgb
+from forecast import create_dfs
+from forecast_engine import recursive_forecast
+from trainer import to_dmatrix
+from utils.global_functions import add_lags
+
+N = 10
+
+
+def _closes(seed: int, periods: int = 120) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return (10 + np.cumsum(rng.normal(0, 0.1, periods))).astype(np.float32)
+
+
+def _booster(closes: np.ndarray) -> xgb.Booster:
+    df = pd.DataFrame(
+        {"date": pd.bdate_range(end="2023-03-01", periods=len(closes)), "close": closes}
+    )
+    X_train, y_train, _, _, _, _ = create_dfs(df, N)
+    return xgb.train(
+        {"max_depth": 3, "tree_method": "hist"},
+        to_dmatrix(X_train, y_train),
+        num_boost_round=20,
+    )
+
+
+# the step by step forecast the buffer replaces: append the predictions so far, build the lag
+# features of the whole frame with add_lags and predict its last row
+def _frame_forecast(booster: xgb.Booster, closes: np.ndarray, horizon: int) -> list:
+    lag_cols = [f"close_lag_{i}" for i in range(1, N + 1)]
+    closes = list(closes)
+    predictions = []
+    for _ in range(horizon):
+        df_lags = add_lags(pd.DataFrame({"close": closes}), N, ["close"])
+        X = df_lags[lag_cols].iloc[[-1]].astype(np.float32)
+        prediction = float(booster.predict(xgb.DMatrix(X, feature_names=lag_cols))[0])
+        predictions.append(prediction)
+        closes.append(prediction)
+    return predictions
+
+
+def test_single_series_matches_predicting_add_lags_rows():
+    closes = _closes(0)
+    booster = _booster(closes)
+
+    forecast = recursive_forecast([booster], [closes], N, 6)
+
+    assert forecast.shape == (1, 6)
+    np.testing.assert_allclose(
+        forecast[0], _frame_forecast(booster, closes, 6), rtol=1e-6
+    )
+
+
+def test_batched_series_match_forecasting_each_alone():
+    histories = [
+        _closes(seed, periods) for seed, periods in [(1, 120), (2, 90), (3, 60)]
+    ]
+    shared, other = _booster(histories[0]), _booster(histories[1])
+    boosters = [shared, other, shared]
+
+    batched = recursive_forecast(boosters, histories, N, 5)
+
+    alone = [recursive_forecast([b], [h], N, 5)[0] for b, h in zip(boosters, histories)]
+    np.testing.assert_array_equal(batched, np.stack(alone))
+    # the two series sharing a booster still get their own forecasts
+    assert not np.array_equal(batched[0], batched[2])
+
+
+def test_short_histories_are_rejected():
+    closes = _closes(0)
+    with pytest.raises(ValueError, match="need at least 11 closes"):
+        recursive_forecast([_booster(closes)], [closes[:N]], N, 3)
@@ -0,0 +1,103 @@
+# import libraries
+import threading
+import time
+from concurrent.futures import Future
+
+import cache
+import forecast_jobs
+import pytest
+from flask import Flask
+
+
+class _Executor:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, *args):
+        self.submitted.append(args)
+        return Future()
+
+
+@pytest.fixture
+def executor(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache.cfg.cache, "lock_dir", str(tmp_path))
+    app = Flask(__name__)
+    forecast_jobs.jobs.init_app(app, config={"CACHE_TYPE": "SimpleCache"})
+    forecast_jobs.jobs.app = app
+    monkeypatch.setattr(forecast_jobs, "_app", app)
+    monkeypatch.setattr(forecast_jobs, "_futures", {})
+    executor = _Executor()
+    monkeypatch.setattr(forecast_jobs, "get_executor", lambda: executor)
+    with app.app_context():
+        yield executor
+
+
+def test_racing_claims_share_one_job(executor, monkeypatch):
+    # widen the window between reading the claim and setting it, without the lock both
+    # submitters find the ticker unclaimed and each queues a job
+    get = forecast_jobs.jobs.get
+
+    def slow_get(key):
+        value = get(key)
+        time.sleep(0.05)
+        return value
+
+    monkeypatch.setattr(forecast_jobs.jobs, "get", slow_get)
+    barrier = threading.Barrier(2)
+    results = []
+
+    def claim():
+        barrier.wait()
+        results.append(forecast_jobs.submit_job("ABC", 4))
+
+    threads = [threading.Thread(target=claim) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(created for _, created in results) == [False, True]
+    assert results[0][0]["id"] == results[1][0]["id"]
+    assert len(executor.submitted) == 1
+
+
+def test_releasing_a_finished_job_keeps_a_newer_claim(executor):
+    old, _ = forecast_jobs.submit_job("ABC", 4)
+    forecast_jobs.cancel_job(old["id"])
+    new, created = forecast_jobs.submit_job("ABC", 4)
+
+    forecast_jobs._release(old)
+
+    assert created
+    key = forecast_jobs._inflight_key("ABC", 4)
+    assert forecast_jobs.jobs.get(key) == new["id"]
+
+
+def test_stale_jobs_are_reaped_by_the_submitting_process(executor, monkeypatch):
+    stale, _ = forecast_jobs.submit_job("ABC", 4)
+    record = forecast_jobs.jobs.get(forecast_jobs._job_key(stale["id"]))
+    record["submitted_at"] = (
+        time.time() - forecast_jobs.cfg.forecast.jobs.max_runtime - 1
+    )
+    forecast_jobs._save(record)
+    monkeypatch.setattr(forecast_jobs.cfg.forecast.jobs, "max_queued", 1)
+
+    # the stuck job neither fills the queue nor keeps its ticker claimed
+    fresh, created = forecast_jobs.submit_job("ABC", 4)
+
+    assert created and fresh["id"] != stale["id"]
+    reaped = forecast_jobs.jobs.get(forecast_jobs._job_key(stale["id"]))
+    assert (reaped["status"], reaped["error"]) == ("failed", "timed out")
+    assert list(forecast_jobs._futures) == [fresh["id"]]
+
+
+def test_worker_skips_jobs_that_timed_out_in_the_queue(executor):
+    job, _ = forecast_jobs.submit_job("ABC", 4)
+    job["submitted_at"] -= forecast_jobs.cfg.forecast.jobs.max_runtime + 1
+    forecast_jobs._save(job)
+
+    forecast_jobs._run_job(job["id"])
+
+    record = forecast_jobs.jobs.get(forecast_jobs._job_key(job["id"]))
+    assert (record["status"], record["started_at"]) == ("failed", None)
+    assert forecast_jobs.jobs.get(forecast_jobs._inflight_key("ABC", 4)) is None
@@ -0,0 +1,27 @@
+# import libraries
+import gc
+import runpy
+
+import pytest
+
+
+@pytest.fixture
+def conf(monkeypatch):
+    # set by the config for the master, removed again after the test
+    monkeypatch.setenv("STOCK_APP_PRELOAD_MASTER", "")
+    try:
+        yield runpy.run_path("gunicorn.conf.py")
+    finally:
+        gc.unfreeze()
+        gc.enable()
+
+
+def test_master_collects_again_once_the_app_is_loaded(conf):
+    assert conf["preload_app"]
+    # off while the app is imported
+    assert not gc.isenabled()
+
+    conf["when_ready"](None)
+
+    assert gc.isenabled()
+    assert gc.get_freeze_count() > 0
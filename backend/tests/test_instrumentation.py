@@ -0,0 +1,50 @@
+# import libraries
+import time
+
+import instrumentation
+import pytest
+
+
+@pytest.fixture
+def trace_file(tmp_path, monkeypatch):
+    path = tmp_path / "spans.jsonl"
+    monkeypatch.setattr(instrumentation.cfg.tracing, "file", str(path))
+    monkeypatch.setattr(instrumentation.cfg.tracing, "enabled", True)
+    monkeypatch.setattr(instrumentation.cfg.tracing, "sample_rate", 1.0)
+    monkeypatch.setattr(instrumentation.cfg.tracing, "max_bytes", 2000)
+    monkeypatch.setattr(instrumentation.cfg.tracing, "backup_count", 2)
+    return path
+
+
+def test_trace_file_is_rotated_at_max_bytes(trace_file):
+    for i in range(50):
+        with instrumentation.stage("load", "announcements", attempt=i):
+            pass
+
+    files = sorted(p.name for p in trace_file.parent.glob("spans.jsonl*"))
+    assert files == [
+        "spans.jsonl",
+        "spans.jsonl.1",
+        "spans.jsonl.2",
+        "spans.jsonl.lock",
+    ]
+    # a file is rotated by the write that takes it past max_bytes
+    line = max(
+        len(l) for l in (trace_file.parent / "spans.jsonl.1").read_text().splitlines()
+    )
+    for name in files[:3]:
+        assert (trace_file.parent / name).stat().st_size < 2000 + line + 1
+
+
+def test_peak_mem_sampler_keeps_the_highest_get_mem(monkeypatch):
+    readings = [100.0, 180.0, 120.0]
+    monkeypatch.setattr(
+        instrumentation, "get_mem", lambda: readings.pop(0) if readings else 110.0
+    )
+
+    with instrumentation.PeakMemSampler(interval=0.001) as sampler:
+        deadline = time.time() + 5
+        while readings and time.time() < deadline:
+            time.sleep(0.001)
+
+    assert sampler.peak == 180.0
@@ -0,0 +1,83 @@
+# import libraries
+import base64
+import json
+from datetime import datetime
+
+import polars as pl
+import pytest
+from paging import (
+    decode_cursor,
+    encode_cursor,
+    parse_announcement_args,
+    query_announcements,
+)
+
+
+def _raw_cursor(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+
+@pytest.fixture
+def announcements():
+    return pl.DataFrame(
+        {
+            "ticker": ["AAA", "BBB", "CCC", "DDD", "EEE"],
+            "name": ["a", "b", "c", "d", "e"],
+            "announcement": ["one", "two", "three", "four", "five"],
+            "price_sensitive": ["PRICE SENSITIVE"] * 5,
+            "market_cap": [5.0, None, 3.0, 3.0, 1.0],
+            "announcement_time": [datetime(2023, 1, d) for d in range(1, 6)],
+        }
+    )
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not base64!",
+        _raw_cursor(1),
+        _raw_cursor([]),
+        _raw_cursor("ticker"),
+        _raw_cursor({}),
+        _raw_cursor({"s": "ticker", "v": "AAA"}),
+        _raw_cursor({"s": "ticker", "v": "AAA", "k": 1}),
+        _raw_cursor({"s": "ticker", "v": None, "k": "AAA"}),
+        _raw_cursor({"s": "ticker", "v": ["AAA"], "k": "AAA"}),
+        _raw_cursor({"s": "ticker", "v": "AAA", "k": "AAA", "x": 1}),
+    ],
+)
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(ValueError, match="invalid cursor"):
+        decode_cursor(cursor)
+
+
+def test_cursor_value_must_match_the_sort_column():
+    with pytest.raises(ValueError, match="invalid cursor"):
+        parse_announcement_args(
+            {"sort": "market_cap", "cursor": encode_cursor("market_cap", "x", "k")}
+        )
+    with pytest.raises(ValueError, match="invalid cursor"):
+        parse_announcement_args(
+            {"sort": "ticker", "cursor": encode_cursor("ticker", 1.0, "k")}
+        )
+
+
+def test_cursor_from_another_sort_is_rejected():
+    with pytest.raises(ValueError, match="different sort order"):
+        parse_announcement_args(
+            {"sort": "name", "cursor": encode_cursor("ticker", "a", "k")}
+        )
+
+
+@pytest.mark.parametrize("sort", ["ticker", "-market_cap", "market_cap"])
+def test_cursor_pages_walk_every_row_once(announcements, sort):
+    seen = []
+    args = {"sort": sort, "page_size": "2"}
+    while True:
+        page = query_announcements(announcements, parse_announcement_args(args))
+        seen.extend(page["items"]["ticker"].to_list())
+        if page["next_cursor"] is None:
+            break
+        args["cursor"] = page["next_cursor"]
+
+    assert sorted(seen) == sorted(announcements["ticker"].to_list())
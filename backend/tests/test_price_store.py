@@ -0,0 +1,71 @@
+# import libraries
+from datetime import date
+
+import pandas as pd
+import price_store
+import pytest
+
+
+class _EmptySource(price_store.PriceSource):
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = []
+
+    def fetch(self, ticker, start, end):
+        self.calls.append((start, end))
+        if self.error:
+            raise self.error
+        return pd.DataFrame(columns=price_store.PRICE_COLUMNS)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(price_store, "STORE_DIR", tmp_path)
+    monkeypatch.setattr(price_store, "_source", None)
+    return tmp_path
+
+
+def _coverage(ticker):
+    _, meta_path, _ = price_store._paths(ticker)
+    return price_store._read_coverage(meta_path)
+
+
+def test_empty_fetch_over_closed_days_is_recorded(store):
+    source = _EmptySource()
+    price_store.set_source(source)
+
+    # easter 2023: good friday to easter monday, the asx is closed all four days
+    price_store.fill_gaps("ABC", date(2023, 4, 7), date(2023, 4, 11))
+
+    assert _coverage("ABC") == (date(2023, 4, 7), date(2023, 4, 11))
+    price_store.fill_gaps("ABC", date(2023, 4, 7), date(2023, 4, 11))
+    assert len(source.calls) == 1
+
+
+def test_short_empty_fetch_over_trading_days_is_retried(store):
+    source = _EmptySource()
+    price_store.set_source(source)
+
+    # a tuesday to thursday, well under a week but every day a trading day
+    price_store.fill_gaps("ABC", date(2023, 4, 11), date(2023, 4, 14))
+    price_store.fill_gaps("ABC", date(2023, 4, 11), date(2023, 4, 14))
+
+    assert _coverage("ABC") == (None, None)
+    assert len(source.calls) == 2
+
+
+def test_failed_fetch_is_not_recorded(store):
+    price_store.set_source(_EmptySource(OSError("connection reset")))
+
+    with pytest.raises(OSError):
+        price_store.fill_gaps("ABC", date(2023, 4, 8), date(2023, 4, 10))
+
+    assert _coverage("ABC") == (None, None)
+
+
+def test_sources_must_implement_fetch():
+    class _NoFetch(price_store.PriceSource):
+        pass
+
+    with pytest.raises(TypeError):
+        _NoFetch()
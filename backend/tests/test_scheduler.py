@@ -0,0 +1,37 @@
+# import libraries
+import runpy
+import sys
+import types
+
+import pytest
+import scheduler
+
+
+@pytest.fixture
+def jobs(monkeypatch):
+    monkeypatch.setattr(scheduler, "_jobs", {})
+    return scheduler._jobs
+
+
+def test_run_forever_without_jobs_fails_loudly(jobs):
+    with pytest.raises(RuntimeError, match="no payloads are registered"):
+        scheduler.run_forever(object())
+
+
+def test_process_mode_runs_the_jobs_the_app_registered(jobs, monkeypatch):
+    # a stand-in for app.py, which registers its payloads on the imported scheduler module
+    fake_app = types.ModuleType("app")
+    fake_app.app = object()
+    scheduler.register_job("announcements_frame", lambda: "payload", 60)
+    monkeypatch.setitem(sys.modules, "app", fake_app)
+
+    runs = []
+    monkeypatch.setattr(
+        scheduler, "run_forever", lambda app: runs.append((app, dict(scheduler._jobs)))
+    )
+    runpy.run_path("scheduler.py", run_name="__main__")
+
+    assert len(runs) == 1
+    app, registered = runs[0]
+    assert app is fake_app.app
+    assert list(registered) == ["announcements_frame"]
@@ -0,0 +1,52 @@
+# import libraries
+from datetime import datetime, timedelta
+
+import polars as pl
+import search
+
+
+def _announcements(rows: int) -> pl.DataFrame:
+    return pl.DataFrame(
+        {
+            "ticker": [f"T{i % 3}" for i in range(rows)],
+            "announcement": [
+                "quarterly report" if i % 2 else f"capital raising {i}"
+                for i in range(rows)
+            ],
+            "price_sensitive": ["PRICE SENSITIVE"] * rows,
+            "date_time": [
+                datetime(2023, 1, 1) + timedelta(hours=i) for i in range(rows)
+            ],
+        }
+    )
+
+
+def test_appends_grow_the_documents_geometrically():
+    df = _announcements(200)
+    index = search.SearchIndex({"announcements": 1})
+    capacities = set()
+    for end in range(10, 201, 10):
+        assert index.add({"announcements": df.head(end)}) == 10
+        capacities.add(len(index._docs[0]["row"]))
+
+    assert len(index) == 200
+    # the arrays were reallocated a handful of times, not once per append
+    assert len(capacities) <= 5
+    assert index.docs["row"].tolist() == list(range(200))
+    assert len(index.docs["time"]) == 200
+
+
+def test_queries_see_every_appended_document():
+    df = _announcements(100)
+    index = search.SearchIndex({"announcements": 1})
+    index.add({"announcements": df.head(3)})
+    for end in range(7, 101, 7):
+        index.add({"announcements": df.head(end)})
+    index.add({"announcements": df})
+
+    opts = search.parse_search_args({"q": "quarterly report ", "limit": "100"})
+    assert index.query(opts)["total"] == 50
+    opts = search.parse_search_args({"q": "capital ", "ticker": "T1", "limit": "100"})
+    assert index.query(opts)["total"] == len(
+        [i for i in range(0, 100, 2) if i % 3 == 1]
+    )
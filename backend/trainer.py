@@ -0,0 +1,86 @@
+# import libraries
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+# keys of the forecast hyperparameters that aren't booster parameters
+ROUND_KEYS = ["n_estimators", "early_stopping_rounds"]
+
+
+# function to turn the sklearn style hyperparameters into booster parameters
+def booster_params(params: dict, nthread: int) -> dict:
+    native = {k: v for k, v in params.items() if k not in ROUND_KEYS}
+    native.setdefault("objective", "reg:squarederror")
+    native["nthread"] = nthread
+    return native
+
+
+def default_nthread() -> int:
+    return os.cpu_count() or 1
+
+
+# function to build the float32 DMatrix of a feature frame, built once per dataset and used for
+# both training and evaluation
+def to_dmatrix(
+    X: pd.DataFrame, y: pd.Series = None, nthread: int = None
+) -> xgb.DMatrix:
+    return xgb.DMatrix(
+        np.ascontiguousarray(X.to_numpy(dtype=np.float32)),
+        label=None if y is None else y.to_numpy(dtype=np.float32),
+        feature_names=list(X.columns),
+        nthread=nthread or default_nthread(),
+    )
+
+
+# function to train a booster with early stopping on the validation set, continuing xgb_model if
+# given. the booster is cut back to its best round, returns (booster, fit stats)
+def train_booster(
+    params: dict,
+    dtrain: xgb.DMatrix,
+    dval: xgb.DMatrix,
+    num_boost_round: int,
+    nthread: int = None,
+    xgb_model: xgb.Booster = None,
+):
+    nthread = nthread or default_nthread()
+    previous_rounds = xgb_model.num_boosted_rounds() if xgb_model is not None else 0
+    evals_result = {}
+
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    booster = xgb.train(
+        booster_params(params, nthread),
+        dtrain,
+        num_boost_round=num_boost_round,
+        # only the validation set is evaluated, it is all early stopping needs
+        evals=[(dval, "val")],
+        early_stopping_rounds=params.get("early_stopping_rounds"),
+        evals_result=evals_result,
+        xgb_model=xgb_model,
+        verbose_eval=False,
+    )
+    fit_secs = time.perf_counter() - start
+    cpu_secs = time.process_time() - cpu_start
+
+    # without early stopping best_iteration is the last round
+    best_iteration = getattr(
+        booster, "best_iteration", booster.num_boosted_rounds() - 1
+    )
+    if best_iteration + 1 < booster.num_boosted_rounds():
+        booster = booster[: best_iteration + 1]
+    rounds = booster.num_boosted_rounds()
+
+    val_rmse = evals_result["val"]["rmse"]
+    fit = {
+        "fit_secs": fit_secs,
+        "cpu_secs": cpu_secs,
+        "nthread": nthread,
+        "rounds": rounds,
+        "new_rounds": rounds - previous_rounds,
+        "max_rounds": previous_rounds + num_boost_round,
+        "val_rmse": float(val_rmse[max(0, best_iteration - previous_rounds)]),
+    }
+    return booster, fit
@@ -1,8 +1,9 @@
+import re
 import sys
 
 import numpy as np
 import pandas as pd
-import regex as re
+from numpy.lib.stride_tricks import sliding_window_view
 import yaml
 from box import Box
 
@@ -85,3 +86,52 @@ def add_lags(df, N, lag_cols):
         df_w_lags = pd.merge(df_w_lags, train_shift, on=merging_keys, how="left")
 
     return df_w_lags
+
+
+"""
+    vectorised version of add_lags: the lag matrix for all lag_cols is built in one pass from
+    strided views (no merges, no copies per lag) into a preallocated float32 array, optionally
+    with rolling mean/std columns over the given window sizes
+"""
+
+
+def build_lag_matrix(values, N, windows=()):
+    # values is (n_rows, n_cols); returns the float32 matrix and its column suffixes
+    values = np.asarray(values, dtype=np.float32)
+    if values.ndim == 1:
+        values = values[:, None]
+    n_rows, n_cols = values.shape
+
+    suffixes = [f"lag_{shift}" for shift in range(1, N + 1)]
+    for w in windows:
+        suffixes += [f"roll_mean_{w}", f"roll_std_{w}"]
+    out = np.full((n_rows, n_cols * len(suffixes)), np.nan, dtype=np.float32)
+
+    padded = np.concatenate([np.full((N, n_cols), np.nan, dtype=np.float32), values])
+    for c in range(n_cols):
+        # row i of the view is values[i - N : i], so reversed it holds lag 1 ... lag N
+        lags = sliding_window_view(padded[:, c], N)[:n_rows, ::-1]
+        out[:, c : N * n_cols : n_cols] = lags
+
+        for j, w in enumerate(windows):
+            if w > n_rows:
+                continue
+            rolling = sliding_window_view(values[:, c], w)
+            col = (N + 2 * j) * n_cols + c
+            out[w - 1 :, col] = rolling.mean(axis=1)
+            out[w - 1 :, col + n_cols] = rolling.std(axis=1, ddof=1)
+
+    return out, suffixes
+
+
+def add_lags_vectorised(df, N, lag_cols, windows=()):
+    # same columns as add_lags (order_day, then <col>_lag_<shift> ordered by shift), plus
+    # <col>_roll_mean_<w> / <col>_roll_std_<w> for each window
+    df_w_lags = df.reset_index(drop=True)
+    df_w_lags["order_day"] = np.arange(len(df_w_lags))
+
+    matrix, suffixes = build_lag_matrix(df_w_lags[lag_cols].to_numpy(), N, windows)
+    names = [f"{col}_{suffix}" for suffix in suffixes for col in lag_cols]
+    df_lags = pd.DataFrame(matrix, columns=names, index=df_w_lags.index)
+
+    return pd.concat([df_w_lags, df_lags], axis=1)
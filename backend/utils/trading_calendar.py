@@ -0,0 +1,73 @@
+from datetime import date
+from functools import lru_cache
+
+import holidays
+import numpy as np
+import pandas as pd
+
+# the asx closes on the national public holidays (as observed in nsw, so e.g. king's birthday is
+# the nsw one), but trades through nsw-only holidays such as bank holiday and labour day
+ASX_OPEN_ON = ("Bank Holiday", "Labour Day")
+# closures that aren't public holidays in the holidays package, add them here as announced
+ASX_EXTRA_CLOSURES = []
+
+FIRST_YEAR = 2000
+LAST_YEAR = date.today().year + 10
+
+# asx trading hours (sydney time), announcements after the close affect the next session
+ASX_CLOSE_HOUR = 16
+
+
+def _to_day(dates):
+    return np.asarray(dates, dtype="datetime64[D]")
+
+
+# trading days are mon - fri minus the holidays, every operation is a numpy busday_* call
+# on a precomputed busdaycalendar, so it is vectorised over arrays of dates
+class TradingCalendar:
+    def __init__(self, closures):
+        self.holidays = np.unique(np.array(closures, dtype="datetime64[D]"))
+        self.busdaycal = np.busdaycalendar(weekmask="1111100", holidays=self.holidays)
+
+    # function to check whether the dates are trading days
+    def is_trading_day(self, dates):
+        return np.is_busday(_to_day(dates), busdaycal=self.busdaycal)
+
+    # function to move the dates n trading days forward (or back if n < 0), a non trading
+    # day first rolls back to the previous trading day, so +1 is always the next one after
+    def add_trading_days(self, dates, n):
+        return np.busday_offset(
+            _to_day(dates), n, roll="backward", busdaycal=self.busdaycal
+        )
+
+    # function to list the n trading days after from_date, as datetime.date
+    def next_trading_days(self, from_date, n: int) -> list:
+        days = self.add_trading_days(from_date, np.arange(1, n + 1))
+        return days.astype(object).tolist()
+
+    # function to count the trading days in [start, end)
+    def trading_days_between(self, start, end):
+        return np.busday_count(_to_day(start), _to_day(end), busdaycal=self.busdaycal)
+
+    # function to map announcement timestamps to the trading day whose session they
+    # first affect: the same day if released before the close on a trading day, else the next
+    def session_date(self, timestamps, close_hour: int = ASX_CLOSE_HOUR):
+        timestamps = pd.DatetimeIndex(np.atleast_1d(timestamps))
+        days = _to_day(timestamps)
+        after_close = np.asarray(timestamps.hour >= close_hour)
+        days = np.where(after_close, days + np.timedelta64(1, "D"), days)
+        return np.busday_offset(days, 0, roll="forward", busdaycal=self.busdaycal)
+
+
+# function to get the asx calendar, built once per process
+@lru_cache(maxsize=None)
+def asx_calendar() -> TradingCalendar:
+    public_holidays = holidays.Australia(
+        years=range(FIRST_YEAR, LAST_YEAR + 1), subdiv="NSW"
+    )
+    closures = [
+        day
+        for day, name in public_holidays.items()
+        if not any(open_on in name for open_on in ASX_OPEN_ON)
+    ]
+    return TradingCalendar(closures + ASX_EXTRA_CLOSURES)